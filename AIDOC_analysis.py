@@ -6,9 +6,6 @@ import pathlib
 import shutil
 import uuid
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import confusion_matrix, accuracy_score
 from sqlmodel import Session
 
 from AIDOC_database import get_folder, get_session_internal
@@ -66,6 +63,11 @@ async def collect_ground_truth_and_predictions_async(session: Session):
     return y_true, y_pred, misclassified_files
 
 async def main():
+    # matplotlib/seaborn/sklearn ใช้แค่ตอนสรุปผล ไม่ต้องโหลดตอนถูก import จากที่อื่น
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from sklearn.metrics import confusion_matrix, accuracy_score
+
     # Collect labels (actual vs. predicted)
     session = get_session_internal()
     y_true, y_pred, misclassified_data = await collect_ground_truth_and_predictions_async(session)
@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from AIDOC_serving import file_lock
+from AIDOC_thumbnail import find_thumbnail
+from model.AIDOC_fileModel import File
+
+logger = logging.getLogger(__name__)
+
+# ไฟล์ PDF ทุกไฟล์เก็บครั้งเดียวตาม sha256: database/objects/ab/cdef...
+# ชื่อไฟล์/โฟลเดอร์เป็นแค่ข้อมูลในตาราง File จึงย้ายโฟลเดอร์หรือจัดหมวดใหม่ได้โดยไม่ต้องแตะไฟล์
+OBJECTS_DIR = "database/objects"
+LEGACY_STORAGE_DIR = "database/storage"
+# hash ที่ object/แถวใน File อาจไม่ตรงกัน (เพิ่งเก็บ object หรือกำลังลบแถว) ให้ AIDOC_recovery ตรวจเฉพาะตัวที่เปลี่ยน
+DIRTY_LOG_PATH = "database/objects.dirty"
+# เก็บ/dedup object กับตรวจการอ้างอิงแล้วลบ ต้องไม่เกิดพร้อมกัน (ข้าม process)
+OBJECTS_LOCK_PATH = "database/.objects.lock"
+# object ที่เพิ่งถูกเก็บหรือ dedup ภายในเวลานี้ (วินาที) อาจมีแถวใน File ที่ยังไม่ commit อ้างถึง release จะไม่ลบ
+PENDING_GRACE = int(os.environ.get("AIDOC_PENDING_GRACE", 300))
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(content_hash: str) -> str:
+    return os.path.join(OBJECTS_DIR, content_hash[:2], content_hash[2:])
+
+
+def mark_dirty(*content_hashes: str):
+    """บันทึก hash ลง journal ก่อนทำขั้นตอนที่ถ้าพังกลางทางจะเหลือ object ที่ไม่มีใครอ้างถึง (append ไม่ต้อง lock)"""
+    if not content_hashes:
+        return
+    os.makedirs(os.path.dirname(DIRTY_LOG_PATH), exist_ok=True)
+    with open(DIRTY_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write("".join(f"{content_hash}\n" for content_hash in content_hashes if content_hash))
+
+
+def take_dirty() -> set:
+    """อ่าน hash ใน journal แล้วล้าง journal (rename ก่อนอ่าน hash ที่เขียนเพิ่มระหว่างนั้นจะไปอยู่ใน journal ใหม่)"""
+    processing = f"{DIRTY_LOG_PATH}.{uuid.uuid4().hex}"
+    try:
+        os.replace(DIRTY_LOG_PATH, processing)
+    except FileNotFoundError:
+        return set()
+    with open(processing, encoding="utf-8") as f:
+        content_hashes = {line.strip() for line in f if line.strip()}
+    os.remove(processing)
+    return content_hashes
+
+
+def put_file(source_path: str, content_hash: str = None, move: bool = True, link: bool = False) -> str:
+    """
+    เก็บไฟล์เข้า object store แล้วคืน sha256
+    move=True ใช้ os.replace (atomic, ไม่ copy ข้อมูลซ้ำ) ส่วน move=False จะ copy (ต้นฉบับไม่ถูกแตะ)
+    link=True (คู่กับ move=False) hardlink ถ้าทำได้: ใช้กับไฟล์ storage แบบเดิมที่แอปเป็นเจ้าของและจะลบทิ้งหลัง commit
+    เท่านั้น ไฟล์จากนอกแอป (เช่น archive ของ import-archive) ห้าม link เพราะแก้ไฟล์ต้นฉบับแล้ว object จะเปลี่ยนตาม
+    ถ้ามี object เดิมอยู่แล้ว (อัปโหลดไฟล์ซ้ำ) ไม่ต้องเขียนใหม่
+    mtime ของ object ถูกตั้งเป็นเวลาปัจจุบันเสมอ (รวมถึงตอน dedup หรือ hardlink ไฟล์ storage เก่า)
+    reconciler/release จึงไม่ลบ object ที่งานซึ่งยังไม่ commit กำลังจะอ้างถึง
+    """
+    content_hash = content_hash or hash_file(source_path)
+    target = object_path(content_hash)
+    mark_dirty(content_hash)  # ถ้า process ตายก่อน commit แถวใน File จะเหลือ object ที่ไม่มีใครอ้างถึง
+
+    with file_lock(OBJECTS_LOCK_PATH):
+        if os.path.exists(target):
+            logger.debug(f"Object {content_hash} already stored, deduplicated {source_path}")
+            os.utime(target)
+            if move:
+                os.remove(source_path)
+            return content_hash
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if move:
+            os.replace(source_path, target)
+            os.utime(target)
+            return content_hash
+
+        # เขียนลงไฟล์ชั่วคราวในโฟลเดอร์เดียวกันก่อนแล้วค่อย rename เพื่อไม่ให้มี object ที่เขียนไม่ครบ
+        staging = f"{target}.{uuid.uuid4().hex}.tmp"
+        if link:
+            try:
+                os.link(source_path, staging)
+            except OSError:
+                shutil.copyfile(source_path, staging)
+        else:
+            shutil.copyfile(source_path, staging)
+        os.replace(staging, target)
+        os.utime(target)
+        return content_hash
+
+
+def reference_count(content_hash: str, session: Session) -> int:
+    statement = select(func.count()).select_from(File).where(File.content_hash == content_hash)
+    return session.exec(statement).one()
+
+
+def release(content_hash: str, session: Session, grace: float = PENDING_GRACE) -> bool:
+    """
+    ลบ object (และ thumbnail) เมื่อไม่มีแถวใน File อ้างถึงแล้ว เรียกหลัง commit การลบแถว (และ mark_dirty แล้ว)
+    ตรวจการอ้างอิงและ mtime ใหม่ภายใต้ lock เดียวกับ put_file ถ้าเพิ่งถูกเก็บ/dedup ภายใน grace วินาทีจะไม่ลบ
+    (คืน False) ให้ reconciler ตรวจใหม่ทีหลัง
+    """
+    path = object_path(content_hash)
+    with file_lock(OBJECTS_LOCK_PATH):
+        if reference_count(content_hash, session) > 0:
+            return False
+        try:
+            if time.time() - os.path.getmtime(path) < grace:
+                return False
+        except FileNotFoundError:
+            pass
+        for path in (path, find_thumbnail(content_hash)):
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.error(f"Could not remove {path}: {e}")
+    logger.debug(f"Released object {content_hash}")
+    return True
+
+
+def resolve_file_path(file_obj: File, folder_name: str) -> Optional[str]:
+    """Object path for content-addressed files, legacy storage/<folder>/<name> path for older rows."""
+    if file_obj.content_hash:
+        path = object_path(file_obj.content_hash)
+        if os.path.exists(path):
+            return path
+    legacy_path = os.path.join(LEGACY_STORAGE_DIR, folder_name, file_obj.name)
+    if os.path.exists(legacy_path):
+        return legacy_path
+    return None
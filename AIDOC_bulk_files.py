@@ -0,0 +1,198 @@
+import logging
+import os
+from typing import Callable
+
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+
+from AIDOC_blob_store import LEGACY_STORAGE_DIR, mark_dirty, put_file, release
+from AIDOC_database import bump_cache_version, get_session_internal
+from AIDOC_knn import relabel_documents, remove_document
+from AIDOC_recovery import remove_journal, write_journal
+from AIDOC_upload_status import upload_status
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+from model.AIDOC_minhashModel import DocumentSignature, LSHBucket
+from model.AIDOC_pageTextModel import PageText
+
+logger = logging.getLogger(__name__)
+
+# จำนวน id ต่อ IN (...) หนึ่งครั้ง ไม่ให้เกินจำนวนตัวแปรที่ SQLite รับได้ และเป็นหน่วยของการรายงานความคืบหน้า
+BULK_CHUNK_SIZE = int(os.environ.get("AIDOC_BULK_CHUNK_SIZE", 500))
+
+ACTION_DELETE = "delete"
+ACTION_MOVE = "move"
+
+
+def _chunks(items: list):
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        yield items[start:start + BULK_CHUNK_SIZE]
+
+
+def _report(job_id: str, step: str, done: int, total: int):
+    if job_id:
+        upload_status.update(job_id, {
+            "current_step": step,
+            "done": done,
+            "total": total,
+            "progress": int(done / total * 100) if total else 100
+        })
+
+
+def _load_files(file_ids: list, session: Session) -> list:
+    """[(File, ชื่อโฟลเดอร์)] ของไฟล์ที่ยังมีอยู่ เรียงตาม id"""
+    rows = []
+    for chunk in _chunks(file_ids):
+        statement = (select(File, Folder.name).join(Folder, File.folder_id == Folder.id, isouter=True)
+                     .where(File.id.in_(chunk)))
+        rows.extend(session.exec(statement).all())
+    return sorted(rows, key=lambda row: row[0].id)
+
+
+def _remove_files(paths: list):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # ลบไปแล้วก่อน process ตาย
+        except OSError as e:
+            logger.error(f"Could not remove {path}: {e}")
+
+
+def _apply_delete(journal: dict, session: Session, job_id: str = None):
+    """ลบแถวทั้งหมดใน transaction เดียว แล้วลบไฟล์/object ที่ไม่มีใครอ้างถึง (ทำซ้ำได้)"""
+    file_ids = journal["file_ids"]
+    mark_dirty(*journal["hashes"])  # ถ้าตายก่อน release ตัว reconciler จะลบ object ที่ไม่มีใครอ้างถึงให้
+    for chunk in _chunks(file_ids):
+        session.execute(delete(PageText).where(PageText.file_id.in_(chunk)))
+        session.execute(delete(LSHBucket).where(LSHBucket.file_id.in_(chunk)))
+        session.execute(delete(DocumentSignature).where(DocumentSignature.file_id.in_(chunk)))
+        session.execute(update(File).where(File.duplicate_of.in_(chunk)).values(duplicate_of=None))
+        session.execute(delete(File).where(File.id.in_(chunk)))
+    bump_cache_version(session, "folders", "files")
+    session.commit()
+
+    _remove_files(journal["legacy_paths"])
+    hashes = journal["hashes"]
+    for done, content_hash in enumerate(hashes, 1):
+        release(content_hash, session)
+        if done % BULK_CHUNK_SIZE == 0:
+            _report(job_id, "Removing files", done, len(hashes))
+    remove_document(*file_ids)
+
+
+def _apply_move(journal: dict, session: Session, job_id: str = None):
+    """ย้ายแถวทั้งหมดใน transaction เดียว แล้วลบไฟล์ storage เดิมที่ย้ายเข้า object store แล้ว (ทำซ้ำได้)"""
+    file_ids = journal["file_ids"]
+    for chunk in _chunks(file_ids):
+        session.execute(update(File).where(File.id.in_(chunk)).values(folder_id=journal["folder_id"]))
+    for file_id, content_hash in journal["migrated"].items():
+        session.execute(update(File).where(File.id == int(file_id), File.content_hash.is_(None))
+                        .values(content_hash=content_hash))
+    bump_cache_version(session, "folders", "files")
+    session.commit()
+
+    _remove_files(journal["legacy_paths"])
+    relabel_documents(journal["folder_name"], file_ids)
+
+
+APPLY = {ACTION_DELETE: _apply_delete, ACTION_MOVE: _apply_move}
+
+
+def roll_forward(journal: dict):
+    """ทำงานใน journal ที่ค้างจาก process ที่ตายต่อจนจบ (ส่งให้ reconciler)"""
+    session = get_session_internal()
+    try:
+        APPLY[journal["action"]](journal, session)
+    finally:
+        session.close()
+    logger.warning(f"Rolled forward bulk {journal['action']} {journal['job_id']} of {len(journal['file_ids'])} files")
+
+
+def _plan_delete(rows: list, session: Session, job_id: str) -> dict:
+    legacy_paths = [os.path.join(LEGACY_STORAGE_DIR, folder_name, file_obj.name)
+                    for file_obj, folder_name in rows if not file_obj.content_hash and folder_name]
+    return {
+        "file_ids": [file_obj.id for file_obj, _ in rows],
+        "hashes": sorted({file_obj.content_hash for file_obj, _ in rows if file_obj.content_hash}),
+        "legacy_paths": [path for path in legacy_paths if os.path.exists(path)]
+    }
+
+
+def _plan_move(rows: list, session: Session, job_id: str, folder_id: int) -> dict:
+    """
+    ไฟล์แบบเดิมที่อยู่ใน storage/<folder>/<name> ถูก hardlink เข้า object store ก่อน commit
+    (ชื่อไฟล์ในโฟลเดอร์ปลายทางจึงชนกันไม่ได้) แล้วค่อยลบไฟล์เดิมหลัง commit
+    """
+    folder = session.get(Folder, folder_id)
+    rows = [(file_obj, folder_name) for file_obj, folder_name in rows if file_obj.folder_id != folder_id]
+    migrated = {}
+    legacy_paths = []
+    for done, (file_obj, folder_name) in enumerate(rows, 1):
+        legacy_path = os.path.join(LEGACY_STORAGE_DIR, folder_name, file_obj.name) if folder_name else None
+        if not file_obj.content_hash and legacy_path and os.path.exists(legacy_path):
+            migrated[str(file_obj.id)] = put_file(legacy_path, move=False, link=True)
+            legacy_paths.append(legacy_path)
+        if done % BULK_CHUNK_SIZE == 0:
+            _report(job_id, "Preparing files", done, len(rows))
+    return {
+        "file_ids": [file_obj.id for file_obj, _ in rows],
+        "folder_id": folder_id,
+        "folder_name": folder.name,
+        "migrated": migrated,
+        "legacy_paths": legacy_paths
+    }
+
+
+def _run(job_id: str, action: str, file_ids: list, plan: Callable[..., dict], **target):
+    """
+    วางแผน -> เขียน journal -> แก้ DB ใน transaction เดียว -> แก้ดิสก์ -> ลบ journal
+    ถ้า process ตายหลังเขียน journal ตัว reconciler จะเรียก roll_forward ทำต่อจนจบ
+    """
+    session = get_session_internal()
+    upload_status[job_id] = {
+        "status": "Processing",
+        "file_name": "",
+        "current_step": "Loading files",
+        "progress": 0
+    }
+    try:
+        file_ids = sorted(set(file_ids))
+        rows = _load_files(file_ids, session)
+        found = {file_obj.id for file_obj, _ in rows}
+        journal = {"action": action, **plan(rows, session, job_id, **target)}
+
+        _report(job_id, "Updating database", 0, len(journal["file_ids"]))
+        write_journal(job_id, **journal)
+        APPLY[action](journal, session, job_id)
+        remove_journal(job_id)
+
+        upload_status.update(job_id, {
+            "status": "Completed",
+            "current_step": "Process complete",
+            "progress": 100,
+            "done": len(journal["file_ids"]),
+            "total": len(journal["file_ids"]),
+            "missing": [file_id for file_id in file_ids if file_id not in found],
+            "unchanged": len(found) - len(journal["file_ids"])  # ไฟล์ที่อยู่ในโฟลเดอร์ปลายทางอยู่แล้ว
+        })
+        logger.info(f"Bulk {action} {job_id}: {len(journal['file_ids'])} of {len(file_ids)} files")
+    except Exception as e:
+        logger.error(f"Error in bulk {action} {job_id}: {e}")
+        upload_status.update(job_id, {
+            "status": "Failed",
+            "error": str(e),
+            "current_step": "Error occurred"
+        })
+    finally:
+        session.close()
+
+
+def bulk_delete(job_id: str, file_ids: list):
+    """ลบไฟล์ตาม id ทั้งหมดในครั้งเดียว รายงานความคืบหน้าผ่าน upload_status[job_id]"""
+    _run(job_id, ACTION_DELETE, file_ids, _plan_delete)
+
+
+def bulk_move(job_id: str, file_ids: list, folder_id: int):
+    """ย้ายไฟล์ตาม id ทั้งหมดไปโฟลเดอร์ folder_id ในครั้งเดียว รายงานความคืบหน้าผ่าน upload_status[job_id]"""
+    _run(job_id, ACTION_MOVE, file_ids, _plan_move, folder_id=folder_id)
@@ -3,24 +3,73 @@ import os
 from typing import Annotated
 
 from fastapi import Depends
+from sqlalchemy import event, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import create_engine, Session, SQLModel, select
 from typing_extensions import Generator
 
+from model.AIDOC_cacheVersionModel import CacheVersion
 from model.AIDOC_fileModel import File
 from model.AIDOC_folderModel import Folder
+from model.AIDOC_minhashModel import DocumentSignature, LSHBucket
+from model.AIDOC_pageTextModel import PageText
+from model.AIDOC_scanStatisticModel import ScanStatistic
+from model.AIDOC_statisticCounterModel import StatisticCounter
 
 sqlite_file_name = "database.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-connect_args = {"check_same_thread": False}
+connect_args = {"check_same_thread": False, "timeout": 30}
 engine = create_engine(sqlite_url, connect_args=connect_args)
 
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL ให้หลาย uvicorn worker อ่านได้ระหว่างที่อีก worker เขียน, busy_timeout ให้รอ lock แทนการ error ทันที
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    migrate_columns()
+
+def migrate_columns():
+    """
+    create_all ไม่เพิ่มคอลัมน์ใหม่ให้ตารางที่มีอยู่แล้ว จึงเพิ่มคอลัมน์/index ที่ขาดด้วย ALTER TABLE
+    (คอลัมน์ใหม่ต้องเป็น Optional เพราะแถวเดิมจะได้ค่า NULL)
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(engine.dialect)
+                    connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+                    logger.info(f"Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+def bump_cache_version(session: Session, *names: str):
+    """
+    เพิ่มเลข version ของ response cache ใน transaction เดียวกับการแก้ข้อมูล
+    เก็บใน DB เพื่อให้ทุก uvicorn worker เห็นเลขเดียวกัน (ไม่ commit เอง ให้ผู้เรียก commit)
+    """
+    for name in names:
+        statement = sqlite_insert(CacheVersion).values(name=name, version=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=[CacheVersion.name],
+            set_={"version": CacheVersion.version + 1}
+        )
+        session.execute(statement)
 
 def get_session_internal() -> Session:
     return Session(bind=engine)
@@ -37,6 +86,7 @@ def create_folder(folder_name: str, session: Session):
     os.makedirs(f'database/storage/{folder_name}', exist_ok=True)
     folder = Folder(name=folder_name)
     session.add(folder)
+    bump_cache_version(session, "folders", "files")
     session.commit()
     session.refresh(folder)
 
@@ -53,15 +103,36 @@ def get_folder(session: Session):
     logger.debug("LIST OF FOLDER: %s", folder_list)
     return folder_list
 
-def update_file_data(folder_name: str, file_name: str, accuracy:int, session: Session):
+def update_file_data(folder_name: str, file_name: str, accuracy:int, session: Session, content_hash: str = None,
+                     duplicate_of: int = None):
     statement = select(Folder).where(Folder.name == folder_name)
     result = session.exec(statement)
     folder_obj = result.first()
     folder_id = folder_obj.id
-    file = File(name=file_name, folder_id=folder_id, accuracy = accuracy)
+    file = File(name=file_name, folder_id=folder_id, accuracy = accuracy, content_hash = content_hash,
+                duplicate_of = duplicate_of)
     session.add(file)
+    bump_cache_version(session, "folders", "files")
     session.commit()
     session.refresh(file)
+    return file
+
+def add_files(rows: list, session: Session) -> list:
+    """
+    เพิ่มหลายไฟล์ใน transaction ของผู้เรียก (ไม่ commit เอง) สำหรับ DB writer ที่เขียนผลสแกนทีละ batch
+    rows = [(folder_name, file_name, accuracy, content_hash, duplicate_of)]
+    หา folder id ด้วย query เดียวต่อ batch แทน select(Folder) ทุกไฟล์ และ flush ครั้งเดียวเพื่อให้ได้ id
+    """
+    folder_ids = {name: folder_id for name, folder_id in session.exec(select(Folder.name, Folder.id))}
+    files = []
+    for folder_name, file_name, accuracy, content_hash, duplicate_of in rows:
+        if folder_name not in folder_ids:
+            raise ValueError(f"Folder {folder_name} does not exist")
+        files.append(File(name=file_name, folder_id=folder_ids[folder_name], accuracy=accuracy,
+                          content_hash=content_hash, duplicate_of=duplicate_of))
+    session.add_all(files)
+    session.flush()
+    return files
 
 def update_accuracy(session: Session):
     statement = select(Folder)
@@ -90,5 +161,20 @@ def update_accuracy(session: Session):
                     total_accuracy)
                 folder.total_accuracy =  accuracy_value # Compute the average accuracy for the folder
 
-            session.commit()  # Save changes
-    return accuracy_value
\ No newline at end of file
+    session.commit()  # Save changes (commit ครั้งเดียวทุกโฟลเดอร์)
+    return accuracy_value
+
+def add_page_texts(file_id: int, page_texts: dict, session: Session):
+    """เหมือน save_page_texts แต่ไม่ commit เอง (ให้เขียนพร้อมแถวอื่นใน transaction เดียว)"""
+    for page, text in sorted(page_texts.items()):
+        session.add(PageText(file_id=file_id, page=page, text=text))
+
+def save_page_texts(file_id: int, page_texts: dict, session: Session):
+    """เก็บข้อความ OCR รายหน้าไว้ใช้ค้นหา (ตาราง FTS อัปเดตผ่าน trigger)"""
+    add_page_texts(file_id, page_texts, session)
+    session.commit()
+
+def delete_page_texts(file_id: int, session: Session):
+    statement = select(PageText).where(PageText.file_id == file_id)
+    for page_text in session.exec(statement):
+        session.delete(page_text)
@@ -0,0 +1,118 @@
+import logging
+import os
+from email.utils import formatdate, parsedate_to_datetime
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+# ไฟล์ใน storage อาจถูกอัปโหลดทับชื่อเดิมได้ จึงให้ browser ถามกลับทุกครั้ง (ได้ 304 ถ้าไม่เปลี่ยน)
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+
+def stat_etag(file_path: str, stat_result: os.stat_result = None) -> str:
+    """
+    ETag จากขนาด + mtime (แบบเดียวกับ nginx) ไม่ต้องอ่านไฟล์
+    ไฟล์ใน object store ให้ผู้เรียกส่ง content_hash ของแถวใน File มาแทน (ตรงกับเนื้อหาอยู่แล้ว)
+    """
+    stat_result = stat_result or os.stat(file_path)
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def etag_matches(header_value: str, etag: str) -> bool:
+    if header_value.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any((tag[2:] if tag.startswith("W/") else tag) == bare for tag in candidates)
+
+
+def _not_modified_since(header_value: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header_value).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def parse_range(range_header: str, file_size: int):
+    """
+    แปลง `Range: bytes=...` เป็น (start, end) แบบรวมปลาย
+    คืน None ถ้าควรส่งทั้งไฟล์ (หลายช่วง/รูปแบบแปลก) และ raise ValueError ถ้าช่วงอยู่นอกไฟล์
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    start_text, _, end_text = ranges.strip().partition("-")
+    if not (start_text.isdigit() or start_text == "") or not (end_text.isdigit() or end_text == ""):
+        return None
+    if start_text == "":
+        # bytes=-500 = 500 ไบต์สุดท้าย
+        if not end_text or int(end_text) == 0:
+            raise ValueError("Empty suffix range")
+        return max(file_size - int(end_text), 0), file_size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, file_size - 1)
+
+
+async def iter_file_range(file_path: str, start: int, length: int):
+    async with aiofiles.open(file_path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, file_path: str, media_type: str, headers: dict = None,
+                  etag: str = None, cache_control: str = DEFAULT_CACHE_CONTROL) -> Response:
+    """
+    ส่งไฟล์พร้อม ETag/Last-Modified/Cache-Control
+    รองรับ If-None-Match / If-Modified-Since (304) และ Range / If-Range (206, 416)
+    """
+    stat_result = os.stat(file_path)
+    file_size = stat_result.st_size
+    etag = etag or stat_etag(file_path, stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+    response_headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        **(headers or {}),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=response_headers)
+    elif _not_modified_since(request.headers.get("if-modified-since"), stat_result.st_mtime):
+        return Response(status_code=304, headers=response_headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag or if_range == last_modified):
+        try:
+            byte_range = parse_range(range_header, file_size)
+        except ValueError:
+            return Response(status_code=416, headers={**response_headers, "Content-Range": f"bytes */{file_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            response_headers.update({
+                "Content-Range": f"bytes {start}-{end}/{file_size}",
+                "Content-Length": str(length),
+            })
+            return StreamingResponse(iter_file_range(file_path, start, length), status_code=206,
+                                     media_type=media_type, headers=response_headers)
+
+    return FileResponse(file_path, media_type=media_type, headers=response_headers, stat_result=stat_result)
@@ -1,59 +1,51 @@
 import ast
-import csv
+import asyncio
+import hashlib
 import logging
-import os
 import pathlib
-import platform
 import shutil
 import time
 import traceback
 import re
-from datetime import datetime
+from dataclasses import dataclass
+from typing import Optional
 
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_bytes
-from sqlmodel import Session
+from sqlmodel import select
 
-from AIDOC_database import update_file_data
-from AIDOC_geminiAPI import generate_response
+from AIDOC_blob_store import put_file
+from AIDOC_database import add_files, add_page_texts, bump_cache_version, get_session_internal
+from AIDOC_geminiAPI import generate_response, generate_response_async
 from AIDOC_keyword_list import text_fix
+from AIDOC_knn import KNN_MODE, few_shot_examples, index_labeled_document, knn_classify
+from AIDOC_near_duplicate import NearDuplicate, add_document_index, find_near_duplicate
+from AIDOC_ocr_backend import image_to_string
+from AIDOC_ocr_cache import OCR_CACHE_ENABLED, ocr_cache
+from AIDOC_ocr_profiles import OCRProfile, get_ocr_profile, preprocess_image
+from AIDOC_page_planner import FALLBACK_PAGE_RANGE, POPPLER_PATH, contiguous_ranges, plan_pages
+from AIDOC_pipeline import ScanPipeline
+from AIDOC_recovery import write_job_manifest
+from AIDOC_scheduler import PRIORITY_BULK, current_priority, llm_stage, ocr_stage, scan_scheduler
+from AIDOC_serving import scan_tracker
+from AIDOC_statistics import record_scan
+from AIDOC_text_budget import budget_text
+from AIDOC_thumbnail import create_thumbnail, store_thumbnail
 from AIDOC_upload_status import upload_status
-
-if platform.system() == "Windows":
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-else:
-    pytesseract.pytesseract_cmd = "/usr/bin/tesseract"
-
+from model.AIDOC_folderModel import Folder
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def log_statistics(pdf_filename: str, found_keywords: dict, accuracy):
+KEYWORDS = ["บทคัดย่อ", "abstract", "overview", *text_fix]
+CLASSIFY_RETRIES = 5
+
+def log_statistics(pdf_filename: str, found_keywords: dict, accuracy, label: str = None, folders: list = None):
     """
-    บันทึกสถิติลงไฟล์ CSV โดย found_keywords ควรเป็น dict ที่เก็บข้อมูลว่า
+    บันทึกสถิติการสแกน โดย found_keywords ควรเป็น dict ที่เก็บข้อมูลว่า
     'keyword' : [list ของ page ที่พบคีย์เวิร์ด]
     เช่น { "abstract": [1, 2], "overview": [3], ... }
+    แถวจะถูกเขียนลงตาราง ScanStatistic ทีละ batch โดย thread เดียว (ไม่ต้องรอ DB ระหว่างสแกน)
     """
-    # สร้างไฟล์ /database/statistics.csv ไว้เก็บสถิติ (ถ้าไม่มีจะสร้างให้)
-    with open("database/statistics.csv", "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        # รวมจำนวนคีย์เวิร์ดที่เจอทั้งหมด (นับเป็น +1 ต่อ keyword)
-        total_found = len(found_keywords)
-
-        # แปลง dict ของ keywords-pageList ให้เป็น string เพื่อเขียนง่าย
-        # หรืออาจกำหนดฟอร์แมตตามต้องการ เช่น JSON ก็ได้
-        keyword_detail = str(found_keywords)
-
-        # บันทึกเป็น 5 คอลัมน์: [วัน-เวลา, ชื่อไฟล์, พบกี่คีย์เวิร์ด, รายละเอียด keyword, ...]
-        # จะเพิ่มคอลัมน์ตามต้องการก็ได้
-        writer.writerow([
-            datetime.now().isoformat(),  # วัน-เวลา
-            pdf_filename,                # ชื่อไฟล์
-            total_found,                 # จำนวน keyword ที่เจอ
-            keyword_detail,               # รายละเอียดหน้า
-            accuracy
-        ])
+    record_scan(pdf_filename, found_keywords, accuracy, label=label, folders=folders)
 
 def clean_text(text: str) -> str:
     """Remove all whitespace characters while preserving Thai text structure."""
@@ -67,41 +59,48 @@ def clean_text(text: str) -> str:
     logger.debug(f"Characters removed: {original_length - final_length}")
 
     return cleaned
-def pdf2image_converter(files, task_id, page_range=None):
+def pdf2image_converter(files, task_id, page_range=None, profile: OCRProfile = None):
+    from pdf2image import convert_from_bytes  # โหลดเฉพาะตอนสแกน ไม่ให้ API process เริ่มช้า
+
+    profile = profile or get_ocr_profile()
     pathlib.Path(f"database/temp").mkdir(parents=True, exist_ok=True)
-    if platform.system() == "Windows":
-        poppler_path = r"C:\Program Files\poppler-24.08.0\Library\bin"
-    elif platform.system() == "Linux":
-        poppler_path = "/usr/bin"  # Poppler is installed system-wide on Linux
 
-    images = convert_from_bytes(files, poppler_path=poppler_path, fmt="png",
+    images = convert_from_bytes(files, poppler_path=POPPLER_PATH, fmt="png",
+                                dpi=profile.dpi, grayscale=profile.grayscale,
                                 output_folder=f"database/temp/{task_id}", output_file="page",
                                 first_page=page_range[0] if page_range else None,
                                 last_page=page_range[1] if page_range else None)
-    logger.debug(f"Converted PDF to {len(images)} images for pages {page_range}")
+    logger.debug(f"Converted PDF to {len(images)} images for pages {page_range} "
+                 f"(profile: {profile.name}, dpi: {profile.dpi})")
     return images
 
-def extract_text_from_pdf_pages(pdf_file, task_id):
+def extract_text_from_pdf_pages(pdf_file, task_id, pages=None):
     """
-    OCR แบบแยกหน้าคืนมาเป็น list โดยแต่ละ element คือข้อความของหน้านั้น
+    OCR แบบแยกหน้าคืนมาเป็น dict {เลขหน้า: ข้อความของหน้านั้น}
+    pages = list ของเลขหน้าที่ต้องการ (ถ้าไม่ส่งมาใช้ช่วงหน้าเดิม 1-7)
     """
-    page_range = [1,7]
+    if pages is None:
+        pages = list(range(FALLBACK_PAGE_RANGE[0], FALLBACK_PAGE_RANGE[1] + 1))
     try:
-        logger.debug(f"Processing PDF for OCR (task: {task_id}, pages {page_range})")
-        images = pdf2image_converter(pdf_file, task_id, page_range=page_range)
-        page_texts = []
-
-        for i, image in enumerate(images):
-            logger.debug(f"Processing image {i+1} of {len(images)}")
-            text = ocr_image(image.filename)
-            # ไม่ต้อง clean_text รวบทีเดียวก็ได้ หรือจะ clean ก็ได้
-            page_texts.append(text)
+        logger.debug(f"Processing PDF for OCR (task: {task_id}, pages {pages})")
+        page_texts = {}
+
+        for first_page, last_page in contiguous_ranges(pages):
+            with ocr_stage.slot():  # render + OCR ใช้ CPU จำกัดจำนวนงานพร้อมกัน
+                images = pdf2image_converter(pdf_file, task_id, page_range=(first_page, last_page))
+                for page_number, image in enumerate(images, start=first_page):
+                    logger.debug(f"Processing page {page_number} ({first_page}-{last_page})")
+                    if page_number == 1:
+                        create_thumbnail(image.filename, task_id)  # ใช้หน้าแรกที่ render แล้วทำ thumbnail
+                    text = ocr_image(image.filename)
+                    # ไม่ต้อง clean_text รวบทีเดียวก็ได้ หรือจะ clean ก็ได้
+                    page_texts[page_number] = text
 
         return page_texts
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         logger.error(traceback.format_exc())
-        return []
+        return {}
 
 def search_keywords_in_pdfs(pdf_texts: dict, keywords: list[str]):
     matched_pdfs = {}
@@ -113,56 +112,114 @@ def search_keywords_in_pdfs(pdf_texts: dict, keywords: list[str]):
     return matched_pdfs
 
 
-def process_pdfs_with_keyword(pdf_files: dict, task_id, keywords: list[str]):
+def find_keyword_pages(page_texts: dict, keywords: list[str], found_pages_for_keyword: dict):
+    for page_number, text in sorted(page_texts.items()):
+        for kw in keywords:
+            if kw.lower() in text.lower():
+                if kw not in found_pages_for_keyword:
+                    found_pages_for_keyword[kw] = []
+                found_pages_for_keyword[kw].append(page_number)
+    return found_pages_for_keyword
+
+
+def process_pdfs_with_keyword(pdf_files: dict, task_id, keywords: list[str], detect_duplicates: bool = False,
+                              pdf_path: str = None):
     extracted_texts = {}
     keyword_statistics = {}
     found_pages_for_keyword = {}
+    duplicate = None
 
     for filename, pdf_content in pdf_files.items():
         logger.debug(f"Extracting text (split by pages) from {filename}")
-        page_texts = extract_text_from_pdf_pages(pdf_content, task_id)
-
-        for page_index, text in enumerate(page_texts, start=1):
-            for kw in keywords:
-                if kw.lower() in text.lower():
-                    if kw not in found_pages_for_keyword:
-                        found_pages_for_keyword[kw] = []
-                    found_pages_for_keyword[kw].append(page_index)
+        plan = plan_pages(pdf_content, task_id, pdf_path)
+        page_texts = extract_text_from_pdf_pages(pdf_content, task_id, plan.initial)
+        find_keyword_pages(page_texts, keywords, found_pages_for_keyword)
+
+        # เทียบหน้าแรก ๆ กับเอกสารเดิม ถ้าเป็นฉบับแก้ของไฟล์ที่มีอยู่แล้วก็ไม่ต้อง OCR หน้าเพิ่ม
+        if detect_duplicates:
+            duplicate = find_near_duplicate(page_texts)
+
+        # ขยายหน้าต่างทีละชุดเฉพาะตอนที่ยังหา keyword ไม่เจอ
+        for extension in plan.extensions:
+            if found_pages_for_keyword or duplicate:
+                break
+            logger.debug(f"No keyword in pages {sorted(page_texts)}, extending to {extension}")
+            extra_texts = extract_text_from_pdf_pages(pdf_content, task_id, extension)
+            page_texts.update(extra_texts)
+            find_keyword_pages(extra_texts, keywords, found_pages_for_keyword)
 
         keyword_statistics[filename] = found_pages_for_keyword
 
         selected_pages = sorted(set([p for pages in found_pages_for_keyword.values() for p in pages]))
 
         if selected_pages:
-            text_for_gemini = "\n".join(page_texts[p - 1] for p in selected_pages)
+            text_for_gemini = "\n".join(page_texts[p] for p in selected_pages)
             logger.debug(f"Selecting pages {selected_pages} for Gemini")
         else:
-            text_for_gemini = "\n".join(page_texts)
+            text_for_gemini = "\n".join(page_texts[p] for p in sorted(page_texts))
             logger.debug("No keywords found, sending full document to Gemini")
 
+        logger.debug(f"OCRed {len(page_texts)} pages of {plan.page_count} for {filename}")
         extracted_texts[filename] = text_for_gemini
 
     for filename, text in extracted_texts.items():
-        return text, [filename, found_pages_for_keyword]
+        return text, [filename, found_pages_for_keyword], page_texts, duplicate
 
     return None
 
 
-def ocr_image(images_name):
+def ocr_image(images_name, profile: OCRProfile = None, use_cache: bool = OCR_CACHE_ENABLED):
+    """OCR รูปหนึ่งหน้า หน้าที่เคย OCR แล้ว (รูปหลัง preprocess เหมือนกันทุก pixel) ใช้ผลจาก ocr_cache"""
+    from PIL import Image
+
+    profile = profile or get_ocr_profile()
     path = f"{images_name}"
     im = Image.open(path)
-    im_gray = im.convert('L')
-    im_gray.save(f"{images_name}_gray.png")
-    result = pytesseract.image_to_string(f"{images_name}_gray.png", lang='eng+tha', config='--oem 1  --psm 4')
+    im_gray = preprocess_image(im, profile)
+    cache_key = ocr_cache.key(im_gray, profile.name) if use_cache else None
+    cached = ocr_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        logger.debug(f"OCR cache hit for {path} ({len(cached)} characters)")
+        return cached
+    result = image_to_string(im_gray)
     cleaned_result = clean_text(result)
+    if cache_key:
+        ocr_cache.put(cache_key, cleaned_result)
     logger.debug(f"OCR result length: {len(cleaned_result)} characters")
     logger.debug(f"OCR text preview: {cleaned_result[:200]}...")
     return cleaned_result
 
-def core_result_processing(pdf_file, task_id, folder_list: list, filename: str):
-    """Handles text extraction, AI classification, and returns all required data."""
-    keywords = ["บทคัดย่อ", "abstract", "overview", *text_fix]
-    page_range = (1, 7)
+def inherited_result(duplicate: NearDuplicate, folder_list: list):
+    """(label, accuracy) จากไฟล์เดิมที่เกือบเหมือนกัน หรือ None ถ้าใช้ไม่ได้ (เช่น โฟลเดอร์ถูกเปลี่ยนชื่อ)"""
+    if duplicate.folder_name not in folder_list:
+        return None
+    try:
+        accuracy = ast.literal_eval(duplicate.accuracy) if duplicate.accuracy else None
+    except (SyntaxError, ValueError):
+        accuracy = None
+    if not isinstance(accuracy, list) or len(accuracy) != len(folder_list):
+        # รายชื่อโฟลเดอร์เปลี่ยนไปจากตอนนั้น ให้คะแนนเต็มกับโฟลเดอร์เดิม
+        accuracy = [100 if name == duplicate.folder_name else 0 for name in folder_list]
+    return duplicate.folder_name, accuracy
+
+@dataclass
+class ExtractedDocument:
+    full_text: str                 # ข้อความที่จะส่งจัดหมวด (ตัดตาม token budget แล้ว)
+    found_keywords: list           # [filename, {keyword: [หน้าที่พบ]}]
+    page_texts: dict
+    duplicate: Optional[NearDuplicate] = None
+    inherited: Optional[tuple] = None  # (label, accuracy) ของไฟล์เดิมที่เกือบเหมือนกัน
+
+
+def extract_document(pdf_file, task_id, folder_list: list, filename: str,
+                     detect_duplicates: bool = False, pdf_path: str = None) -> ExtractedDocument:
+    """
+    ส่วน OCR ของการสแกน (ใช้ CPU): render + OCR + หาเอกสารเดิมที่เกือบเหมือนกัน ยังไม่เรียก AI
+    detect_duplicates=True: เอกสารที่เกือบเหมือนไฟล์เดิมได้ผลจัดหมวดของไฟล์นั้นใน inherited
+    pdf_path: ไฟล์ PDF เดียวกันบนดิสก์ (ให้ page planner อ่านโดยไม่ต้องเขียนสำเนาใหม่)
+    """
+    keywords = KEYWORDS
+    page_range = FALLBACK_PAGE_RANGE
 
     logger.debug(f"Extracting text from PDF (task: {task_id}, filename: {filename})")
 
@@ -170,59 +227,150 @@ def core_result_processing(pdf_file, task_id, folder_list: list, filename: str):
         raise Exception("PDF file is empty")
 
     pdf_files = {filename: pdf_file}
-    matched_text, found_keywords = process_pdfs_with_keyword(pdf_files, task_id, keywords)
+    matched_text, found_keywords, page_texts, duplicate = process_pdfs_with_keyword(
+        pdf_files, task_id, keywords, detect_duplicates, pdf_path)
+    inherited = inherited_result(duplicate, folder_list) if duplicate else None
+    if inherited:
+        logger.debug(f"{filename} is a near duplicate of file {duplicate.file_id} "
+                     f"(similarity {duplicate.similarity:.2f}), skipping AI classification")
+        return ExtractedDocument(matched_text, found_keywords, page_texts, duplicate, inherited)
 
     if not matched_text:
         logger.debug("Keyword not found. Using fallback OCR processing.")
-        images = pdf2image_converter(pdf_file, task_id, page_range=page_range)
-
         full_text = ""
-        for i, image in enumerate(images):
-            logger.debug(f"Fallback OCR on image {i + 1}/{len(images)}")
-            text = ocr_image(image.filename)
-            full_text += text + "\n"
+        page_texts = {}
+        with ocr_stage.slot():
+            images = pdf2image_converter(pdf_file, task_id, page_range=page_range)
+            for i, image in enumerate(images):
+                logger.debug(f"Fallback OCR on image {i + 1}/{len(images)}")
+                text = ocr_image(image.filename)
+                page_texts[page_range[0] + i] = text
+                full_text += text + "\n"
     else:
         full_text = matched_text
 
     if not full_text.strip():
         raise Exception("OCR returned empty text. AI processing skipped.")
 
+    full_text = budget_text(full_text, keywords) or full_text
+
     logger.debug("=== Text being sent to Gemini AI ===")
     logger.debug(f"Text length: {len(full_text)} characters")
     logger.debug(f"First 500 characters:\n{full_text[:500]}")
     logger.debug(f"FolderList: {folder_list}")
     logger.debug("===============================")
+    return ExtractedDocument(full_text, found_keywords, page_texts)
 
-    max_retries = 5
-    retry_count = 0
+def core_result_processing(pdf_file, task_id, folder_list: list, filename: str, detect_duplicates: bool = False):
+    """
+    Handles text extraction, AI classification, and returns all required data.
+    detect_duplicates=True: เอกสารที่เกือบเหมือนไฟล์เดิมใช้ผลจัดหมวดของไฟล์นั้นแทนการเรียก AI
+    """
+    document = extract_document(pdf_file, task_id, folder_list, filename, detect_duplicates)
+    if document.inherited:
+        return (document.inherited[0], document.inherited[1], document.full_text, document.found_keywords,
+                document.page_texts, document.duplicate)
 
-    while retry_count < max_retries:
-        result = generate_response(full_text, folder_list)
-        logger.debug(f"MR.Result is here: {result}")
-        split_result = result.split(",", 1)
+    gemini_label, accuracy = classify_text(document.full_text, folder_list)
+    return gemini_label, accuracy, document.full_text, document.found_keywords, document.page_texts, None  # ✅ Return all useful data
 
-        if len(split_result) == 2:
-            gemini_label = split_result[0].strip()
-            try:
-                accuracy = ast.literal_eval(split_result[1].strip())
-                return gemini_label, accuracy, full_text, found_keywords  # ✅ Return all useful data
-            except (SyntaxError, ValueError):
-                pass  # Retry if parsing fails
+def prepare_classification(full_text: str, folder_list: list, use_knn: bool = True):
+    """
+    คืน (ผลจาก k-NN ที่มั่นใจพอจะไม่ต้องเรียก AI หรือ None, ตัวอย่าง few-shot ที่ใกล้เอกสารนี้ที่สุด)
+    use_knn=False สำหรับเอกสารที่อยู่ใน index แล้ว (เช่น reclassify) เพื่อนบ้านที่ใกล้ที่สุดคือตัวมันเอง
+    ซึ่งจะโหวตให้โฟลเดอร์เดิมเสมอ
+    """
+    if KNN_MODE == "off" or not use_knn:
+        return None, None
+    try:
+        knn_result = knn_classify(full_text, folder_list)
+        if KNN_MODE == "on" and knn_result and knn_result.confident:
+            logger.debug(f"k-NN label {knn_result.label} (margin {knn_result.margin:.2f}), skipping the LLM")
+            return (knn_result.label, knn_result.accuracy), None
+        return None, few_shot_examples(full_text)
+    except Exception as e:
+        logger.warning(f"k-NN classification failed, asking the LLM only: {e}")
+        return None, None
+
+def parse_response(result: str):
+    """แยก 'label, [80, 15, 5]' เป็น (label, accuracy) หรือ None ถ้ารูปแบบไม่ถูก"""
+    logger.debug(f"MR.Result is here: {result}")
+    split_result = result.split(",", 1)
+    if len(split_result) == 2:
+        try:
+            return split_result[0].strip(), ast.literal_eval(split_result[1].strip())
+        except (SyntaxError, ValueError):
+            pass
+    return None
 
-        retry_count += 1
-        time.sleep(1)
+def classify_text(full_text: str, folder_list: list, use_knn: bool = True):
+    """
+    Ask the LLM for (label, [accuracy per folder]); retries while the answer can't be parsed.
+    ถ้าเอกสารที่จัดหมวดแล้วซึ่งใกล้ที่สุด (k-NN) โหวตไปทางเดียวกันชัดเจน ใช้ผลนั้นเลยไม่ต้องเรียก AI
+    ไม่งั้นส่ง AI พร้อมตัวอย่างที่ใกล้กับเอกสารนี้ที่สุดแทนตัวอย่างชุดตายตัว (use_knn=False ถาม AI อย่างเดียว)
+    """
+    shortcut, examples = prepare_classification(full_text, folder_list, use_knn)
+    if shortcut:
+        return shortcut
+
+    for _ in range(CLASSIFY_RETRIES):
+        with llm_stage.slot():
+            result = generate_response(full_text, folder_list, examples)
+        parsed = parse_response(result)
+        if parsed:
+            return parsed
+        time.sleep(1)  # Retry if parsing fails
 
     raise ValueError("AI response format is incorrect after multiple retries")
 
+async def classify_text_async(full_text: str, folder_list: list, use_knn: bool = True, priority: str = None):
+    """
+    classify_text สำหรับ LLM stage ของ pipeline (รอ AI โดยไม่ถือ thread)
+    ใช้ llm_stage ร่วมกับ classify_text: จำนวนการเรียก AI พร้อมกันทั้ง process ไม่เกิน LLM_CONCURRENCY
+    """
+    shortcut, examples = await asyncio.to_thread(prepare_classification, full_text, folder_list, use_knn)
+    if shortcut:
+        return shortcut
+
+    for _ in range(CLASSIFY_RETRIES):
+        async with llm_stage.async_slot(priority or PRIORITY_BULK):
+            result = await generate_response_async(full_text, folder_list, examples)
+        parsed = parse_response(result)
+        if parsed:
+            return parsed
+        await asyncio.sleep(1)
+
+    raise ValueError("AI response format is incorrect after multiple retries")
+
+def text_from_pages(page_texts: dict, keywords: list[str] = None) -> str:
+    """
+    สร้างข้อความที่จะส่งให้ AI จากข้อความ OCR รายหน้าที่เก็บไว้ (ไม่ต้อง OCR ใหม่)
+    เลือกเฉพาะหน้าที่พบ keyword เหมือนตอนสแกน แล้วตัดให้อยู่ใน token budget
+    """
+    keywords = keywords or KEYWORDS
+    found_pages_for_keyword = find_keyword_pages(page_texts, keywords, {})
+    selected_pages = sorted(set([p for pages in found_pages_for_keyword.values() for p in pages])) or sorted(page_texts)
+    full_text = "\n".join(page_texts[p] for p in selected_pages)
+    return budget_text(full_text, keywords) or full_text
+
 def return_result(pdf_file, task_id, folder_list: list, filename: str):
     """Keeps original return format (label, accuracy as string)."""
+    gemini_label, accuracy, _, _ = return_result_with_pages(pdf_file, task_id, folder_list, filename)
+    return gemini_label, accuracy
+
+def return_result_with_pages(pdf_file, task_id, folder_list: list, filename: str, detect_duplicates: bool = False):
+    """
+    Returns (label, accuracy as string, {page: OCR text}, NearDuplicate or None)
+    so the scan can index the pages and link revisions to the original file.
+    """
     try:
-        gemini_label, accuracy, _, found_keywords = core_result_processing(pdf_file, task_id, folder_list, filename)
+        gemini_label, accuracy, _, found_keywords, page_texts, duplicate = core_result_processing(
+            pdf_file, task_id, folder_list, filename, detect_duplicates)
 
         # ✅ Log statistics using extracted keywords
-        log_statistics(filename, found_keywords, accuracy)
+        log_statistics(filename, found_keywords, accuracy, label=gemini_label, folders=folder_list)
 
-        return gemini_label, str(accuracy)
+        return gemini_label, str(accuracy), page_texts, duplicate
     except Exception as e:
         logger.error(f"Error processing PDF file: {e}")
         logger.error(traceback.format_exc())
@@ -231,10 +379,10 @@ def return_result(pdf_file, task_id, folder_list: list, filename: str):
 def return_result_with_text(pdf_file, task_id, folder_list: list, filename: str):
     """Returns (label, [accuracy], full_text) for AI tuning."""
     try:
-        gemini_label, accuracy, full_text, found_keywords = core_result_processing(pdf_file, task_id, folder_list, filename)
+        gemini_label, accuracy, full_text, found_keywords, _, _ = core_result_processing(pdf_file, task_id, folder_list, filename)
 
         # ✅ Log statistics using extracted keywords
-        log_statistics(filename, found_keywords, accuracy)
+        log_statistics(filename, found_keywords, accuracy, label=gemini_label, folders=folder_list)
 
         return gemini_label, accuracy, full_text  # ✅ Returns full text for AI tuning
     except Exception as e:
@@ -243,77 +391,211 @@ def return_result_with_text(pdf_file, task_id, folder_list: list, filename: str)
         raise Exception("Failed to process PDF file")
 
 
-def launch_scan(pdf_content: bytes, filename: str, task_id: str, folder_list: list, session: Session):
+@dataclass
+class ScanWork:
+    """งานสแกน 1 ไฟล์ที่ส่งต่อระหว่าง stage ของ scan_pipeline"""
+    task_id: str
+    filename: str
+    folder_names: list
+    content_hash: str
+    document: ExtractedDocument
+    priority: str
+    label: Optional[str] = None
+    accuracy: Optional[list] = None
+    stored: bool = False  # ย้ายไฟล์เข้า object store แล้ว
+    source_path: Optional[str] = None  # ไฟล์ต้นฉบับนอก temp (import-archive) เก็บเข้า object store โดยไม่ย้ายต้นฉบับ
+
+
+def submit_scan(pdf_content: bytes, filename: str, task_id: str, folder_list: list, uploader: str = "anonymous",
+                priority: str = PRIORITY_BULK, source_path: str = None, recoverable: bool = True, **status):
+    """
+    ส่งไฟล์ที่อยู่ใน database/temp/{task_id}/{filename} แล้ว (หรือไฟล์ที่ source_path) เข้าคิวสแกน
+    บันทึก job manifest ไว้ด้วย ถ้า server ตายก่อนงานเสร็จ AIDOC_recovery จะส่งงานนี้เข้าคิวใหม่
+    recoverable=False: ผู้ส่งงานจัดการงานที่ค้างเอง (import-archive --resume) reconciler จะไม่ส่งงานนี้เข้าคิวใหม่
+    """
+    pathlib.Path(f"database/temp/{task_id}").mkdir(parents=True, exist_ok=True)  # ที่เก็บภาพหน้าที่ render
+    write_job_manifest(task_id, filename, uploader=uploader, priority=priority, source_path=source_path,
+                       recoverable=recoverable)
     upload_status[task_id] = {
         "status": "Processing",
         "file_name": filename,
-        "current_step": "Starting scan",
-        "progress": 0
+        "current_step": "Queued",
+        "priority": priority,
+        **status
     }
-    try:
-        logger.debug("Starting scan process")
-        upload_status[task_id].update({
-            "current_step": "Extracting text",
-            "progress": 25
-        })
-
-        folder_names = [folder.name for folder in folder_list]
-
-        text_result, accuracy = return_result(pdf_content, task_id, folder_names, filename)
-        logger.debug(f"Scan completed. Result: {text_result}")
-        upload_status[task_id].update({
-            "current_step": "Organizing files",
-            "progress": 75
-        })
-
-        organizing_files(text_result, filename, task_id, accuracy, session)
+    scan_scheduler.submit(task_id, launch_scan, pdf_content, filename, task_id, folder_list, source_path,
+                          uploader=uploader, priority=priority)
 
-        upload_status[task_id].update({
-            "status": "Completed",
-            "current_step": "Process complete",
-            "progress": 100
-        })
-        logger.debug(f"Task {task_id} completed successfully")
+def requeue_scan(manifest: dict) -> bool:
+    """ส่งงานที่ค้างจาก worker ที่ตายไปแล้วเข้าคิวอีกครั้ง (task_id เดิม ติดตามสถานะต่อได้)"""
+    task_id, filename = manifest["task_id"], manifest["file_name"]
+    source_path = manifest.get("source_path")
+    try:
+        with open(source_path or f"database/temp/{task_id}/{filename}", "rb") as f:
+            pdf_content = f.read()
+        session = get_session_internal()
+        try:
+            folder_list = session.exec(select(Folder).order_by(Folder.id)).all()
+        finally:
+            session.close()
     except Exception as e:
-        logger.error(f"Error in launch_scan: {e}")
-
-        upload_status[task_id].update({
-            "status": "Failed",
-            "error": str(e),
-            "current_step": "Error occurred"
+        logger.error(f"Could not requeue interrupted scan {task_id}: {e}")
+        return False
+    logger.info(f"Requeued interrupted scan {task_id} ({filename})")
+    submit_scan(pdf_content, filename, task_id, folder_list, uploader=manifest.get("uploader", "anonymous"),
+                priority=manifest.get("priority", PRIORITY_BULK), source_path=source_path, recovered=True)
+    return True
+
+def launch_scan(pdf_content: bytes, filename: str, task_id: str, folder_list: list, source_path: str = None):
+    """
+    OCR stage ของงานสแกน (รันใน scan worker ของ scheduler) แล้วส่งต่อให้ scan_pipeline
+    จัดหมวดด้วย AI และบันทึกลง DB ทำใน stage ถัดไป worker จึงไป OCR ไฟล์ถัดไปได้เลย
+    """
+    # ลงทะเบียนงานไว้ ตอนปิด server จะรอให้งานนี้เสร็จก่อน (graceful drain)
+    with scan_tracker.track(task_id):
+        # update ไม่ใช่ตั้งใหม่: เก็บฟิลด์ที่ submit_scan ใส่ไว้ (priority, files_remaining, recovered)
+        upload_status.update(task_id, {
+            "status": "Processing",
+            "file_name": filename,
+            "current_step": "Starting scan",
+            "progress": 0
         })
-    finally:
+        work = None
         try:
-            shutil.rmtree(f"database/temp/{task_id}", ignore_errors=True)
-        except Exception as cleanup_error:
-            logger.error(f"Error during cleanup: {cleanup_error}")
+            logger.debug("Starting scan process")
+            upload_status.update(task_id, {
+                "current_step": "Extracting text",
+                "progress": 25
+            })
 
+            folder_names = [folder.name for folder in folder_list]
 
-def organizing_files(folder_name: str, filename: str, task_id: str, accuracy, session: Session):
+            try:
+                document = extract_document(pdf_content, task_id, folder_names, filename, detect_duplicates=True,
+                                            pdf_path=source_path or f"database/temp/{task_id}/{filename}")
+            except Exception as e:
+                logger.error(f"Error processing PDF file: {e}")
+                logger.error(traceback.format_exc())
+                raise Exception("Failed to process PDF file")
+
+            work = ScanWork(task_id, filename, folder_names, hashlib.sha256(pdf_content).hexdigest(),
+                            document, current_priority(), source_path=source_path)
+            upload_status.update(task_id, {
+                "current_step": "Classifying",
+                "progress": 50,
+                "duplicate_of": document.duplicate.file_id if document.duplicate else None
+            })
+            scan_pipeline.submit(work)
+        except Exception as e:
+            logger.error(f"Error in launch_scan: {e}")
+            fail_scan(work or task_id, e)
+
+async def classify_scan(work: ScanWork):
+    """LLM stage"""
+    document = work.document
+    if document.inherited:
+        work.label, work.accuracy = document.inherited
+    else:
+        try:
+            work.label, work.accuracy = await classify_text_async(document.full_text, work.folder_names,
+                                                                  priority=work.priority)
+        except Exception as e:
+            logger.error(f"Error processing PDF file: {e}")
+            raise Exception("Failed to process PDF file")
+    # ✅ Log statistics using extracted keywords
+    log_statistics(work.filename, document.found_keywords, work.accuracy, label=work.label, folders=work.folder_names)
+    logger.debug(f"Scan completed. Result: {work.label}")
+
+def store_scans(works: list):
     """
-    Organize files and update their location in the database.
+    DB stage: ย้ายไฟล์ของทั้ง batch เข้า storage แล้วเพิ่มแถวทั้งหมดใน transaction เดียว (commit ครั้งเดียว)
+    status เป็น Completed หลัง commit สำเร็จเท่านั้น
     """
-    try:
-        # Update status for database update
-        upload_status[task_id].update({
+    for work in works:
+        organizing_files(work)
+
+    for work in works:
+        upload_status.update(work.task_id, {
             "current_step": "Updating database",
-            "progress": 85
+            "progress": 95
         })
+    session = get_session_internal()
+    try:
+        files = add_files([
+            (work.label, work.filename, str(work.accuracy), work.content_hash,
+             work.document.duplicate.file_id if work.document.duplicate else None)
+            for work in works
+        ], session)
+        for work, file in zip(works, files):
+            page_texts = work.document.page_texts
+            if page_texts:
+                add_page_texts(file.id, page_texts, session)      # เก็บข้อความไว้ให้ /search
+                add_document_index(file.id, page_texts, session)  # ให้ฉบับแก้ที่อัปโหลดทีหลังหาไฟล์นี้เจอ
+        bump_cache_version(session, "folders", "files")
+        session.commit()
+        file_ids = [file.id for file in files]
+    finally:
+        session.close()
+    logger.debug(f"Stored {len(works)} scans in one transaction")
 
-        update_file_data(folder_name, filename, accuracy, session)
+    # หลัง commit ห้ามโยน exception ออกไป: pipeline จะลองเขียน batch ใหม่ทีละงานแล้วได้แถวซ้ำ
+    for work, file_id in zip(works, file_ids):
+        if work.document.page_texts:
+            try:
+                index_labeled_document(file_id, work.label, text_from_pages(work.document.page_texts))  # ตัวอย่างให้ k-NN
+            except Exception as e:
+                logger.warning(f"Could not add {work.filename} to the k-NN index: {e}")
+        try:
+            upload_status.update(work.task_id, {
+                "status": "Completed",
+                "current_step": "Process complete",
+                "progress": 100,
+                "folder": work.label,
+                "file_id": file_id
+            })
+            logger.debug(f"Task {work.task_id} completed successfully")
+        except Exception as e:
+            logger.error(f"Task {work.task_id} was stored as file {file_id} but its status could not be updated: {e}")
+        cleanup_scan(work.task_id)
+
+def fail_scan(work, error: Exception):
+    task_id = work.task_id if isinstance(work, ScanWork) else work
+    upload_status.update(task_id, {
+        "status": "Failed",
+        "error": str(error),
+        "current_step": "Error occurred"
+    })
+    cleanup_scan(task_id)
+
+def cleanup_scan(task_id: str):
+    try:
+        shutil.rmtree(f"database/temp/{task_id}", ignore_errors=True)
+    except Exception as cleanup_error:
+        logger.error(f"Error during cleanup: {cleanup_error}")
 
-        # Update status for file copying
-        upload_status[task_id].update({
-            "current_step": "Copying file to storage",
-            "progress": 95
-        })
 
-        # Ensure the destination directory exists
-        os.makedirs(f"database/storage/{folder_name}", exist_ok=True)
+scan_pipeline = ScanPipeline(classify_scan, store_scans, fail_scan)
 
-        # Copy the file
-        shutil.copy(f"database/temp/{task_id}/{filename}", f"database/storage/{folder_name}")
 
+def organizing_files(work: ScanWork):
+    """
+    ย้ายไฟล์จาก temp เข้า object store (rename ไม่ต้อง copy) ก่อนเพิ่มแถวใน DB
+    ไฟล์เนื้อหาซ้ำกับที่มีอยู่แล้วจะไม่ถูกเก็บซ้ำ ทำซ้ำได้ (ตอน batch ล้มแล้วเขียนใหม่ทีละงาน)
+    """
+    if work.stored:
+        return
+    upload_status.update(work.task_id, {
+        "current_step": "Moving file to storage",
+        "progress": 85
+    })
+    try:
+        if work.source_path:
+            # ไฟล์จาก archive: copy เข้า object store ต้นฉบับอยู่ที่เดิมและไม่ถูกแตะ (ทั้งเนื้อหาและ mtime)
+            work.content_hash = put_file(work.source_path, work.content_hash, move=False)
+        else:
+            work.content_hash = put_file(f"database/temp/{work.task_id}/{work.filename}", work.content_hash)
+        store_thumbnail(work.task_id, work.content_hash)
+        work.stored = True
     except Exception as e:
         logger.error(f"Error in organizing_files: {e}")
-        raise  # Re-raise the exception to be caught by launch_scan
\ No newline at end of file
+        raise  # Re-raise the exception to be caught by the DB stage
@@ -0,0 +1,300 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from AIDOC_blob_store import resolve_file_path
+from AIDOC_file_delivery import DEFAULT_CACHE_CONTROL, etag_matches, iter_file_range, parse_range
+from model.AIDOC_folderModel import Folder
+
+logger = logging.getLogger(__name__)
+
+# ZIP แบบ stored (ไม่บีบอัด PDF ซ้ำ) สร้างระหว่างส่ง: ขนาดและตำแหน่งทุกไบต์รู้ก่อนอ่านไฟล์
+# จึงส่ง Content-Length และตอบ Range (ดาวน์โหลดต่อจากที่ค้าง) ได้โดยไม่ต้องสร้างไฟล์ ZIP ชั่วคราว
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# bit 3: CRC/ขนาดอยู่ใน data descriptor หลังข้อมูล (ส่ง header ได้ก่อนอ่านไฟล์), bit 11: ชื่อไฟล์เป็น UTF-8
+ZIP_FLAGS = 0x0808
+MANIFEST_FORMATS = ("csv", "json")
+MANIFEST_FIELDS = ["id", "name", "archive_name", "accuracy", "size", "content_hash", "duplicate_of"]
+CRC_CACHE_SIZE = 4096
+
+# (path, size, mtime_ns) -> crc32 ดาวน์โหลดต่อ (Range) ไม่ต้องอ่านไฟล์ก่อนหน้าซ้ำเพื่อหา CRC
+_crc_cache = OrderedDict()
+_crc_lock = threading.Lock()
+
+
+def _cache_key(path: str, size: int, mtime_ns: int) -> tuple:
+    return path, size, mtime_ns
+
+
+def _cached_crc(key: tuple) -> Optional[int]:
+    with _crc_lock:
+        crc = _crc_cache.get(key)
+        if crc is not None:
+            _crc_cache.move_to_end(key)
+        return crc
+
+
+def _remember_crc(key: tuple, crc: int):
+    with _crc_lock:
+        _crc_cache[key] = crc
+        while len(_crc_cache) > CRC_CACHE_SIZE:
+            _crc_cache.popitem(last=False)
+
+
+def file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _dos_datetime(timestamp: float) -> tuple:
+    t = time.localtime(max(timestamp, 315532800))  # ZIP เก็บเวลาได้ตั้งแต่ปี 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+@dataclass
+class ZipEntry:
+    name: bytes
+    size: int
+    dos_time: int
+    dos_date: int
+    offset: int = 0
+    path: Optional[str] = None    # ไฟล์บนดิสก์ หรือ None ถ้าเป็นข้อมูลใน memory (manifest)
+    data: bytes = b""
+    crc: Optional[int] = None
+    cache_key: Optional[tuple] = None
+
+    @property
+    def zip64(self) -> bool:
+        return self.size >= ZIP64_LIMIT
+
+    def local_header(self) -> bytes:
+        extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if self.zip64 else b""
+        size_field = ZIP64_LIMIT if self.zip64 else 0
+        return struct.pack("<IHHHHHIIIHH", 0x04034B50, 45 if self.zip64 else 20, ZIP_FLAGS, 0,
+                           self.dos_time, self.dos_date, 0, size_field, size_field,
+                           len(self.name), len(extra)) + self.name + extra
+
+    def descriptor(self) -> bytes:
+        if self.zip64:
+            return struct.pack("<IIQQ", 0x08074B50, self.crc or 0, self.size, self.size)
+        return struct.pack("<IIII", 0x08074B50, self.crc or 0, self.size, self.size)
+
+    def central_header(self) -> bytes:
+        values = []
+        size_field, offset_field = self.size, self.offset
+        if self.zip64:
+            values += [self.size, self.size]
+            size_field = ZIP64_LIMIT
+        if self.offset >= ZIP64_LIMIT:
+            values.append(self.offset)
+            offset_field = ZIP64_LIMIT
+        extra = struct.pack(f"<HH{len(values)}Q", 0x0001, 8 * len(values), *values) if values else b""
+        version = 45 if values else 20
+        return struct.pack("<IHHHHHHIIIHHHHHII", 0x02014B50, version, version, ZIP_FLAGS, 0,
+                           self.dos_time, self.dos_date, self.crc or 0, size_field, size_field,
+                           len(self.name), len(extra), 0, 0, 0, 0, offset_field) + self.name + extra
+
+
+def _end_records(count: int, directory_offset: int, directory_size: int) -> bytes:
+    records = b""
+    if count >= ZIP64_COUNT_LIMIT or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+        records += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count,
+                               directory_size, directory_offset)
+        records += struct.pack("<IIQI", 0x07064B50, 0, directory_offset + directory_size, 1)
+    return records + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, min(count, ZIP64_COUNT_LIMIT),
+                                 min(count, ZIP64_COUNT_LIMIT), min(directory_size, ZIP64_LIMIT),
+                                 min(directory_offset, ZIP64_LIMIT), 0)
+
+
+def _archive_name(name: str, used: set) -> str:
+    """ชื่อใน ZIP ต้องไม่ซ้ำและไม่มีตัวคั่น path (ไฟล์ชื่อซ้ำในโฟลเดอร์เดียวกันได้ชื่อ 'x (2).pdf')"""
+    name = name.replace("/", "_").replace("\\", "_") or "file.pdf"
+    stem, extension = os.path.splitext(name)
+    candidate, number = name, 1
+    while candidate.lower() in used:
+        number += 1
+        candidate = f"{stem} ({number}){extension}"
+    used.add(candidate.lower())
+    return candidate
+
+
+def _manifest(rows: list, manifest_format: str) -> bytes:
+    if manifest_format == "json":
+        return json.dumps(rows, ensure_ascii=False, indent=2).encode("utf-8")
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=MANIFEST_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8-sig")  # BOM ให้ Excel อ่านชื่อไทยถูก
+
+
+class FolderArchive:
+    """
+    แผนของ ZIP ทั้งไฟล์เป็นลำดับ segment (ความยาว, ชนิด, entry)
+        header / descriptor / central: bytes ที่สร้างจาก entry, file: เนื้อไฟล์บนดิสก์
+        data: เนื้อ entry ที่อยู่ใน memory (manifest), bytes: end of central directory
+    memory ที่ใช้ขึ้นกับจำนวนไฟล์ (metadata) ไม่ขึ้นกับขนาดไฟล์
+    """
+
+    def __init__(self, folder: Folder, files: list, manifest_format: str = None):
+        self.folder = folder
+        self.entries = []
+        self.segments = []
+        self.size = 0
+        self.missing = []
+        used = set()
+        rows = []
+        latest = 0  # เวลาของ manifest ต้องเหมือนกันทุก request ไม่งั้นดาวน์โหลดต่อแล้วไฟล์เสีย
+        fingerprint = hashlib.sha256(f"{folder.id}:{folder.name}:{manifest_format}".encode("utf-8"))
+
+        for file_obj in files:
+            path = resolve_file_path(file_obj, folder.name)
+            row = {"id": file_obj.id, "name": file_obj.name, "archive_name": None, "accuracy": file_obj.accuracy,
+                   "size": None, "content_hash": file_obj.content_hash, "duplicate_of": file_obj.duplicate_of}
+            rows.append(row)
+            try:
+                stat_result = os.stat(path) if path else None
+            except OSError:
+                stat_result = None
+            if stat_result is None:
+                self.missing.append(file_obj.id)
+                continue
+            row["archive_name"] = _archive_name(file_obj.name, used)
+            row["size"] = stat_result.st_size
+            latest = max(latest, stat_result.st_mtime)
+            key = _cache_key(path, stat_result.st_size, stat_result.st_mtime_ns)
+            self._add(ZipEntry(row["archive_name"].encode("utf-8"), stat_result.st_size,
+                               *_dos_datetime(stat_result.st_mtime), path=path, crc=_cached_crc(key), cache_key=key))
+            fingerprint.update(f"{file_obj.id}:{row['archive_name']}:{key}".encode("utf-8"))
+
+        if manifest_format:
+            data = _manifest(rows, manifest_format)
+            name = _archive_name(f"manifest.{manifest_format}", used)
+            self._add(ZipEntry(name.encode("utf-8"), len(data), *_dos_datetime(latest), data=data,
+                               crc=zlib.crc32(data)))
+            fingerprint.update(data)
+
+        directory_offset = self.size
+        for entry in self.entries:
+            self._append(entry, "central")
+        directory_size = self.size - directory_offset
+        self._append(_end_records(len(self.entries), directory_offset, directory_size), "bytes")
+        self.etag = f'"zip-{fingerprint.hexdigest()[:32]}"'
+
+    def _append(self, value, kind: str):
+        length = value.size if kind == "file" else len(self._render(value, kind))
+        self.segments.append((length, kind, value))
+        self.size += length
+
+    def _add(self, entry: ZipEntry):
+        entry.offset = self.size
+        self.entries.append(entry)
+        self._append(entry, "header")
+        self._append(entry, "data" if entry.path is None else "file")
+        self._append(entry, "descriptor")
+
+    @staticmethod
+    def _render(value, kind: str) -> bytes:
+        if kind == "header":
+            return value.local_header()
+        if kind == "descriptor":
+            return value.descriptor()
+        if kind == "central":
+            return value.central_header()
+        if kind == "data":
+            return value.data
+        return value  # bytes
+
+    async def _ensure_crc(self, entry: ZipEntry):
+        if entry.crc is None:
+            entry.crc = await asyncio.to_thread(file_crc32, entry.path)
+            _remember_crc(entry.cache_key, entry.crc)
+
+    async def stream(self, start: int = 0, end: int = None):
+        """ส่งไบต์ start..end (รวมปลาย) ของ ZIP"""
+        end = self.size - 1 if end is None else end
+        position = 0
+        for length, kind, value in self.segments:
+            segment_start, position = position, position + length
+            if position <= start or length == 0:
+                continue
+            if segment_start > end:
+                break
+            low = max(start, segment_start) - segment_start
+            high = min(end + 1, position) - segment_start
+
+            if kind == "file":
+                # อ่านไฟล์ตั้งแต่ต้นอยู่แล้ว คิด CRC ไปพร้อมกันไม่ต้องอ่านซ้ำตอนเขียน descriptor
+                crc = 0 if low == 0 and value.crc is None else None
+                async for chunk in iter_file_range(value.path, low, high - low):
+                    if crc is not None:
+                        crc = zlib.crc32(chunk, crc)
+                    yield chunk
+                if crc is not None and high == length:
+                    value.crc = crc
+                    _remember_crc(value.cache_key, crc)
+                continue
+
+            if kind in ("descriptor", "central") and value.path:
+                await self._ensure_crc(value)
+            yield self._render(value, kind)[low:high]
+
+
+def folder_zip_response(request: Request, folder: Folder, files: list, manifest_format: str = None) -> Response:
+    """
+    ZIP ของทุกไฟล์ในโฟลเดอร์ สร้างระหว่างส่ง พร้อม ETag
+    รองรับ If-None-Match (304) และ Range / If-Range (206, 416) สำหรับดาวน์โหลดต่อ
+    """
+    archive = FolderArchive(folder, files, manifest_format)
+    if archive.missing:
+        logger.warning(f"Export of folder {folder.name} skipped {len(archive.missing)} files missing on disk: "
+                       f"{archive.missing}")
+    archive_size = archive.size
+    headers = {
+        "ETag": archive.etag,
+        "Cache-Control": DEFAULT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{urllib.parse.quote(folder.name)}.zip"
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, archive.etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == archive.etag):
+        try:
+            byte_range = parse_range(range_header, archive_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{archive_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{archive_size}",
+                "Content-Length": str(end - start + 1)
+            })
+            return StreamingResponse(archive.stream(start, end), status_code=206, media_type="application/zip",
+                                     headers=headers)
+
+    headers["Content-Length"] = str(archive_size)
+    return StreamingResponse(archive.stream(), media_type="application/zip", headers=headers)
@@ -1,22 +1,44 @@
 import ast
+import functools
 
-import google.generativeai as genai
 
-genai.configure(api_key="{API_KEY}")
+@functools.lru_cache(maxsize=None)
+def _genai():
+    # SDK ของ Google (grpc/protobuf) import ช้ามาก จึงโหลดตอนเรียก AI ครั้งแรกแทนตอนเปิด server
+    import google.generativeai as genai
+    genai.configure(api_key="{API_KEY}")
+    return genai
+
+def examples_block(examples: list) -> str:
+    """ตัวอย่างที่จัดหมวดแล้ว [(input, output)] ในรูปแบบเดียวกับ few-shot ของ AIDOC_gemini_new"""
+    if not examples:
+        return ""
+    return "".join(f"input: {text}\noutput: {output}\n\n" for text, output in examples) + \
+        "Classify the next document in the same way.\n"
+
+def build_prompt(prompt: str, folder_list: list, examples: list = None) -> str:
+    return (examples_block(examples) +
+            "I want you to read following document.\n" + prompt +
+            "\n\n After reading the document, please decide which folder is the most" +
+            " relevant to the document and return the folder name only along with percentage you believe folder they are in" +
+            " eg: folder1,[80,15,5] | folder2,[3,80,17] | folder3,[20,10,70]\n" +
+            " percentage is between 0 to 100 and order of array for percentage is ordered by following folder list."+
+            " Please note if any folder name are little bit related should increase accuracy percentage to it too."+"\nFolder list: " + str(folder_list) +
+            " NOTE: if received message that not found respond as 'No pdf was found,"+
+            " \nNOTE2: please avoid unnecessary predication when context isn't enough"+
+            " \nIMPORTANT: format has to be. <foldername>,[percentageFolder1,percentageFolder2,percentageFolder3]>")
 
-def generate_response(prompt: str, folder_list: list) -> str:
-    ai_model = genai.GenerativeModel("gemini-2.0-flash-exp")
-    response = (ai_model.generate_content("I want you to read following document.\n" + prompt +
-                                      "\n\n After reading the document, please decide which folder is the most" +
-                                      " relevant to the document and return the folder name only along with percentage you believe folder they are in" +
-                                      " eg: folder1,[80,15,5] | folder2,[3,80,17] | folder3,[20,10,70]\n" +
-                                      " percentage is between 0 to 100 and order of array for percentage is ordered by following folder list."+
-                                      " Please note if any folder name are little bit related should increase accuracy percentage to it too."+"\nFolder list: " + str(folder_list) +
-                                      " NOTE: if received message that not found respond as 'No pdf was found,"+
-                                      " \nNOTE2: please avoid unnecessary predication when context isn't enough"+
-                                      " \nIMPORTANT: format has to be. <foldername>,[percentageFolder1,percentageFolder2,percentageFolder3]>"))
+def generate_response(prompt: str, folder_list: list, examples: list = None) -> str:
+    ai_model = _genai().GenerativeModel("gemini-2.0-flash-exp")
+    response = ai_model.generate_content(build_prompt(prompt, folder_list, examples))
+    return response.text
+
+async def generate_response_async(prompt: str, folder_list: list, examples: list = None) -> str:
+    """เหมือน generate_response แต่ไม่ block thread ระหว่างรอคำตอบ (ใช้ใน LLM stage ของ pipeline)"""
+    ai_model = _genai().GenerativeModel("gemini-2.0-flash-exp")
+    response = await ai_model.generate_content_async(build_prompt(prompt, folder_list, examples))
     return response.text
 
 if __name__ == "__main__":
-    genai.configure(api_key="{API_KEY}")
+    genai = _genai()
     model = genai.GenerativeModel("gemini-2.0-flash-exp")
@@ -0,0 +1,238 @@
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlmodel import select
+
+from AIDOC_blob_store import hash_file
+from AIDOC_database import get_session_internal
+from AIDOC_files_reciver import cleanup_scan, submit_scan
+from AIDOC_recovery import read_job_manifest, worker_lease
+from AIDOC_scheduler import PRIORITY_BULK, ocr_stage, scan_scheduler
+from AIDOC_serving import run_startup_tasks, scan_tracker
+from AIDOC_statistics import statistics_writer
+from AIDOC_upload_status import upload_status
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG = "import_archive.jsonl"
+PROGRESS_INTERVAL = 30  # วินาที
+UPLOADER = "import-archive"
+
+
+def find_pdfs(root: str) -> list:
+    """PDF ทุกไฟล์ใต้ root (เรียงตาม path เพื่อให้ลำดับเหมือนเดิมทุกครั้งที่ resume)"""
+    paths = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        paths.extend(os.path.join(directory, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+    return paths
+
+
+def read_log(path: str) -> dict:
+    """{path: บันทึกล่าสุดของไฟล์นั้น (event "file" หรือ "submitted")} จาก log ของการ import ครั้งก่อน"""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # บรรทัดสุดท้ายที่เขียนไม่จบตอน process ตาย
+            if record.get("event") in ("file", "submitted"):
+                records[record["path"]] = record
+    return records
+
+
+def settle_interrupted(path: str, record: dict) -> dict:
+    """
+    ไฟล์ที่ส่งเข้าคิวแล้วแต่ process ก่อนหน้าตายก่อนเขียนผล งานอาจ commit ไปแล้ว ส่งใหม่เลยจะได้แถวซ้ำ
+    คืนผล (status "running" = ยังมี process อื่นทำอยู่, "completed" = อยู่ใน DB แล้ว) หรือ None ถ้าต้องส่งใหม่
+    งานเหล่านี้ reconciler ของ server ไม่ส่งเข้าคิวใหม่ (recoverable=False) --resume จึงเป็นเจ้าของคนเดียว
+    """
+    manifest = read_job_manifest(record["task_id"])
+    if manifest and worker_lease.is_alive(manifest.get("owner", "")):
+        return {"status": "running"}
+    session = get_session_internal()
+    try:
+        statement = select(File.id).where(File.content_hash == hash_file(path),
+                                          File.name == os.path.basename(path))
+        file_id = session.exec(statement).first()
+    finally:
+        session.close()
+    cleanup_scan(record["task_id"])  # ภาพหน้า/manifest ที่ค้างจากงานเดิม
+    if file_id is not None:
+        return {"status": "completed", "file_id": file_id}
+    return None
+
+
+class ImportLog:
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        record = {"time": datetime.now(timezone.utc).isoformat(), **record}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    def summary(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        done = self.completed + self.failed
+        rate = done / elapsed
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "elapsed_s": round(elapsed, 1),
+            "docs_per_min": round(rate * 60, 1),
+            "mb_per_s": round(self.bytes / elapsed / 1e6, 2),
+            "eta_s": round((self.total - done) / rate) if rate else None
+        }
+
+
+def import_archive(root: str, log_path: str = DEFAULT_LOG, resume: bool = False, dry_run: bool = False,
+                   workers: int = None, in_flight: int = None) -> dict:
+    """
+    สแกน PDF ทุกไฟล์ใต้ root ผ่าน scan pipeline เดียวกับ /sendPDF (ไม่ผ่าน HTTP และไม่ copy PDF ไปไว้ใน temp)
+    resume=True ข้ามไฟล์ที่ log บอกว่า import สำเร็จแล้ว ไฟล์ที่ล้มเหลวจะถูกลองใหม่
+    """
+    root = os.path.abspath(root)
+    paths = find_pdfs(root)
+    previous = read_log(log_path) if resume else {}
+    pending = [path for path in paths if previous.get(os.path.relpath(path, root), {}).get("status") != "completed"]
+    skipped = len(paths) - len(pending)
+
+    if dry_run:
+        return {
+            "dry_run": True,
+            "found": len(paths),
+            "skipped": skipped,
+            "to_import": len(pending),
+            "bytes": sum(os.path.getsize(path) for path in pending)
+        }
+
+    workers = workers or os.cpu_count() or 1
+    in_flight = in_flight or workers * 4  # จำกัดจำนวน PDF ที่อ่านเข้า memory ค้างในคิวพร้อมกัน
+    # ใช้ทุก core: ไม่ต้องเผื่อ worker ให้งาน interactive เพราะ process นี้มีแต่งาน import
+    scan_scheduler.configure(workers, interactive_reserved=0)
+    ocr_stage.set_limit(workers)
+
+    run_startup_tasks()
+    worker_lease.acquire()
+    session = get_session_internal()
+    try:
+        folder_list = session.exec(select(Folder).order_by(Folder.id)).all()
+    finally:
+        session.close()
+
+    log = ImportLog(log_path)
+    progress = Progress(len(pending))
+    running = {}  # task_id -> (relative path, size, started)
+    last_report = time.monotonic()
+
+    def collect(block_until: int):
+        """เขียน log ของงานที่จบแล้ว รอจนงานที่ยังไม่จบเหลือไม่เกิน block_until"""
+        nonlocal last_report
+        while True:
+            for task_id in list(running):
+                status = upload_status.get(task_id) or {}
+                if status.get("status") not in ("Completed", "Failed"):
+                    continue
+                relative_path, size, started = running.pop(task_id)
+                completed = status["status"] == "Completed"
+                if completed:
+                    progress.completed += 1
+                    progress.bytes += size
+                else:
+                    progress.failed += 1
+                log.write({
+                    "event": "file",
+                    "path": relative_path,
+                    "task_id": task_id,
+                    "status": "completed" if completed else "failed",
+                    "folder": status.get("folder"),
+                    "file_id": status.get("file_id"),
+                    "duplicate_of": status.get("duplicate_of"),
+                    "error": status.get("error"),
+                    "bytes": size,
+                    "seconds": round(time.monotonic() - started, 2)
+                })
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                print(json.dumps({"progress": progress.summary()}), flush=True)
+            if len(running) <= block_until:
+                return
+            time.sleep(0.2)
+
+    log.write({"event": "start", "root": root, "found": len(paths), "skipped": skipped, "workers": workers})
+    try:
+        for path in pending:
+            collect(in_flight - 1)
+            relative_path = os.path.relpath(path, root)
+            record = previous.get(relative_path, {})
+            if record.get("event") == "submitted":
+                settled = settle_interrupted(path, record)
+                if settled and settled["status"] == "running":
+                    progress.total -= 1
+                    continue
+                if settled:
+                    progress.completed += 1
+                    log.write({"event": "file", "path": relative_path, "task_id": record["task_id"],
+                               "recovered": True, **settled})
+                    continue
+            task_id = str(uuid.uuid4())
+            try:
+                with open(path, "rb") as f:
+                    pdf_content = f.read()
+            except OSError as e:
+                progress.failed += 1
+                log.write({"event": "file", "path": relative_path, "status": "failed", "error": str(e)})
+                continue
+            running[task_id] = (relative_path, len(pdf_content), time.monotonic())
+            log.write({"event": "submitted", "path": relative_path, "task_id": task_id})
+            submit_scan(pdf_content, os.path.basename(path), task_id, folder_list, uploader=UPLOADER,
+                        priority=PRIORITY_BULK, source_path=path, recoverable=False)
+        collect(0)
+    finally:
+        scan_tracker.wait_idle()
+        statistics_writer.close()
+        worker_lease.release()
+        summary = progress.summary()
+        log.write({"event": "summary", "skipped": skipped, **summary})
+        log.close()
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="import-archive",
+                                     description="Scan and file every PDF under a directory without going through HTTP")
+    parser.add_argument("directory")
+    parser.add_argument("--log", default=DEFAULT_LOG, help="JSONL log with one line per file (default: %(default)s)")
+    parser.add_argument("--resume", action="store_true", help="skip files the log already records as completed")
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be imported")
+    parser.add_argument("--workers", type=int, default=None, help="OCR workers (default: all cores)")
+    parser.add_argument("--in-flight", type=int, default=None, help="PDFs held in memory at once (default: 4 x workers)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # log ระดับ DEBUG ของการสแกนทุกหน้ามากเกินไปสำหรับงานหลายหมื่นไฟล์
+    result = import_archive(args.directory, args.log, args.resume, args.dry_run, args.workers, args.in_flight)
+    print(json.dumps(result, indent=4, ensure_ascii=False))
@@ -0,0 +1,412 @@
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+from sqlmodel import select
+
+from AIDOC_database import create_db_and_tables, get_session_internal
+from AIDOC_serving import file_lock
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+from model.AIDOC_pageTextModel import PageText
+
+logger = logging.getLogger(__name__)
+
+# "on" = ตอบเองเมื่อเพื่อนบ้านเห็นตรงกันชัดเจน ไม่งั้นส่ง AI (ไม่แนบตัวอย่าง เว้นแต่ตั้ง AIDOC_FEW_SHOT_EXAMPLES)
+# "fewshot" = ส่ง AI ทุกครั้งพร้อมตัวอย่างที่ใกล้ที่สุด, "off" = ไม่ใช้ index
+KNN_MODE = os.environ.get("AIDOC_KNN_MODE", "on").lower()
+KNN_DIR = os.environ.get("AIDOC_KNN_DIR", "database/knn")
+KNN_K = int(os.environ.get("AIDOC_KNN_K", 7))
+KNN_MIN_SIMILARITY = float(os.environ.get("AIDOC_KNN_MIN_SIMILARITY", 0.35))
+KNN_MARGIN = float(os.environ.get("AIDOC_KNN_MARGIN", 0.4))  # ส่วนต่างสัดส่วนโหวตอันดับ 1 กับ 2
+# ตัวอย่าง few-shot เพิ่ม token ทุกครั้งที่เรียก AI: ปิดไว้ในโหมด "on" (เปิดเองด้วย AIDOC_FEW_SHOT_EXAMPLES)
+# และตัดแต่ละตัวอย่างให้สั้น พอให้เห็นรูปแบบคำตอบ/หัวเรื่องของเอกสาร
+FEW_SHOT_EXAMPLES = int(os.environ.get("AIDOC_FEW_SHOT_EXAMPLES", 3 if KNN_MODE == "fewshot" else 0))
+FEW_SHOT_CHARS = int(os.environ.get("AIDOC_FEW_SHOT_CHARS", 400))
+
+VECTOR_DIM = 2048
+NGRAM = 3
+SEARCH_CHUNK = 8192  # แปลง float16 -> float32 ทีละก้อน ไม่ให้กิน memory ทั้ง index
+# ลบ/ย้ายโฟลเดอร์ทิ้งแถวเก่าไว้ในไฟล์: เขียน index ใหม่เมื่อแถวที่ไม่ใช้แล้วมีสัดส่วนถึง ratio (และอย่างน้อย min rows)
+KNN_COMPACT_RATIO = float(os.environ.get("AIDOC_KNN_COMPACT_RATIO", 0.25))
+KNN_COMPACT_MIN_ROWS = int(os.environ.get("AIDOC_KNN_COMPACT_MIN_ROWS", 1000))
+_GENERATION_FILE = re.compile(r"(?:rows|vectors)(?:\.(\d+))?\.(?:jsonl|f16)(?:\.tmp)?")
+
+
+def embed(text: str) -> np.ndarray:
+    """
+    เวกเตอร์ hashed character 3-gram (ไม่ต้องใช้ model, ใช้ CPU อย่างเดียว)
+    ข้อความ OCR ไทยไม่มีช่องว่างอยู่แล้ว จึงใช้ n-gram ตัวอักษรแทนคำ
+    """
+    text = "".join(text.split()).lower()
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    if len(text) < NGRAM:
+        return vector
+    grams = [text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)]
+    buckets = np.fromiter((zlib.crc32(gram.encode("utf-8")) % VECTOR_DIM for gram in grams),
+                          dtype=np.int64, count=len(grams))
+    vector = np.log1p(np.bincount(buckets, minlength=VECTOR_DIM).astype(np.float32))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@dataclass
+class Neighbor:
+    key: str
+    label: str
+    similarity: float
+    text: Optional[str] = None
+    output: Optional[str] = None
+
+
+class VectorIndex:
+    """
+    index เวกเตอร์แบบ append-only บนดิสก์
+        vectors.f16  เวกเตอร์ float16 ต่อกันทีละแถว (อ่านผ่าน numpy memmap)
+        rows.jsonl   ข้อมูลของแต่ละแถว {"key", "label", "text"?, "output"?} หรือ {"key", "deleted": true}
+    การเขียนทำใต้ file lock ส่วน worker อื่นอ่านเฉพาะบรรทัดที่เพิ่มมาใหม่ตอน search ครั้งถัดไป
+    compact() เขียนแถวที่ยังใช้อยู่เป็นรุ่นใหม่ (vectors.N.f16, rows.N.jsonl) แล้วลบรุ่นเก่า
+    worker อื่นเห็น rows.N.jsonl ของรุ่นถัดไปแล้วอ่านรุ่นใหม่ทั้งหมดเอง
+    """
+
+    def __init__(self, directory: str = KNN_DIR, compact_ratio: float = KNN_COMPACT_RATIO,
+                 compact_min_rows: int = KNN_COMPACT_MIN_ROWS):
+        self.directory = directory
+        self.lock_path = os.path.join(directory, ".lock")
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _paths(self, generation: int) -> tuple:
+        """(vectors, rows) ของรุ่น generation (รุ่น 0 ใช้ชื่อเดิม index ที่สร้างก่อนมี compaction อ่านได้เลย)"""
+        suffix = f".{generation}" if generation else ""
+        return (os.path.join(self.directory, f"vectors{suffix}.f16"),
+                os.path.join(self.directory, f"rows{suffix}.jsonl"))
+
+    def _reset(self, generation: Optional[int]):
+        self._generation = generation
+        self.vectors_path, self.rows_path = self._paths(generation or 0)
+        self._rows = []       # row -> dict
+        self._keys = {}       # key -> row ล่าสุดที่ยังไม่ถูกลบ
+        self._deleted = []    # row -> bool
+        self._dead = 0        # จำนวนแถวที่ถูกลบ/ถูกแทนแล้ว
+        self._offset = 0      # อ่าน rows.jsonl ถึง byte ไหนแล้ว
+        self._vectors = None
+
+    def _generations(self) -> list:
+        """[(generation, ชื่อไฟล์)] ของไฟล์ index ทุกรุ่นที่อยู่ในโฟลเดอร์"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        matches = [(_GENERATION_FILE.fullmatch(name), name) for name in names]
+        return [(int(match.group(1) or 0), name) for match, name in matches if match]
+
+    def _latest_generation(self) -> int:
+        return max([generation for generation, name in self._generations() if name.startswith("rows")
+                    and not name.endswith(".tmp")], default=0)
+
+    def _refresh(self):
+        while True:
+            if self._generation is None or os.path.exists(self._paths(self._generation + 1)[1]):
+                self._reset(self._latest_generation())
+            try:
+                self._read_rows()
+                return
+            except FileNotFoundError:
+                if self._latest_generation() == self._generation:
+                    return  # ยังไม่เคยเขียน index
+                # process อื่น compact แล้วลบไฟล์รุ่นที่กำลังอ่านไป: อ่านรุ่นล่าสุดใหม่ทั้งหมด
+                self._generation = None
+
+    def _read_rows(self):
+        with open(self.rows_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == self._offset:
+                return
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        # บรรทัดสุดท้ายที่ยังเขียนไม่จบ (ไม่มี \n) เก็บไว้อ่านรอบหน้า
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            row = json.loads(line)
+            previous = self._keys.pop(row["key"], None)
+            if previous is not None:
+                self._deleted[previous] = True
+                self._dead += 1
+            if row.get("deleted"):
+                continue
+            self._keys[row["key"]] = len(self._rows)
+            self._rows.append(row)
+            self._deleted.append(False)
+        self._offset += len(complete)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r",
+                                  shape=(len(self._rows), VECTOR_DIM)) if self._rows else None
+
+    def _append(self, items: list):
+        """เขียน [(row, vector หรือ None)] ต่อท้าย index ภายใต้ lock ครั้งเดียว"""
+        if not items:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            vectors = [vector.astype(np.float16).tobytes() for _, vector in items if vector is not None]
+            if vectors:
+                with open(self.vectors_path, "ab") as f:
+                    # ตัดเวกเตอร์ที่เขียนค้างไว้จากครั้งก่อน (เขียนเวกเตอร์แล้วแต่ยังไม่ทันเขียน row) ให้ตรงกับจำนวน row
+                    f.truncate(len(self._rows) * VECTOR_DIM * 2)
+                    f.write(b"".join(vectors))
+            with open(self.rows_path, "ab") as f:
+                f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row, _ in items).encode("utf-8"))
+            self._refresh()
+            if self._dead >= max(self.compact_min_rows, self.compact_ratio * len(self._rows)):
+                self._compact()
+
+    def compact(self) -> int:
+        """เขียน index ใหม่เฉพาะแถวที่ยังใช้อยู่ คืนจำนวนแถวที่ตัดทิ้ง"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            return self._compact() if self._dead else 0
+
+    def _compact(self) -> int:
+        """ต้องถือทั้ง self._lock และ file lock อยู่แล้ว"""
+        dropped = self._dead
+        live = np.flatnonzero(~np.asarray(self._deleted, dtype=bool))
+        generation = self._generation + 1
+        vectors_path, rows_path = self._paths(generation)
+        with open(vectors_path, "wb") as f:
+            for start in range(0, len(live), SEARCH_CHUNK):
+                f.write(np.asarray(self._vectors[live[start:start + SEARCH_CHUNK]], dtype=np.float16).tobytes())
+        # rows ของรุ่นใหม่ปรากฏทีเดียวทั้งไฟล์ (os.replace) หลังเวกเตอร์เขียนครบแล้ว worker อื่นจึงย้ายไปอ่านได้ทันที
+        with open(rows_path + ".tmp", "wb") as f:
+            f.write("".join(json.dumps(self._rows[row], ensure_ascii=False) + "\n" for row in live).encode("utf-8"))
+        os.replace(rows_path + ".tmp", rows_path)
+
+        self._reset(generation)  # ปล่อย memmap ของรุ่นเก่าก่อนลบ (Windows ลบไฟล์ที่ map อยู่ไม่ได้)
+        for old_generation, name in self._generations():
+            if old_generation != generation:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    # worker อื่นยัง map ไฟล์อยู่ (Windows): ลบตอน compact ครั้งถัดไป
+                    logger.debug(f"Could not remove old k-NN index file {name}: {e}")
+        self._refresh()
+        logger.info(f"Compacted k-NN index: dropped {dropped} stale rows, {len(self._rows)} rows remain")
+        return dropped
+
+    def add(self, key: str, label: str, vector: np.ndarray, text: str = None, output: str = None):
+        row = {"key": key, "label": label}
+        if text is not None:
+            row["text"], row["output"] = text, output
+        self._append([(row, vector)])
+
+    def remove(self, *keys: str):
+        with self._lock:
+            self._refresh()
+            existing = [key for key in keys if key in self._keys]
+        self._append([({"key": key, "deleted": True}, None) for key in existing])
+
+    def relabel(self, label: str, *keys: str):
+        """ย้ายโฟลเดอร์แล้วเปลี่ยน label (เขียนเวกเตอร์เดิมซ้ำเป็นแถวใหม่)"""
+        items = []
+        with self._lock:
+            self._refresh()
+            for key in keys:
+                row = self._keys.get(key)
+                if row is None or self._rows[row].get("label") == label:
+                    continue
+                items.append(({**self._rows[row], "label": label}, np.array(self._vectors[row], dtype=np.float32)))
+        self._append(items)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return key in self._keys
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._keys)
+
+    def search(self, vector: np.ndarray, k: int, labels: list = None, examples_only: bool = False) -> List[Neighbor]:
+        with self._lock:
+            self._refresh()
+            if self._vectors is None:
+                return []
+            vectors, rows = self._vectors, self._rows
+            usable = ~np.asarray(self._deleted, dtype=bool)
+
+        if labels is not None:
+            usable &= np.isin(np.asarray([row["label"] for row in rows], dtype=object), list(labels))
+        if examples_only:
+            usable &= np.asarray(["output" in row for row in rows], dtype=bool)
+        if not usable.any():
+            return []
+
+        query = vector.astype(np.float32)
+        similarities = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SEARCH_CHUNK):
+            block = np.asarray(vectors[start:start + SEARCH_CHUNK], dtype=np.float32)
+            similarities[start:start + len(block)] = block @ query
+        similarities[~usable] = -np.inf
+
+        k = min(k, int(usable.sum()))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [Neighbor(rows[i]["key"], rows[i]["label"], float(similarities[i]),
+                         rows[i].get("text"), rows[i].get("output")) for i in top]
+
+
+knn_index = VectorIndex()
+
+
+@dataclass
+class KnnResult:
+    label: str
+    accuracy: List[int]
+    margin: float
+    confident: bool
+
+
+def knn_classify(text: str, folder_list: list) -> Optional[KnnResult]:
+    """โหวตจากเพื่อนบ้าน k ตัวที่อยู่ในโฟลเดอร์ปัจจุบัน ถ่วงน้ำหนักด้วย cosine similarity"""
+    neighbors = knn_index.search(embed(text), KNN_K, labels=folder_list)
+    if not neighbors:
+        return None
+    weights = np.zeros(len(folder_list), dtype=np.float64)
+    for neighbor in neighbors:
+        weights[folder_list.index(neighbor.label)] += max(neighbor.similarity, 0.0)
+    if not weights.sum():
+        return None
+    shares = weights / weights.sum()
+    ranked = np.sort(shares)[::-1]
+    margin = float(ranked[0] - (ranked[1] if len(ranked) > 1 else 0.0))
+    confident = (neighbors[0].similarity >= KNN_MIN_SIMILARITY and margin >= KNN_MARGIN
+                 and len(neighbors) >= min(KNN_K, 3))
+    return KnnResult(folder_list[int(np.argmax(shares))], [int(round(share * 100)) for share in shares],
+                     margin, confident)
+
+
+def few_shot_examples(text: str, limit: int = FEW_SHOT_EXAMPLES) -> list:
+    """[(input, output)] ของตัวอย่างที่มีคำตอบแล้วที่ใกล้กับเอกสารนี้ที่สุด (input ไม่เกิน FEW_SHOT_CHARS ตัวอักษร)"""
+    if limit <= 0:
+        return []
+    return [(neighbor.text[:FEW_SHOT_CHARS], neighbor.output)
+            for neighbor in knn_index.search(embed(text), limit, examples_only=True)]
+
+
+def index_labeled_document(file_id: int, label: str, text: str):
+    """เพิ่มเอกสารที่จัดหมวดแล้วเข้า index (label = โฟลเดอร์ที่เก็บ)"""
+    if text.strip():
+        knn_index.add(f"file:{file_id}", label, embed(text))
+
+
+def remove_document(*file_ids: int):
+    knn_index.remove(*(f"file:{file_id}" for file_id in file_ids))
+
+
+def relabel_documents(label: str, file_ids: list):
+    """เปลี่ยน label ของเอกสารที่ถูกย้ายไปโฟลเดอร์ label"""
+    knn_index.relabel(label, *(f"file:{file_id}" for file_id in file_ids))
+
+
+def _example_key(text: str) -> str:
+    return "example:" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def add_examples(pairs: list) -> int:
+    """เพิ่มตัวอย่าง (input, "Label, [..]") ที่ยังไม่มีใน index"""
+    added = 0
+    for text, output in pairs:
+        label = output.split(",", 1)[0].strip()
+        key = _example_key(text)
+        if not text.strip() or not label or key in knn_index:
+            continue
+        knn_index.add(key, label, embed(text), text=text[:FEW_SHOT_CHARS], output=output)
+        added += 1
+    return added
+
+
+def load_prompt_examples(path: str = "AIDOC_gemini_new.py") -> list:
+    """ดึงคู่ "input: ..." / "output: ..." จากรายการ few-shot ใน AIDOC_gemini_new (อ่านด้วย ast ไม่ต้อง import)"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    pairs = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.List):
+            continue
+        values = [item.value for item in node.elts if isinstance(item, ast.Constant) and isinstance(item.value, str)]
+        for current, following in zip(values, values[1:]):
+            if current.startswith("input: ") and following.startswith("output: "):
+                pairs.append((current[len("input: "):], following[len("output: "):]))
+    return pairs
+
+
+def load_extracted_examples(path: str = "extracted_training_data.json") -> list:
+    """ตัวอย่างจาก model_tuning.extract_training_data_editable (ใช้ edited_* ก่อนถ้ามี)"""
+    with open(path, encoding="utf-8") as f:
+        extracted_data = json.load(f)
+    pairs = []
+    for item in extracted_data:
+        label = (item.get("edited_label", "").strip() or item.get("predicted_label", "").strip()
+                 or item.get("folder", ""))
+        accuracy = item.get("edited_accuracy") or item.get("accuracy", [])
+        output = f"{label}, [{','.join(str(value) for value in accuracy)}]" if isinstance(accuracy, list) and accuracy \
+            else label
+        pairs.append((item.get("extracted_text", ""), output))
+    return pairs
+
+
+def index_stored_documents() -> int:
+    """เพิ่มเอกสารที่สแกนไว้แล้ว (มี PageText) ที่ยังไม่อยู่ใน index"""
+    # import ตรงนี้เพราะ AIDOC_files_reciver import โมดูลนี้
+    from AIDOC_files_reciver import text_from_pages
+
+    session = get_session_internal()
+    added = 0
+    try:
+        rows = session.exec(select(File.id, Folder.name).join(Folder, File.folder_id == Folder.id)
+                            .where(File.id.in_(select(PageText.file_id)))).all()
+        for file_id, folder_name in rows:
+            if f"file:{file_id}" in knn_index:
+                continue
+            page_texts = {page_text.page: page_text.text
+                          for page_text in session.exec(select(PageText).where(PageText.file_id == file_id))}
+            index_labeled_document(file_id, folder_name, text_from_pages(page_texts))
+            added += 1
+    finally:
+        session.close()
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the nearest-neighbour classification index")
+    parser.add_argument("--prompt-examples", default="AIDOC_gemini_new.py",
+                        help="file with the static few-shot list ('' to skip)")
+    parser.add_argument("--extracted", default="extracted_training_data.json",
+                        help="output of model_tuning.extract_training_data_editable ('' to skip)")
+    parser.add_argument("--skip-documents", action="store_true", help="do not index already scanned documents")
+    parser.add_argument("--compact", action="store_true", help="rewrite the index without deleted/moved rows")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    if args.prompt_examples and os.path.exists(args.prompt_examples):
+        print(f"Added {add_examples(load_prompt_examples(args.prompt_examples))} examples from {args.prompt_examples}")
+    if args.extracted and os.path.exists(args.extracted):
+        print(f"Added {add_examples(load_extracted_examples(args.extracted))} examples from {args.extracted}")
+    if not args.skip_documents:
+        print(f"Added {index_stored_documents()} scanned documents")
+    if args.compact:
+        print(f"Dropped {knn_index.compact()} stale rows")
+    print(f"Index holds {len(knn_index)} vectors")
@@ -0,0 +1,181 @@
+import argparse
+import hashlib
+import logging
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session, select
+
+from AIDOC_database import create_db_and_tables, get_session_internal
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+from model.AIDOC_minhashModel import DocumentSignature, LSHBucket
+from model.AIDOC_pageTextModel import PageText
+
+logger = logging.getLogger(__name__)
+
+# ความเหมือน (Jaccard โดยประมาณ) ขั้นต่ำที่ถือว่าเป็นเอกสารฉบับแก้ของไฟล์เดิม
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get("AIDOC_NEAR_DUPLICATE_THRESHOLD", 0.8))
+SHINGLE_SIZE = 5
+SIGNATURE_PAGES = 3      # ใช้ข้อความ 3 หน้าแรกที่ OCR แล้ว (มีทั้งตอนสแกนใหม่และใน PageText)
+MIN_TEXT_LENGTH = 200    # ข้อความสั้นเกินไป (OCR ไม่ออก) ไม่เอามาเทียบ
+NUM_PERM = 128
+LSH_BANDS = 16           # 16 band x 8 แถว: เอกสารที่เหมือนกัน ~70% ขึ้นไปมีโอกาสชน bucket สูง
+LSH_ROWS = NUM_PERM // LSH_BANDS
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+# ค่าคงที่ต้องเหมือนเดิมทุกครั้ง ไม่งั้น signature ที่เก็บไว้ใช้เทียบไม่ได้
+_generator = np.random.RandomState(20240501)
+_PERM_A = _generator.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _generator.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+
+
+@dataclass
+class NearDuplicate:
+    file_id: int
+    folder_name: str
+    accuracy: Optional[str]
+    similarity: float
+
+
+def signature_text(page_texts: dict) -> str:
+    """ข้อความของหน้าแรก ๆ ตัวพิมพ์เล็ก ไม่มีช่องว่าง (เหมือน clean_text)"""
+    pages = sorted(page_texts)[:SIGNATURE_PAGES]
+    return "".join("".join(page_texts[page].split()) for page in pages).lower()
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """crc32 ของ character shingle ทุกตัว (ไม่ซ้ำ)"""
+    encoded = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in encoded),
+                       dtype=np.uint64, count=len(encoded))
+
+
+def minhash_signature(text: str) -> Optional[np.ndarray]:
+    """MinHash NUM_PERM ค่า (uint32) หรือ None ถ้าข้อความสั้นเกินไป"""
+    if len(text) < MIN_TEXT_LENGTH:
+        return None
+    hashes = shingle_hashes(text)
+    # (a * x + b) mod p ของทุก shingle x ทุก permutation แล้วเอาค่าน้อยสุดของแต่ละ permutation
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def band_keys(signature: np.ndarray) -> list:
+    """คีย์ bucket ของแต่ละ band (รวมเลข band ไว้ใน hash เพื่อใช้ index คอลัมน์เดียว)"""
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + rows, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def find_near_duplicate(page_texts: dict, session: Session = None) -> Optional[NearDuplicate]:
+    """หาไฟล์เดิมที่เนื้อหาหน้าแรก ๆ เกือบเหมือนกัน (ค้นจาก LSH bucket ที่มี index แล้วเทียบ signature)"""
+    signature = minhash_signature(signature_text(page_texts))
+    if signature is None:
+        return None
+
+    own_session = session is None
+    session = session or get_session_internal()
+    try:
+        candidates = session.exec(
+            select(DocumentSignature)
+            .where(DocumentSignature.file_id.in_(
+                select(LSHBucket.file_id).where(LSHBucket.bucket.in_(band_keys(signature)))
+            ))
+        ).all()
+
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            score = similarity(signature, np.frombuffer(candidate.signature, dtype=np.uint32))
+            if score > best_score:
+                best, best_score = candidate, score
+        if best is None or best_score < NEAR_DUPLICATE_THRESHOLD:
+            return None
+
+        row = session.exec(
+            select(File, Folder).join(Folder, File.folder_id == Folder.id).where(File.id == best.file_id)
+        ).first()
+        if not row:
+            return None
+        file_obj, folder_obj = row
+        # ชี้ไปที่ต้นฉบับเสมอ ไม่ให้เป็นสายยาว ๆ
+        original_id = file_obj.duplicate_of or file_obj.id
+        logger.debug(f"Near duplicate of file {original_id} (similarity {best_score:.2f})")
+        return NearDuplicate(original_id, folder_obj.name, file_obj.accuracy, best_score)
+    finally:
+        if own_session:
+            session.close()
+
+
+def add_document_index(file_id: int, page_texts: dict, session: Session) -> bool:
+    """เพิ่ม signature/bucket ของไฟล์ใน transaction ของผู้เรียก (ไม่ commit เอง) คืน False ถ้าข้อความสั้นเกินไป"""
+    signature = minhash_signature(signature_text(page_texts))
+    if signature is None:
+        return False
+    session.add(DocumentSignature(file_id=file_id, signature=signature.tobytes()))
+    for key in band_keys(signature):
+        session.add(LSHBucket(bucket=key, file_id=file_id))
+    return True
+
+
+def index_document(file_id: int, page_texts: dict, session: Session):
+    """เก็บ signature และ LSH bucket ของไฟล์ (commit เอง)"""
+    if add_document_index(file_id, page_texts, session):
+        session.commit()
+
+
+def delete_document_index(file_id: int, session: Session):
+    """ลบ signature/bucket ของไฟล์ และยกเลิกการชี้ duplicate_of มาที่ไฟล์นี้ (ไม่ commit เอง)"""
+    for bucket in session.exec(select(LSHBucket).where(LSHBucket.file_id == file_id)):
+        session.delete(bucket)
+    signature = session.get(DocumentSignature, file_id)
+    if signature:
+        session.delete(signature)
+    for duplicate in session.exec(select(File).where(File.duplicate_of == file_id)):
+        duplicate.duplicate_of = None
+        session.add(duplicate)
+
+
+def index_existing_documents(batch_size: int = 500) -> int:
+    """สร้าง signature ให้ไฟล์ที่มี PageText แต่ยังไม่อยู่ใน index (ไฟล์ที่อัปโหลดก่อนมีฟีเจอร์นี้)"""
+    session = get_session_internal()
+    indexed = 0
+    try:
+        file_ids = list(session.exec(
+            select(File.id)
+            .where(File.id.in_(select(PageText.file_id)))
+            .where(File.id.not_in(select(DocumentSignature.file_id)))
+            .order_by(File.id)
+        ))
+        for start in range(0, len(file_ids), batch_size):
+            batch_ids = file_ids[start:start + batch_size]
+            texts = {}
+            for page_text in session.exec(select(PageText).where(PageText.file_id.in_(batch_ids))):
+                texts.setdefault(page_text.file_id, {})[page_text.page] = page_text.text
+            for file_id in batch_ids:
+                indexed += add_document_index(file_id, texts.get(file_id, {}), session)
+            session.commit()
+            logger.info(f"Indexed {indexed} documents for near-duplicate detection")
+    finally:
+        session.close()
+    return indexed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the near-duplicate index for documents scanned earlier")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    print(f"Indexed {index_existing_documents(args.batch_size)} documents")
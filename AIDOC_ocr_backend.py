@@ -0,0 +1,175 @@
+import logging
+import os
+import platform
+import threading
+
+OCR_LANG = 'eng+tha'
+TESSERACT_CONFIG = '--oem 1  --psm 4'
+
+# "tesserocr" = โหลด model eng+tha ครั้งเดียวแล้วใช้ซ้ำ, "pytesseract" = เปิด process tesseract ใหม่ทุกหน้า
+# "auto" (ค่าเริ่มต้น) = tesserocr ถ้า import ได้ ไม่งั้น pytesseract (tesserocr ต้อง build กับ libtesseract
+# จึงไม่ได้อยู่ใน requirements.txt ติดตั้งผ่าน environment.yml หรือ pip install tesserocr เอง)
+OCR_BACKEND = os.environ.get("AIDOC_OCR_BACKEND", "auto").lower()
+OCR_WORKERS = int(os.environ.get("AIDOC_OCR_WORKERS", os.cpu_count() or 1))
+# tesserocr ล้มเหลวติดกันกี่หน้าจึงเลิกใช้ pool (หน้าที่ล้มเหลวแต่ละหน้าใช้ pytesseract แทนเฉพาะหน้านั้น)
+POOL_MAX_FAILURES = int(os.environ.get("AIDOC_OCR_POOL_MAX_FAILURES", 3))
+
+if platform.system() == "Windows":
+    TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+    TESSDATA_PATH = os.environ.get("TESSDATA_PREFIX", r'C:\Program Files\Tesseract-OCR\tessdata')
+else:
+    TESSERACT_CMD = "/usr/bin/tesseract"
+    TESSDATA_PATH = os.environ.get("TESSDATA_PREFIX")
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerInitError(RuntimeError):
+    """สร้าง PyTessBaseAPI ไม่ได้ (เช่น ไม่มี traineddata) ลองใหม่ก็ไม่หาย"""
+
+
+class TesseractWorkerPool:
+    """
+    Pool ของ tesserocr.PyTessBaseAPI ที่โหลดภาษาไว้แล้ว
+    แต่ละ worker ถูกใช้ได้ทีละ thread; tesserocr ปล่อย GIL ระหว่าง recognize ทำให้หลาย thread OCR พร้อมกันได้
+    """
+
+    def __init__(self, size: int):
+        self.size = max(size, 1)
+        self._idle = []
+        self._created = 0
+        # ทุกการเปลี่ยน _idle/_created แจ้ง thread ที่รออยู่ (รวมตอน worker เสียแล้วถูกทิ้ง ให้ตัวที่รอสร้างตัวใหม่แทน)
+        self._condition = threading.Condition()
+
+    def _new_worker(self):
+        from tesserocr import OEM, PSM, PyTessBaseAPI
+
+        kwargs = {"lang": OCR_LANG, "oem": OEM.LSTM_ONLY, "psm": PSM.SINGLE_COLUMN}
+        if TESSDATA_PATH:
+            kwargs["path"] = TESSDATA_PATH
+        return PyTessBaseAPI(**kwargs)
+
+    def _acquire(self):
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                self._condition.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self._new_worker()  # โหลด model นอก lock: thread อื่นยังคืน/ยืม worker ได้
+        except Exception as e:
+            with self._condition:
+                self._created -= 1
+                self._condition.notify()
+            raise WorkerInitError(str(e)) from e
+
+    def _release(self, api):
+        with self._condition:
+            self._idle.append(api)
+            self._condition.notify()
+
+    def _discard(self, api):
+        try:
+            api.End()
+        except Exception:
+            pass
+        with self._condition:
+            self._created -= 1
+            self._condition.notify()
+
+    def image_to_string(self, image) -> str:
+        api = self._acquire()
+        try:
+            api.SetImage(image)
+            text = api.GetUTF8Text()
+            api.Clear()
+        except Exception:
+            self._discard(api)  # worker อาจเสียสภาพแล้ว ตัวที่รออยู่ (หรือครั้งหน้า) สร้างใหม่
+            raise
+        self._release(api)
+        return text
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for api in idle:
+            api.End()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_failed = False
+_consecutive_failures = 0
+
+
+def _get_pool():
+    """Create the tesserocr pool on first use; returns None when pytesseract is used instead."""
+    global _pool, _pool_failed
+    if _pool_failed:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None and not _pool_failed:
+                if OCR_BACKEND == "pytesseract":
+                    logger.info("OCR backend: pytesseract (AIDOC_OCR_BACKEND=pytesseract)")
+                    _pool_failed = True
+                    return None
+                try:
+                    import tesserocr  # noqa: F401
+                except ImportError:
+                    if OCR_BACKEND == "tesserocr":
+                        logger.warning("AIDOC_OCR_BACKEND=tesserocr but tesserocr is not installed, "
+                                       "falling back to pytesseract")
+                    else:
+                        logger.info("OCR backend: pytesseract (tesserocr is not installed)")
+                    _pool_failed = True
+                    return None
+                _pool = TesseractWorkerPool(OCR_WORKERS)
+                logger.info(f"OCR backend: tesserocr (worker pool size: {_pool.size})")
+    return _pool
+
+
+def _pytesseract():
+    # import ตอนใช้ครั้งแรก: pytesseract ดึง pandas มาด้วย ทำให้ API process เริ่มช้าโดยไม่จำเป็น
+    import pytesseract
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return pytesseract
+
+
+def image_to_string(image) -> str:
+    """
+    OCR a PIL image with the configured backend; pytesseract is always the fallback.
+    A failing page falls back on its own; the pool is only disabled when a worker cannot be created
+    or after POOL_MAX_FAILURES failures in a row.
+    """
+    global _pool_failed, _consecutive_failures
+    pool = _get_pool()
+    if pool is not None:
+        try:
+            text = pool.image_to_string(image)
+            _consecutive_failures = 0
+            return text
+        except WorkerInitError as e:
+            logger.error(f"Could not start a tesserocr worker, using pytesseract from now on: {e}")
+            _pool_failed = True
+        except Exception as e:
+            with _pool_lock:
+                _consecutive_failures += 1
+                failures = _consecutive_failures
+                if failures >= POOL_MAX_FAILURES:
+                    _pool_failed = True
+            if failures >= POOL_MAX_FAILURES:
+                logger.error(f"tesserocr failed {failures} times in a row, using pytesseract from now on: {e}")
+            else:
+                logger.warning(f"tesserocr worker failed, using pytesseract for this page: {e}")
+    return _pytesseract().image_to_string(image, lang=OCR_LANG, config=TESSERACT_CONFIG)
+
+
+def shutdown():
+    """Release the language models held by resident workers."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
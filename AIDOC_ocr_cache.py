@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from AIDOC_ocr_backend import OCR_LANG, TESSERACT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# ผล OCR รายหน้าเก็บตาม hash ของรูปที่ส่งให้ tesseract (หลัง preprocess) หน้าปก/หัววารสารที่ซ้ำกันข้าม PDF
+# จึง OCR ครั้งเดียว ใช้ hash แบบตรงตัว: รูปต่างกันนิดเดียว (เช่น ชื่อเรื่องบนปก) ก็ต้องได้ข้อความของตัวเอง
+OCR_CACHE_ENABLED = os.environ.get("AIDOC_OCR_CACHE", "on").lower() != "off"
+OCR_CACHE_PATH = os.environ.get("AIDOC_OCR_CACHE_DB", "database/ocr_cache.db")
+OCR_CACHE_MAX_MB = float(os.environ.get("AIDOC_OCR_CACHE_MB", 256))
+EVICT_INTERVAL = 100  # ตรวจขนาดทุก ๆ กี่ครั้งที่เขียน
+EVICT_TARGET = 0.9    # ลบหน้าที่ไม่ได้ใช้นานที่สุดจนเหลือสัดส่วนนี้ของขนาดสูงสุด
+
+
+class OCRCache:
+    """LRU บนดิสก์ (SQLite แยกจากฐานข้อมูลหลัก, WAL) ทุก worker ใช้ไฟล์เดียวกัน"""
+
+    def __init__(self, path: str = OCR_CACHE_PATH, max_bytes: int = int(OCR_CACHE_MAX_MB * 1e6)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA busy_timeout=30000")
+            self._local.connection = connection
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.execute("""
+                        CREATE TABLE IF NOT EXISTS ocr_page (
+                            key TEXT PRIMARY KEY,
+                            text TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            hits INTEGER NOT NULL DEFAULT 0,
+                            last_used REAL NOT NULL
+                        )
+                    """)
+                    connection.execute("CREATE INDEX IF NOT EXISTS ix_ocr_page_last_used ON ocr_page (last_used)")
+                    self._ready = True
+        return connection
+
+    @staticmethod
+    def key(image, profile_name: str) -> str:
+        """hash ของ pixel รูป + ขนาด + ค่าที่มีผลต่อข้อความ (profile, ภาษา, config ของ tesseract)"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{profile_name}|{OCR_LANG}|{TESSERACT_CONFIG}|{image.mode}|{image.size}".encode("utf-8"))
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT text FROM ocr_page WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE ocr_page SET hits = hits + 1, last_used = ? WHERE key = ?",
+                                   (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"OCR cache read failed: {e}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key: str, text: str):
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO ocr_page (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, len(text.encode("utf-8")) + len(key), time.time())
+            )
+            self._writes += 1
+            if self._writes % EVICT_INTERVAL == 0:
+                self._evict(connection)
+        except sqlite3.Error as e:
+            logger.warning(f"OCR cache write failed: {e}")
+
+    def _evict(self, connection: sqlite3.Connection):
+        total = connection.execute("SELECT total(size) FROM ocr_page").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # เก็บหน้าที่ใช้ล่าสุดไว้จนเต็ม EVICT_TARGET ที่เหลือลบทิ้ง
+        deleted = connection.execute("""
+            DELETE FROM ocr_page WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, sum(size) OVER (ORDER BY last_used DESC) AS kept FROM ocr_page
+                ) WHERE kept > ?
+            )
+        """, (self.max_bytes * EVICT_TARGET,)).rowcount
+        logger.debug(f"Evicted {deleted} pages from the OCR cache ({total / 1e6:.1f} MB)")
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        try:
+            entries, size = self._connection().execute("SELECT count(*), total(size) FROM ocr_page").fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        return {
+            "enabled": OCR_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "size_mb": round(size / 1e6, 1) if size is not None else None,
+            "max_mb": round(self.max_bytes / 1e6, 1)
+        }
+
+
+ocr_cache = OCRCache()
@@ -0,0 +1,97 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OCRProfile:
+    """
+    ชุดค่าที่ใช้ตอนแปลง PDF เป็นรูปและเตรียมรูปก่อนส่งให้ tesseract
+    dpi ต่ำ + threshold + crop ขอบ = เร็วขึ้นแต่อาจพลาดตัวอักษรเล็ก ๆ
+    """
+    name: str
+    dpi: int
+    grayscale: bool = True           # ให้ poppler render เป็นขาวดำตั้งแต่ต้น
+    threshold: Optional[str] = None  # None | "otsu"
+    crop_margins: bool = False       # ตัดขอบขาวรอบหน้ากระดาษทิ้ง
+    max_side: Optional[int] = None   # ย่อรูปที่ใหญ่เกินไป (pixel ของด้านที่ยาวที่สุด)
+
+
+OCR_PROFILES = {
+    # ค่าเดิมก่อนมี profile: render สี 200 dpi (ค่าเริ่มต้นของ pdf2image) แล้วแปลงเป็นขาวดำอย่างเดียว
+    "legacy": OCRProfile(name="legacy", dpi=200, grayscale=False),
+    "fast": OCRProfile(name="fast", dpi=150, threshold="otsu", crop_margins=True, max_side=1800),
+    "balanced": OCRProfile(name="balanced", dpi=200, threshold="otsu", crop_margins=True, max_side=2600),
+    "accurate": OCRProfile(name="accurate", dpi=300),
+}
+
+# ค่าเริ่มต้นให้ผล OCR เหมือนเดิม เปลี่ยนเป็น fast/balanced หลังวัดด้วย ocr_profile_benchmark.py แล้วเท่านั้น
+DEFAULT_OCR_PROFILE = os.environ.get("AIDOC_OCR_PROFILE", "legacy")
+
+
+def get_ocr_profile(name: Optional[str] = None) -> OCRProfile:
+    """Return the profile called `name` (or AIDOC_OCR_PROFILE), falling back to 'legacy'."""
+    profile_name = (name or DEFAULT_OCR_PROFILE).lower()
+    profile = OCR_PROFILES.get(profile_name)
+    if profile is None:
+        logger.warning(f"Unknown OCR profile '{profile_name}', using 'legacy'")
+        profile = OCR_PROFILES["legacy"]
+    return profile
+
+
+def otsu_threshold(histogram: list) -> int:
+    """Pick the binarization level that best separates ink from paper (Otsu's method)."""
+    total = sum(histogram)
+    if total == 0:
+        return 128
+    sum_all = sum(i * h for i, h in enumerate(histogram))
+    sum_background = 0.0
+    weight_background = 0
+    best_level, best_variance = 128, 0.0
+    for level, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += level * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def preprocess_image(image, profile: OCRProfile):
+    """
+    เตรียมรูปก่อน OCR ตาม profile: แปลงเป็นขาวดำ -> ตัดขอบ -> ย่อ -> threshold
+    คืนค่าเป็นรูป PIL โหมด 'L'
+    """
+    from PIL import Image, ImageOps
+
+    im = image.convert('L')
+
+    if profile.crop_margins:
+        # กลับสีให้ตัวหนังสือเป็นสีขาว แล้วตัด noise จางๆ ทิ้งก่อนหา bounding box
+        ink = ImageOps.invert(im).point(lambda p: 255 if p > 40 else 0)
+        bbox = ink.getbbox()
+        if bbox:
+            pad = 12
+            left, top, right, bottom = bbox
+            im = im.crop((max(left - pad, 0), max(top - pad, 0),
+                          min(right + pad, im.width), min(bottom + pad, im.height)))
+
+    if profile.max_side and max(im.size) > profile.max_side:
+        scale = profile.max_side / max(im.size)
+        im = im.resize((max(int(im.width * scale), 1), max(int(im.height * scale), 1)), Image.LANCZOS)
+
+    if profile.threshold == "otsu":
+        level = otsu_threshold(im.histogram())
+        im = im.point(lambda p: 255 if p > level else 0)
+
+    return im
@@ -0,0 +1,145 @@
+import logging
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from AIDOC_keyword_list import text_fix
+
+logger = logging.getLogger(__name__)
+
+if platform.system() == "Windows":
+    POPPLER_PATH = r"C:\Program Files\poppler-24.08.0\Library\bin"
+elif platform.system() == "Linux":
+    POPPLER_PATH = "/usr/bin"  # Poppler is installed system-wide on Linux
+else:
+    POPPLER_PATH = None
+
+# ช่วงหน้าเดิมที่ใช้ตอนอ่าน pdfinfo ไม่ได้
+FALLBACK_PAGE_RANGE = (1, 7)
+# เอกสารสั้น (เช่น abstract งานประชุม) OCR ทุกหน้าไปเลย
+SHORT_DOCUMENT_PAGES = 3
+# thesis ที่ยาวกว่านี้มักมี front matter ยาว จึงยอมขยายหน้าต่างไปได้ไกลกว่าปกติ
+LONG_DOCUMENT_PAGES = 40
+MAX_OCR_PAGES = int(os.environ.get("AIDOC_MAX_OCR_PAGES", 14))
+
+OUTLINE_KEYWORDS = ["บทคัดย่อ", "abstract", "overview", "summary", *text_fix]
+
+
+@dataclass
+class PagePlan:
+    """หน้าที่จะ OCR ก่อน (initial) และชุดหน้าที่จะขยายไปทีละชุดเมื่อยังหา keyword ไม่เจอ (extensions)"""
+    page_count: Optional[int]
+    initial: List[int]
+    extensions: List[List[int]] = field(default_factory=list)
+    outline_pages: List[int] = field(default_factory=list)
+
+
+def read_page_count(pdf_path: str) -> Optional[int]:
+    from pdf2image import pdfinfo_from_path
+
+    try:
+        info = pdfinfo_from_path(pdf_path, poppler_path=POPPLER_PATH, timeout=10)
+        return int(info["Pages"])
+    except Exception as e:
+        logger.warning(f"pdfinfo failed, falling back to fixed page window: {e}")
+        return None
+
+
+def read_outline(pdf_path: str) -> List[tuple]:
+    """
+    อ่าน outline/bookmark ผ่าน `pdftohtml -xml` (ไม่ render รูป) คืนค่าเป็น [(title, page), ...]
+    PDF ส่วนใหญ่ที่สแกนมาไม่มี outline ก็จะได้ list ว่าง
+    """
+    command = os.path.join(POPPLER_PATH, "pdftohtml") if POPPLER_PATH else "pdftohtml"
+    try:
+        result = subprocess.run(
+            [command, "-xml", "-i", "-q", "-stdout", "-f", "1", "-l", "1", pdf_path],
+            capture_output=True, timeout=10, check=True,
+        )
+        root = ET.fromstring(result.stdout.decode("utf-8", errors="ignore"))
+    except Exception as e:
+        logger.debug(f"Could not read PDF outline: {e}")
+        return []
+
+    outline = []
+    for item in root.iter("item"):
+        page = item.get("page")
+        title = "".join(item.itertext())
+        if page and page.isdigit():
+            outline.append((title, int(page)))
+    return outline
+
+
+def _is_abstract_entry(title: str) -> bool:
+    compact = re.sub(r'\s+', '', title).lower()
+    return any(kw.lower() in compact for kw in OUTLINE_KEYWORDS)
+
+
+def build_plan(page_count: Optional[int], outline: List[tuple]) -> PagePlan:
+    if page_count is None:
+        first, last = FALLBACK_PAGE_RANGE
+        return PagePlan(page_count=None, initial=list(range(first, 4)), extensions=[list(range(4, last + 1))])
+
+    if page_count <= SHORT_DOCUMENT_PAGES:
+        return PagePlan(page_count=page_count, initial=list(range(1, page_count + 1)))
+
+    last_allowed = min(page_count, MAX_OCR_PAGES if page_count > LONG_DOCUMENT_PAGES else FALLBACK_PAGE_RANGE[1])
+    outline_pages = sorted({page for title, page in outline
+                            if _is_abstract_entry(title) and 1 <= page <= page_count})
+
+    if outline_pages:
+        # outline บอกหน้าบทคัดย่อแล้ว: หน้าปก + หน้านั้น + หน้าถัดไป (บทคัดย่อมักยาวต่อ 1 หน้า)
+        initial = sorted({1, *outline_pages, *[p + 1 for p in outline_pages if p < page_count]})
+    else:
+        initial = list(range(1, min(3, page_count) + 1))
+
+    remaining = [p for p in range(1, last_allowed + 1) if p not in initial]
+    extensions = [remaining[i:i + 4] for i in range(0, len(remaining), 4)]
+    return PagePlan(page_count=page_count, initial=initial, extensions=extensions, outline_pages=outline_pages)
+
+
+def _read_structure(pdf_path: str) -> tuple:
+    page_count = read_page_count(pdf_path)
+    outline = read_outline(pdf_path) if page_count and page_count > SHORT_DOCUMENT_PAGES else []
+    return page_count, outline
+
+
+def plan_pages(pdf_file: bytes, task_id: str, pdf_path: str = None) -> PagePlan:
+    """
+    Pick which pages to OCR first using only cheap poppler calls (no rendering).
+    pdf_path = ไฟล์เดียวกันที่อยู่บนดิสก์แล้ว (ไฟล์อัปโหลดใน temp หรือต้นฉบับของ import-archive)
+    ถ้าไม่มีค่อยเขียน pdf_file ลงไฟล์ชั่วคราวให้ poppler อ่าน
+    """
+    if pdf_path and os.path.exists(pdf_path):
+        page_count, outline = _read_structure(pdf_path)
+    else:
+        temp_dir = f"database/temp/{task_id}"
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".pdf", dir=temp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_file)
+            page_count, outline = _read_structure(temp_path)
+        finally:
+            os.remove(temp_path)
+
+    plan = build_plan(page_count, outline)
+    logger.debug(f"Page plan (task: {task_id}): pages={plan.page_count}, initial={plan.initial}, "
+                 f"extensions={plan.extensions}, outline abstract pages={plan.outline_pages}")
+    return plan
+
+
+def contiguous_ranges(pages: List[int]) -> List[tuple]:
+    """[1, 2, 3, 6, 7] -> [(1, 3), (6, 7)] so each run is rendered by one pdftoppm call."""
+    ranges = []
+    for page in sorted(set(pages)):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
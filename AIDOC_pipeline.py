@@ -0,0 +1,183 @@
+import asyncio
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Awaitable, Callable
+
+from AIDOC_scheduler import LLM_CONCURRENCY, PRIORITIES, PRIORITY_BULK, WaitStats
+from AIDOC_serving import scan_tracker
+
+logger = logging.getLogger(__name__)
+
+# ความยาวคิวระหว่าง stage ถ้าคิวเต็ม stage ก่อนหน้าจะรอ (backpressure) ไม่ OCR ล่วงหน้าไปกองไว้ใน memory
+PIPELINE_QUEUE_SIZE = int(os.environ.get("AIDOC_PIPELINE_QUEUE_SIZE", 16))
+# DB stage เขียนผลสแกนทีละ batch: สูงสุดกี่งานต่อ transaction และรองานถัดไปนานสุดกี่วินาที
+DB_BATCH_SIZE = int(os.environ.get("AIDOC_DB_BATCH_SIZE", 20))
+DB_FLUSH_DELAY = float(os.environ.get("AIDOC_DB_FLUSH_DELAY", 0.5))
+
+
+class ScanPipeline:
+    """
+    stage หลัง OCR ของงานสแกน ต่อกันด้วยคิวที่จำกัดขนาด
+        OCR (scan worker ของ scheduler) -> LLM (async, พร้อมกัน llm_concurrency งาน) -> DB (thread เดียว)
+    OCR ของเอกสารถัดไปจึงทำไปพร้อมกับการรอคำตอบ LLM ของเอกสารก่อนหน้า
+    DB stage รวมงานที่เสร็จแล้วเป็น batch (ไม่เกิน db_batch_size งาน รอไม่เกิน db_flush_delay วินาที
+    และไม่รอเลยถ้าไม่มีงานอื่นค้างใน LLM stage) แล้วเขียนใน transaction เดียว
+    งานแต่ละชิ้นต้องมี attribute task_id และ priority
+        classify(work)      coroutine ของ LLM stage
+        store_batch(works)  เขียนผลทั้ง batch ลง DB/storage ถ้า error จะลองใหม่ทีละงานเพื่อแยกงานที่เสีย
+        fail(work, error)   เรียกเมื่อ stage ใดล้มเหลว
+    """
+
+    def __init__(self, classify: Callable[[object], Awaitable[None]], store_batch: Callable[[list], None],
+                 fail: Callable[[object, Exception], None], llm_concurrency: int = LLM_CONCURRENCY,
+                 queue_size: int = PIPELINE_QUEUE_SIZE, db_batch_size: int = DB_BATCH_SIZE,
+                 db_flush_delay: float = DB_FLUSH_DELAY):
+        self._classify = classify
+        self._store_batch = store_batch
+        self._fail = fail
+        self.llm_concurrency = max(llm_concurrency, 1)
+        self.queue_size = max(queue_size, 1)
+        self.db_batch_size = max(db_batch_size, 1)
+        self.db_flush_delay = db_flush_delay
+        self._batches = 0
+        self._batched_works = 0
+        self._loop = None
+        self._llm_queue = None  # asyncio.PriorityQueue: งาน interactive ได้เรียก LLM ก่อน
+        self._db_queue = queue.Queue(maxsize=self.queue_size)
+        self._sequence = itertools.count()
+        self._llm_active = 0
+        self._db_active = 0
+        self._lock = threading.Lock()
+        self.wait_stats = {"llm": WaitStats(), "db": WaitStats()}
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                self._llm_queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+                for _ in range(self.llm_concurrency):
+                    loop.create_task(self._llm_worker())
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run_loop, name="scan-llm-stage", daemon=True).start()
+            threading.Thread(target=self._db_worker, name="scan-db-stage", daemon=True).start()
+            ready.wait()
+            self._loop = loop
+
+    def submit(self, work):
+        """
+        ส่งงานที่ OCR เสร็จแล้วเข้า LLM stage (block ถ้าคิวเต็ม)
+        pipeline รับผิดชอบงานนี้ต่อจนจบ รวมถึงการเรียก fail เมื่อผิดพลาด
+        """
+        self._ensure_started()
+        scan_tracker.add(work.task_id)
+        rank = PRIORITIES.index(getattr(work, "priority", PRIORITY_BULK))
+        item = (rank, next(self._sequence), time.monotonic(), work)
+        asyncio.run_coroutine_threadsafe(self._llm_queue.put(item), self._loop).result()
+
+    def _finish_failed(self, work, error: Exception):
+        try:
+            self._fail(work, error)
+        except Exception as e:
+            logger.error(f"Could not mark scan {work.task_id} as failed: {e}")
+        finally:
+            scan_tracker.done(work.task_id)
+
+    async def _llm_worker(self):
+        while True:
+            _, _, queued_at, work = await self._llm_queue.get()
+            self.wait_stats["llm"].add(time.monotonic() - queued_at)
+            self._llm_active += 1
+            try:
+                await self._classify(work)
+            except Exception as e:
+                logger.error(f"LLM stage failed for scan {work.task_id}: {e}")
+                await asyncio.to_thread(self._finish_failed, work, e)
+                continue
+            finally:
+                self._llm_active -= 1
+                self._llm_queue.task_done()
+            # DB stage ตามไม่ทันก็รอตรงนี้ (ไม่ block event loop)
+            await asyncio.to_thread(self._db_queue.put, (time.monotonic(), work))
+
+    def _llm_idle(self) -> bool:
+        return self._llm_active == 0 and (self._llm_queue is None or self._llm_queue.empty())
+
+    def _next_batch(self) -> list:
+        """รองานแรกแล้วเก็บงานที่ตามมาจนครบ batch, หมดเวลา หรือไม่มีงานอื่นกำลังจะมาถึง"""
+        batch = [self._db_queue.get()]
+        deadline = time.monotonic() + self.db_flush_delay
+        while len(batch) < self.db_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (self._db_queue.empty() and self._llm_idle()):
+                break
+            try:
+                batch.append(self._db_queue.get(timeout=min(remaining, 0.05)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def _store(self, works: list):
+        """เขียนทั้ง batch ถ้าไม่สำเร็จลองใหม่ทีละงาน งานที่ยังไม่สำเร็จถูก fail"""
+        try:
+            self._store_batch(works)
+        except Exception as e:
+            if len(works) == 1:
+                logger.error(f"DB stage failed for scan {works[0].task_id}: {e}")
+                self._finish_failed(works[0], e)
+                return
+            logger.warning(f"Batch of {len(works)} scans failed, storing them one by one: {e}")
+            for work in works:
+                self._store([work])
+            return
+        self._batches += 1
+        self._batched_works += len(works)
+        for work in works:
+            scan_tracker.done(work.task_id)
+
+    def _db_worker(self):
+        while True:
+            batch = self._next_batch()
+            now = time.monotonic()
+            for queued_at, _ in batch:
+                self.wait_stats["db"].add(now - queued_at)
+            self._db_active = len(batch)
+            try:
+                self._store([work for _, work in batch])
+            finally:
+                self._db_active = 0
+                for _ in batch:
+                    self._db_queue.task_done()
+
+    def metrics(self) -> dict:
+        return {
+            "queue_size": self.queue_size,
+            "llm": {
+                "concurrency": self.llm_concurrency,
+                "queued": self._llm_queue.qsize() if self._llm_queue is not None else 0,
+                "active": self._llm_active,
+                "wait": self.wait_stats["llm"].summary()
+            },
+            "db": {
+                "concurrency": 1,
+                "queued": self._db_queue.qsize(),
+                "active": self._db_active,
+                "batch_size": self.db_batch_size,
+                "flush_delay": self.db_flush_delay,
+                "batches": self._batches,
+                "avg_batch": round(self._batched_works / self._batches, 1) if self._batches else 0.0,
+                "wait": self.wait_stats["db"].summary()
+            }
+        }
@@ -0,0 +1,163 @@
+import argparse
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from AIDOC_blob_store import LEGACY_STORAGE_DIR, put_file
+from AIDOC_database import bump_cache_version, get_session_internal, update_accuracy
+from AIDOC_files_reciver import classify_text, text_from_pages
+from AIDOC_knn import relabel_documents
+from AIDOC_upload_status import upload_status
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+from model.AIDOC_pageTextModel import PageText
+
+logger = logging.getLogger(__name__)
+
+RECLASSIFY_BATCH_SIZE = int(os.environ.get("AIDOC_RECLASSIFY_BATCH_SIZE", 50))
+RECLASSIFY_CONCURRENCY = int(os.environ.get("AIDOC_RECLASSIFY_CONCURRENCY", 8))
+
+
+def _load_page_texts(file_ids: list, session: Session) -> dict:
+    """{file_id: {page: text}} ของทั้ง batch ใน query เดียว"""
+    statement = (select(PageText).where(PageText.file_id.in_(file_ids))
+                 .order_by(PageText.file_id, PageText.page))
+    texts = {}
+    for page_text in session.exec(statement):
+        texts.setdefault(page_text.file_id, {})[page_text.page] = page_text.text
+    return texts
+
+
+def _classify_document(file_id: int, page_texts: dict, folder_names: list):
+    try:
+        # เอกสารนี้อยู่ใน k-NN index แล้ว (ชี้โฟลเดอร์เดิม) ต้องถาม AI ไม่งั้นย้ายเข้าโฟลเดอร์ใหม่ไม่ได้
+        label, accuracy = classify_text(text_from_pages(page_texts), folder_names, use_knn=False)
+        return file_id, label, accuracy, None
+    except Exception as e:
+        return file_id, None, None, e
+
+
+def _apply_batch(results: list, folder_ids: dict, session: Session) -> int:
+    """
+    อัปเดตคะแนนและโฟลเดอร์ของทั้ง batch ใน transaction เดียว
+    ไฟล์แบบเดิมที่อยู่ใน storage/<folder>/<name> จะถูกย้ายเข้า object store ไปด้วย
+    (hardlink ก่อน commit แล้วค่อยลบไฟล์เดิมหลัง commit เพื่อไม่ให้แถวชี้ไปไฟล์ที่ไม่มีอยู่)
+    ไฟล์ที่ย้ายโฟลเดอร์ได้ label ใหม่ใน k-NN index หลัง commit ด้วย
+    """
+    failed = 0
+    legacy_paths = []
+    moved = {}  # label ใหม่ -> [file_id]
+    for file_id, label, accuracy, error in results:
+        file_obj = session.get(File, file_id)
+        if error is not None or label not in folder_ids or file_obj is None:
+            logger.error(f"Reclassify failed for file {file_id}: {error or f'unknown folder {label}'}")
+            failed += 1
+            continue
+
+        if not file_obj.content_hash:
+            old_folder = session.get(Folder, file_obj.folder_id)
+            legacy_path = os.path.join(LEGACY_STORAGE_DIR, old_folder.name, file_obj.name) if old_folder else None
+            if legacy_path and os.path.exists(legacy_path):
+                file_obj.content_hash = put_file(legacy_path, move=False, link=True)
+                legacy_paths.append(legacy_path)
+
+        if file_obj.folder_id != folder_ids[label]:
+            moved.setdefault(label, []).append(file_id)
+        file_obj.accuracy = str(accuracy)
+        file_obj.folder_id = folder_ids[label]
+        session.add(file_obj)
+
+    bump_cache_version(session, "folders", "files")
+    session.commit()
+
+    for legacy_path in legacy_paths:
+        try:
+            os.remove(legacy_path)
+        except OSError as e:
+            logger.error(f"Could not remove migrated file {legacy_path}: {e}")
+    for label, moved_ids in moved.items():
+        try:
+            relabel_documents(label, moved_ids)
+        except Exception as e:
+            logger.warning(f"Could not relabel {len(moved_ids)} documents in the k-NN index: {e}")
+    return failed
+
+
+def reclassify_all(job_id: str, batch_size: int = RECLASSIFY_BATCH_SIZE, concurrency: int = RECLASSIFY_CONCURRENCY):
+    """
+    จัดหมวดเอกสารทั้งหมดใหม่ตามรายชื่อโฟลเดอร์ปัจจุบัน โดยใช้ข้อความ OCR ที่เก็บไว้ (ไม่ต้องรัน tesseract ใหม่)
+    ส่งให้ AI ทีละ batch พร้อมกันไม่เกิน `concurrency` งาน และรายงานความคืบหน้าผ่าน upload_status[job_id]
+    """
+    session = get_session_internal()
+    upload_status[job_id] = {
+        "status": "Processing",
+        "file_name": "",
+        "current_step": "Loading documents",
+        "progress": 0
+    }
+    try:
+        folders = session.exec(select(Folder).order_by(Folder.id)).all()
+        folder_names = [folder.name for folder in folders]
+        folder_ids = {folder.name: folder.id for folder in folders}
+
+        file_ids = list(session.exec(
+            select(File.id).where(File.id.in_(select(PageText.file_id))).order_by(File.id)
+        ))
+        skipped = session.exec(select(func.count()).select_from(File)).one() - len(file_ids)
+        done = 0
+        failed = 0
+
+        upload_status.update(job_id, {
+            "current_step": "Reclassifying",
+            "total": len(file_ids),
+            "done": 0,
+            "failed": 0,
+            "skipped": skipped  # ไฟล์ที่ไม่มีข้อความ OCR เก็บไว้ (อัปโหลดก่อนมีการเก็บข้อความ)
+        })
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for start in range(0, len(file_ids), batch_size):
+                batch_ids = file_ids[start:start + batch_size]
+                page_texts = _load_page_texts(batch_ids, session)
+                results = list(pool.map(
+                    lambda file_id: _classify_document(file_id, page_texts[file_id], folder_names),
+                    batch_ids
+                ))
+                failed += _apply_batch(results, folder_ids, session)
+                done += len(batch_ids)
+
+                upload_status.update(job_id, {
+                    "done": done,
+                    "failed": failed,
+                    "progress": int(done / len(file_ids) * 100)
+                })
+                logger.info(f"Reclassify {job_id}: {done}/{len(file_ids)} documents ({failed} failed)")
+
+        update_accuracy(session)
+        upload_status.update(job_id, {
+            "status": "Completed",
+            "current_step": "Process complete",
+            "progress": 100
+        })
+    except Exception as e:
+        logger.error(f"Error in reclassify_all: {e}")
+        upload_status.update(job_id, {
+            "status": "Failed",
+            "error": str(e),
+            "current_step": "Error occurred"
+        })
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score every stored document against the current folder list")
+    parser.add_argument("--batch-size", type=int, default=RECLASSIFY_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=RECLASSIFY_CONCURRENCY)
+    args = parser.parse_args()
+
+    reclassify_all(str(uuid.uuid4()), args.batch_size, args.concurrency)
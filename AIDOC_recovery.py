@@ -0,0 +1,422 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from sqlalchemy import func
+from sqlmodel import select
+
+from AIDOC_blob_store import LEGACY_STORAGE_DIR, OBJECTS_DIR, mark_dirty, object_path, release, take_dirty
+from AIDOC_database import create_db_and_tables, get_session_internal
+from AIDOC_serving import file_lock
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+
+logger = logging.getLogger(__name__)
+
+TEMP_DIR = "database/temp"
+WORKERS_DIR = "database/workers"
+JOB_MANIFEST = "job.json"
+# journal ของงานที่แก้ทั้ง DB และดิสก์ (เช่น ลบ/ย้ายไฟล์ทีละหลายไฟล์) ถ้า process ตายกลางทางจะถูกทำต่อจนจบ
+JOURNAL_DIR = "database/journal"
+RECONCILE_LOCK_PATH = "database/.reconcile.lock"
+# mtime ของโฟลเดอร์ย่อยใน object store/storage ตอนตรวจครั้งก่อน ใช้หาเฉพาะโฟลเดอร์ที่เปลี่ยน
+MANIFEST_PATH = "database/reconcile_manifest.json"
+RECONCILE_INTERVAL = int(os.environ.get("AIDOC_RECONCILE_INTERVAL", 600))
+# object/โฟลเดอร์ temp ที่ใหม่กว่านี้ (วินาที) ยังไม่ลบ: DB stage อาจยังไม่ commit หรือ request ยังเขียนไฟล์อยู่
+ORPHAN_GRACE = int(os.environ.get("AIDOC_ORPHAN_GRACE", 3600))
+
+
+class WorkerLease:
+    """
+    lock file ที่ worker ถือไว้ตลอดอายุ process (database/workers/<id>.lock)
+    งานใน temp ที่เจ้าของยังถือ lease อยู่คือยังทำงานอยู่ ถ้า lock ได้แปลว่าเจ้าของตายไปแล้ว
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self._file = None
+
+    @staticmethod
+    def _path(worker_id: str) -> str:
+        return os.path.join(WORKERS_DIR, f"{worker_id}.lock")
+
+    @staticmethod
+    def _try_lock(lock_file) -> bool:
+        try:
+            if platform.system() == "Windows":
+                import msvcrt
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self):
+        if self._file is None:
+            os.makedirs(WORKERS_DIR, exist_ok=True)
+            self._file = open(self._path(self.worker_id), "a+")
+            self._try_lock(self._file)
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            try:
+                os.remove(self._path(self.worker_id))
+            except OSError:
+                pass
+
+    def is_alive(self, worker_id: str) -> bool:
+        if worker_id == self.worker_id:
+            return self._file is not None
+        path = self._path(worker_id)
+        if not os.path.exists(path):
+            return False
+        with open(path, "a+") as lock_file:
+            if not self._try_lock(lock_file):
+                return True
+        try:
+            os.remove(path)  # lease ของ worker ที่ตายแล้ว
+        except OSError:
+            pass
+        return False
+
+
+worker_lease = WorkerLease()
+
+
+def write_job_manifest(task_id: str, file_name: str, **info):
+    """บันทึกข้อมูลงานสแกนไว้ใน temp ของงาน ใช้ส่งงานเข้าคิวใหม่ถ้า server ตายก่อนงานเสร็จ"""
+    manifest = {
+        "task_id": task_id,
+        "file_name": file_name,
+        "owner": worker_lease.worker_id,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        **info
+    }
+    path = os.path.join(TEMP_DIR, task_id, JOB_MANIFEST)
+    staging = f"{path}.tmp"
+    with open(staging, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(staging, path)
+
+
+def write_journal(job_id: str, **entry):
+    """บันทึก (หรือเขียนทับ) journal ของงาน job_id แบบ atomic"""
+    os.makedirs(JOURNAL_DIR, exist_ok=True)
+    journal = {
+        "job_id": job_id,
+        "owner": worker_lease.worker_id,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        **entry
+    }
+    path = os.path.join(JOURNAL_DIR, f"{job_id}.json")
+    staging = f"{path}.tmp"
+    with open(staging, "w", encoding="utf-8") as f:
+        json.dump(journal, f, ensure_ascii=False)
+    os.replace(staging, path)
+
+
+def remove_journal(job_id: str):
+    try:
+        os.remove(os.path.join(JOURNAL_DIR, f"{job_id}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def read_job_manifest(task_id: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(TEMP_DIR, task_id, JOB_MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@dataclass
+class ReconcileReport:
+    requeued: list = field(default_factory=list)         # task_id ที่ส่งเข้าคิวใหม่
+    purged_temp: list = field(default_factory=list)      # โฟลเดอร์ temp ที่ลบ
+    purged_objects: list = field(default_factory=list)   # object ที่ไม่มีแถวใน File อ้างถึง
+    missing_objects: list = field(default_factory=list)  # file id ที่ไม่มีไฟล์บนดิสก์
+    untracked_files: list = field(default_factory=list)  # ไฟล์ใน storage เก่าที่ไม่มีแถวใน File (รายงานเฉย ๆ ไม่ลบ)
+    rolled_forward: list = field(default_factory=list)   # job_id ของ journal ที่ทำต่อจนจบ
+    checked: int = 0
+    freed_bytes: int = 0
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def reconcile_temp(report: ReconcileReport, requeue: Callable[[dict], bool] = None, dry_run: bool = False):
+    """
+    ตรวจงานใน database/temp (มีเฉพาะงานที่ยังไม่เสร็จ ไม่ต้องเดินทั้ง storage)
+    งานที่เจ้าของตายแล้ว: ส่งเข้าคิวใหม่ถ้ายังมี PDF และ requeue รับงาน ไม่งั้นลบทิ้ง
+    requeue=None (เช่น เรียกจาก CLI) เก็บงานที่ยังทำต่อได้ไว้ให้ server ส่งเข้าคิวตอนเริ่มครั้งถัดไป
+    """
+    if not os.path.isdir(TEMP_DIR):
+        return
+    now = time.time()
+    for entry in os.scandir(TEMP_DIR):
+        if not entry.is_dir():
+            continue
+        manifest = read_job_manifest(entry.name)
+        if manifest and worker_lease.is_alive(manifest.get("owner", "")):
+            continue
+        if not manifest and now - entry.stat().st_mtime < ORPHAN_GRACE:
+            continue  # งานที่ request ยังเขียนไม่เสร็จ หรือโฟลเดอร์ที่ไม่รู้ที่มา ให้เวลาก่อน
+        report.checked += 1
+
+        pdf_path = (manifest.get("source_path") or os.path.join(entry.path, manifest["file_name"])) if manifest else None
+        if manifest and os.path.exists(pdf_path):
+            if requeue is None or not manifest.get("recoverable", True):
+                continue  # งานของ import-archive: ให้ --resume ตรวจแล้วส่งใหม่เอง ไม่งั้นจะได้แถวซ้ำ
+            if dry_run:
+                report.requeued.append(entry.name)
+                continue
+            manifest["owner"] = worker_lease.worker_id  # อ้างสิทธิ์ก่อน worker อื่นที่ตรวจพร้อมกัน
+            write_job_manifest(entry.name, **{key: value for key, value in manifest.items()
+                                              if key not in ("task_id", "owner", "created_at")})
+            if requeue(manifest):
+                report.requeued.append(entry.name)
+                continue
+
+        report.purged_temp.append(entry.name)
+        report.freed_bytes += _directory_size(entry.path)
+        if not dry_run:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def reconcile_journals(report: ReconcileReport, roll_forward: Callable[[dict], None] = None, dry_run: bool = False):
+    """
+    ทำงานใน journal ของ worker ที่ตายแล้วต่อจนจบ (roll forward) ทุกขั้นตอนของ roll_forward ต้องทำซ้ำได้
+    roll_forward=None (CLI) เก็บ journal ไว้ให้ server ทำตอนเริ่มครั้งถัดไป
+    """
+    if roll_forward is None or not os.path.isdir(JOURNAL_DIR):
+        return
+    for entry in sorted(os.scandir(JOURNAL_DIR), key=lambda entry: entry.name):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            continue  # staging ที่เขียนไม่จบ: งานยังไม่ได้เริ่มแก้อะไร
+        if worker_lease.is_alive(journal.get("owner", "")):
+            continue
+        report.checked += 1
+        report.rolled_forward.append(journal["job_id"])
+        if dry_run:
+            continue
+        journal["owner"] = worker_lease.worker_id
+        write_journal(**{key: value for key, value in journal.items() if key not in ("owner", "created_at")})
+        try:
+            roll_forward(journal)
+        except Exception as e:
+            logger.error(f"Could not roll forward journal {journal['job_id']}: {e}")
+            continue
+        remove_journal(journal["job_id"])
+
+
+def _load_manifest() -> dict:
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(manifest: dict):
+    staging = f"{MANIFEST_PATH}.tmp"
+    with open(staging, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(staging, MANIFEST_PATH)
+
+
+def _changed_entries(root: str, manifest: dict, full: bool = False) -> dict:
+    """
+    {โฟลเดอร์ย่อย: (ชื่อที่เพิ่มขึ้น/หายไปตั้งแต่ตรวจครั้งก่อน)} เฉพาะโฟลเดอร์ย่อยที่ mtime เปลี่ยน
+    (เพิ่ม/ลบไฟล์ทำให้ mtime ของโฟลเดอร์เปลี่ยน) และอัปเดต manifest ไปด้วย
+    """
+    changed = {}
+    if not os.path.isdir(root):
+        return changed
+    seen = set()
+    for entry in os.scandir(root):
+        if not entry.is_dir():
+            continue
+        seen.add(entry.name)
+        mtime = entry.stat().st_mtime_ns
+        previous = manifest.get(entry.name)
+        if not full and previous and previous[0] == mtime:
+            continue
+        names = sorted(os.listdir(entry.path))
+        old_names = set(previous[1]) if previous else set()
+        changed[entry.name] = set(names) ^ old_names if not full else set(names) | old_names
+        manifest[entry.name] = [mtime, names]
+    for name in set(manifest) - seen:
+        changed[name] = set(manifest.pop(name)[1])
+    return changed
+
+
+def reconcile_storage(report: ReconcileReport, full: bool = False, dry_run: bool = False):
+    """
+    เทียบ object store/storage เก่ากับตาราง File เฉพาะรายการที่เปลี่ยน (journal ของ blob store + โฟลเดอร์ที่ mtime เปลี่ยน)
+    full=True ตรวจทุกโฟลเดอร์ (ครั้งแรกที่ยังไม่มี manifest จะเป็นแบบนี้อยู่แล้ว)
+    """
+    manifest = _load_manifest()
+    objects_manifest = manifest.setdefault("objects", {})
+    storage_manifest = manifest.setdefault("storage", {})
+
+    candidates = take_dirty()
+    staging = []
+    for prefix, names in _changed_entries(OBJECTS_DIR, objects_manifest, full).items():
+        for name in names:
+            if name.endswith(".tmp"):
+                staging.append((prefix, name))  # staging file ของ put_file(move=False) ที่อาจค้างจาก process ที่ตาย
+            else:
+                candidates.add(prefix + name)
+    changed_storage = _changed_entries(LEGACY_STORAGE_DIR, storage_manifest, full)
+
+    now = time.time()
+    retry = []
+    session = get_session_internal()
+    try:
+        for content_hash in sorted(candidates):
+            report.checked += 1
+            path = object_path(content_hash)
+            references = session.exec(
+                select(func.count()).select_from(File).where(File.content_hash == content_hash)
+            ).one()
+            if os.path.exists(path) and not references:
+                if now - os.path.getmtime(path) < ORPHAN_GRACE:
+                    retry.append(content_hash)  # อาจยังอยู่ระหว่าง DB stage ตรวจใหม่รอบหน้า
+                    continue
+                size = os.path.getsize(path)
+                # release ตรวจการอ้างอิงและ mtime ซ้ำภายใต้ lock: ระหว่างนี้อาจมีงานอัปโหลด dedup เข้ามาที่ object นี้
+                if not dry_run and not release(content_hash, session, ORPHAN_GRACE):
+                    retry.append(content_hash)
+                    continue
+                report.purged_objects.append(content_hash)
+                report.freed_bytes += size
+            elif references and not os.path.exists(path):
+                file_ids = session.exec(select(File.id).where(File.content_hash == content_hash)).all()
+                report.missing_objects.extend(file_ids)
+
+        for folder_name, names in changed_storage.items():
+            folder = session.exec(select(Folder).where(Folder.name == folder_name)).first()
+            for name in sorted(names):
+                report.checked += 1
+                exists = os.path.exists(os.path.join(LEGACY_STORAGE_DIR, folder_name, name))
+                row = session.exec(
+                    select(File.id).where(File.folder_id == (folder.id if folder else -1), File.name == name,
+                                          File.content_hash.is_(None))
+                ).first() if folder else None
+                if exists and row is None:
+                    report.untracked_files.append(os.path.join(folder_name, name))
+                elif row is not None and not exists:
+                    report.missing_objects.append(row)
+
+        for prefix, name in staging:
+            path = os.path.join(OBJECTS_DIR, prefix, name)
+            if not os.path.exists(path):
+                continue
+            if now - os.path.getmtime(path) < ORPHAN_GRACE:
+                # ยังไม่นับว่าเห็นแล้วใน manifest รอบหน้าจะถูกตรวจอีกครั้งแม้โฟลเดอร์ไม่เปลี่ยน
+                objects_manifest[prefix][1].remove(name)
+                continue
+            report.freed_bytes += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+    finally:
+        session.close()
+
+    if dry_run:
+        mark_dirty(*candidates)  # ไม่ได้แก้อะไร ให้รอบจริงตรวจรายการเดิมอีกครั้ง
+    else:
+        mark_dirty(*retry)
+        _save_manifest(manifest)
+
+
+def reconcile(requeue: Callable[[dict], bool] = None, full: bool = False, dry_run: bool = False,
+              roll_forward: Callable[[dict], None] = None) -> ReconcileReport:
+    """ตรวจ journal, temp และ storage ครั้งเดียว (ทีละ worker ผ่าน file lock)"""
+    report = ReconcileReport()
+    started = time.monotonic()
+    with file_lock(RECONCILE_LOCK_PATH):
+        reconcile_journals(report, roll_forward, dry_run)  # ก่อน storage: journal ลบ/ย้ายไฟล์ที่ storage จะตรวจ
+        reconcile_temp(report, requeue, dry_run)
+        reconcile_storage(report, full, dry_run)
+    if report.requeued or report.purged_temp or report.purged_objects or report.missing_objects or report.rolled_forward:
+        logger.warning(f"Reconciled storage in {time.monotonic() - started:.2f}s: "
+                       f"rolled forward {len(report.rolled_forward)} journals, requeued {len(report.requeued)} scans, purged {len(report.purged_temp)} temp folders and "
+                       f"{len(report.purged_objects)} objects ({report.freed_bytes / 1e6:.1f} MB), "
+                       f"{len(report.missing_objects)} files missing on disk: {report.missing_objects}")
+    return report
+
+
+class Reconciler:
+    """thread ที่เรียก reconcile ตอนเริ่ม worker แล้วทุก RECONCILE_INTERVAL วินาที (0 = ตอนเริ่มอย่างเดียว)"""
+
+    def __init__(self, interval: int = RECONCILE_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_report = None
+
+    def start(self, requeue: Callable[[dict], bool] = None, roll_forward: Callable[[dict], None] = None):
+        if self._thread is not None:
+            return
+
+        def run():
+            # ไม่ทำใน lifespan ตรง ๆ ครั้งแรกที่ยังไม่มี manifest ต้องเดินทั้ง object store ซึ่งอาจนาน
+            while True:
+                try:
+                    self.last_report = reconcile(requeue, roll_forward=roll_forward)
+                except Exception as e:
+                    logger.error(f"Reconcile failed: {e}")
+                if self.interval <= 0 or self._stop.wait(self.interval):
+                    break
+
+        self._thread = threading.Thread(target=run, name="reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+reconciler = Reconciler()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find interrupted scans and storage that no longer matches the database")
+    parser.add_argument("--full", action="store_true", help="check every storage folder, not only changed ones")
+    parser.add_argument("--dry-run", action="store_true", help="report only, do not delete anything")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    # CLI ไม่มี scan worker จึงไม่ส่งงานเข้าคิวใหม่ งานและ journal ที่ค้างจะถูกทำต่อตอน server เริ่มครั้งถัดไป
+    result = reconcile(full=args.full, dry_run=args.dry_run)
+    print(json.dumps(result.as_dict(), indent=4, ensure_ascii=False))
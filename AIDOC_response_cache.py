@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from sqlmodel import Session
+
+from model.AIDOC_cacheVersionModel import CacheVersion
+
+# key -> (version, payload ที่แปลงเป็น JSON แล้ว)
+RESPONSE_CACHE_SIZE = 1024
+CACHE_CONTROL = "private, no-cache"
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_cache_version(session: Session, name: str) -> int:
+    cache_version = session.get(CacheVersion, name)
+    return cache_version.version if cache_version else 0
+
+
+def _etag_matches(header_value: str, etag: str) -> bool:
+    return any(tag.strip() in (etag, "*") for tag in header_value.split(","))
+
+
+def cached_response(request: Request, session: Session, version_name: str, key: str, build: Callable) -> Response:
+    """
+    ส่ง response จาก cache ในหน่วยความจำถ้า version ใน DB ยังไม่เปลี่ยน
+    version ถูกเพิ่มทุกครั้งที่ข้อมูลเปลี่ยน (bump_cache_version) จึงใช้เป็น ETag ได้ด้วย
+    """
+    version = get_cache_version(session, version_name)
+    etag = f'"{key}-v{version}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(key)
+            return JSONResponse(entry[1], headers=headers)
+
+    payload = jsonable_encoder(build())
+    with _cache_lock:
+        _cache[key] = (version, payload)
+        _cache.move_to_end(key)
+        while len(_cache) > RESPONSE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return JSONResponse(payload, headers=headers)
@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Callable
+
+from AIDOC_ocr_backend import OCR_WORKERS
+from AIDOC_serving import scan_tracker
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)  # เรียงจากสำคัญมากไปน้อย
+
+SCAN_WORKERS = int(os.environ.get("AIDOC_SCAN_WORKERS", 4))
+# จำนวน worker ที่งาน bulk ใช้ไม่ได้ เก็บไว้ให้อัปโหลดเดี่ยวเริ่มได้ทันทีแม้มีงาน bulk ค้างเป็นร้อย
+INTERACTIVE_RESERVED = int(os.environ.get("AIDOC_INTERACTIVE_RESERVED", 1))
+# อัปโหลดที่มีไฟล์ตั้งแต่จำนวนนี้ขึ้นไป (หรือผู้อัปโหลดที่มีงานค้างถึงจำนวนนี้) ถือเป็น bulk
+BULK_THRESHOLD = int(os.environ.get("AIDOC_BULK_THRESHOLD", 2))
+OCR_CONCURRENCY = int(os.environ.get("AIDOC_OCR_CONCURRENCY", OCR_WORKERS))  # CPU-bound
+LLM_CONCURRENCY = int(os.environ.get("AIDOC_LLM_CONCURRENCY", 8))            # รอ network
+WAIT_SAMPLES = 1000
+
+_context = threading.local()
+
+
+def current_priority() -> str:
+    """priority ของงานที่ thread นี้ทำอยู่ (งานที่ไม่ได้มาจาก scheduler เช่น /reclassify ถือเป็น bulk)"""
+    return getattr(_context, "priority", PRIORITY_BULK)
+
+
+class WaitStats:
+    """สถิติเวลารอของงานล่าสุด WAIT_SAMPLES งาน"""
+
+    def __init__(self):
+        self._samples = deque(maxlen=WAIT_SAMPLES)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self._count += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        if not samples:
+            return {"count": count, "avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {
+            "count": count,
+            "avg_ms": round(sum(samples) / len(samples) * 1000, 1),
+            "p95_ms": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1)
+        }
+
+
+class StageLimiter:
+    """
+    จำกัดจำนวนงานที่อยู่ใน stage หนึ่งพร้อมกัน (เช่น OCR ใช้ CPU, LLM รอ network)
+    ถ้ามีงาน interactive รอ stage อยู่ งาน bulk จะไม่ได้ช่องว่างจนกว่างาน interactive จะเข้าไปก่อน
+    slot() ใช้จาก thread ปกติ, async_slot() ใช้จาก coroutine (รอโดยไม่ block event loop) นับรวมใน limit เดียวกัน
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(limit, 1)
+        self._active = 0
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._condition = threading.Condition()
+        self._async_waiters = []  # future ของ coroutine ที่รอช่อง (ปลุกตอนมีช่องว่าง)
+        self.wait_stats = {priority: WaitStats() for priority in PRIORITIES}
+
+    def set_limit(self, limit: int):
+        """เปลี่ยนจำนวนงานพร้อมกันระหว่างทำงานได้ (งานที่รออยู่ได้ช่องเพิ่มทันที)"""
+        with self._condition:
+            self.limit = max(limit, 1)
+            self._notify_all()
+
+    def _notify_all(self):
+        """เรียกขณะถือ _condition"""
+        self._condition.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+
+    def _blocked(self, priority: str) -> bool:
+        if self._active >= self.limit:
+            return True
+        higher = PRIORITIES[:PRIORITIES.index(priority)]
+        return any(self._waiting[other] for other in higher)
+
+    @contextmanager
+    def slot(self, priority: str = None):
+        priority = priority or current_priority()
+        started = time.monotonic()
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while self._blocked(priority):
+                    self._condition.wait()
+            finally:
+                self._waiting[priority] -= 1
+            self._active += 1
+        self.wait_stats[priority].add(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._leave()
+
+    @asynccontextmanager
+    async def async_slot(self, priority: str = None):
+        priority = priority or current_priority()
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._condition:
+                    if not self._blocked(priority):
+                        self._active += 1
+                        break
+                    future = loop.create_future()
+                    self._async_waiters.append((loop, future))
+                await future
+        finally:
+            with self._condition:
+                self._waiting[priority] -= 1
+                self._notify_all()  # งานที่รอหลังงานนี้ (priority ต่ำกว่า) อาจเข้าได้แล้ว
+        self.wait_stats[priority].add(time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._leave()
+
+    def _leave(self):
+        with self._condition:
+            self._active -= 1
+            self._notify_all()
+
+    def metrics(self) -> dict:
+        with self._condition:
+            active, waiting = self._active, dict(self._waiting)
+        return {
+            "limit": self.limit,
+            "active": active,
+            "waiting": waiting,
+            "wait": {priority: stats.summary() for priority, stats in self.wait_stats.items()}
+        }
+
+
+ocr_stage = StageLimiter("ocr", OCR_CONCURRENCY)
+llm_stage = StageLimiter("llm", LLM_CONCURRENCY)
+
+
+@dataclass
+class ScanJob:
+    task_id: str
+    uploader: str
+    priority: str
+    function: Callable
+    args: tuple
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class ScanScheduler:
+    """
+    คิวงานสแกนแยกตาม priority และผู้อัปโหลด
+        - interactive ได้ worker ก่อนเสมอ และ bulk ใช้ worker ได้ไม่เกิน workers - reserved
+        - ในแต่ละ priority หยิบงานวนทีละผู้อัปโหลด (round robin) คนที่อัปโหลด 300 ไฟล์จึงไม่บังคนอื่น
+    """
+
+    def __init__(self, workers: int = SCAN_WORKERS, interactive_reserved: int = INTERACTIVE_RESERVED):
+        self.workers = max(workers, 1)
+        self.bulk_limit = max(self.workers - interactive_reserved, 1)
+        # priority -> {uploader: deque ของงาน} ลำดับของ uploader คือลำดับ round robin
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._condition = threading.Condition()
+        self._threads = []
+        self.wait_stats = {priority: WaitStats() for priority in PRIORITIES}
+
+    def configure(self, workers: int, interactive_reserved: int = INTERACTIVE_RESERVED):
+        """
+        เปลี่ยนจำนวน worker และจำนวนที่กันไว้ให้งาน interactive (เช่น import-archive ที่มีแต่งาน bulk ใช้ 0)
+        ถ้า worker เริ่มไปแล้วจะเพิ่ม thread ให้ครบ (ลดจำนวน thread ไม่ได้ แต่ bulk_limit ยังจำกัดงาน bulk)
+        """
+        with self._condition:
+            self.workers = max(workers, 1)
+            self.bulk_limit = max(self.workers - interactive_reserved, 1)
+            if self._threads:
+                self._ensure_started()
+            self._condition.notify_all()
+
+    def _ensure_started(self):
+        for number in range(len(self._threads), self.workers):
+            thread = threading.Thread(target=self._run, name=f"scan-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def pending(self, uploader: str) -> int:
+        with self._condition:
+            return sum(len(queue.get(uploader, ())) for queue in self._queues.values())
+
+    def classify_priority(self, uploader: str, batch_size: int) -> str:
+        """อัปโหลดเดี่ยวเป็น interactive ยกเว้นผู้อัปโหลดที่ส่งไฟล์ทีละไฟล์ต่อเนื่องจนมีงานค้างเยอะ"""
+        if batch_size >= BULK_THRESHOLD or self.pending(uploader) >= BULK_THRESHOLD:
+            return PRIORITY_BULK
+        return PRIORITY_INTERACTIVE
+
+    def submit(self, task_id: str, function: Callable, *args, uploader: str = "anonymous",
+               priority: str = PRIORITY_BULK) -> int:
+        """เข้าคิวงาน คืนจำนวนงานที่รออยู่ใน priority เดียวกัน (รวมงานนี้)"""
+        scan_tracker.add(task_id)  # ตอนปิด server ต้องรองานที่ยังไม่เริ่มด้วย (done เมื่อ worker ทำเสร็จ)
+        job = ScanJob(task_id, uploader, priority, function, args)
+        with self._condition:
+            self._ensure_started()
+            self._queues[priority].setdefault(uploader, deque()).append(job)
+            depth = sum(len(jobs) for jobs in self._queues[priority].values())
+            self._condition.notify()
+        logger.debug(f"Queued scan {task_id} from {uploader} as {priority} (depth {depth})")
+        return depth
+
+    def _next_job(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            if priority == PRIORITY_BULK and self._running[PRIORITY_BULK] >= self.bulk_limit:
+                continue
+            uploader, jobs = next(iter(queue.items()))
+            job = jobs.popleft()
+            if jobs:
+                queue.move_to_end(uploader)  # ผู้อัปโหลดคนถัดไปได้คิวก่อน
+            else:
+                del queue[uploader]
+            self._running[priority] += 1
+            return job
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+            self.wait_stats[job.priority].add(time.monotonic() - job.enqueued_at)
+            _context.priority = job.priority
+            try:
+                job.function(*job.args)
+            except Exception as e:
+                logger.error(f"Scan {job.task_id} failed in the scheduler: {e}")
+            finally:
+                scan_tracker.done(job.task_id)
+                _context.priority = PRIORITY_BULK
+                with self._condition:
+                    self._running[job.priority] -= 1
+                    self._condition.notify_all()
+
+    def metrics(self) -> dict:
+        with self._condition:
+            queues = {
+                priority: {
+                    "depth": sum(len(jobs) for jobs in queue.values()),
+                    "uploaders": {uploader: len(jobs) for uploader, jobs in queue.items()}
+                }
+                for priority, queue in self._queues.items()
+            }
+            running = dict(self._running)
+        return {
+            "workers": self.workers,
+            "bulk_limit": self.bulk_limit,
+            "running": running,
+            "queues": queues,
+            "queue_wait": {priority: stats.summary() for priority, stats in self.wait_stats.items()},
+            "stages": {stage.name: stage.metrics() for stage in (ocr_stage, llm_stage)}
+        }
+
+
+scan_scheduler = ScanScheduler()
@@ -0,0 +1,150 @@
+import logging
+import re
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from AIDOC_database import engine
+
+logger = logging.getLogger(__name__)
+
+# trigram tokenizer = character 3-gram ใช้กับภาษาไทยที่ไม่มีช่องว่างได้ (clean_text ลบช่องว่างออกหมดแล้ว)
+# ใช้ external content ชี้ไปที่ตาราง pagetext แล้วให้ trigger ดูแลให้ index ตรงกับข้อมูลเสมอ
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS pagetext_fts USING fts5(
+        text, content='pagetext', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pagetext_ai AFTER INSERT ON pagetext BEGIN
+        INSERT INTO pagetext_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pagetext_ad AFTER DELETE ON pagetext BEGIN
+        INSERT INTO pagetext_fts(pagetext_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pagetext_au AFTER UPDATE ON pagetext BEGIN
+        INSERT INTO pagetext_fts(pagetext_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO pagetext_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+SNIPPET_TOKENS = 24
+MIN_TRIGRAM_QUERY = 3
+
+_search_available = False
+
+
+def create_search_index():
+    """Create the FTS5 index and its sync triggers (needs SQLite >= 3.34 for the trigram tokenizer)."""
+    global _search_available
+    try:
+        with engine.begin() as connection:
+            for statement in SEARCH_INDEX_DDL:
+                connection.execute(text(statement))
+        _search_available = True
+    except Exception as e:
+        logger.error(f"Full-text search is disabled, could not create FTS5 index: {e}")
+        _search_available = False
+
+
+def search_index_available() -> bool:
+    return _search_available
+
+
+def normalize_query(query: str) -> str:
+    """ข้อความใน index ไม่มีช่องว่าง จึงลบช่องว่างในคำค้นออกด้วย"""
+    return re.sub(r'\s+', '', query)
+
+
+def _fts_phrase(query: str) -> str:
+    return '"' + query.replace('"', '""') + '"'
+
+
+def search_pages(session: Session, query: str, page: int = 1, page_size: int = 20) -> dict:
+    """
+    ค้นหาเอกสารจากข้อความ OCR เรียงตาม bm25 (หน้าที่ตรงที่สุดของแต่ละไฟล์)
+    คืนค่า {"total", "page", "page_size", "results": [...]}
+    """
+    query = normalize_query(query)
+    offset = (page - 1) * page_size
+
+    if len(query) >= MIN_TRIGRAM_QUERY:
+        match_clause = "pagetext_fts MATCH :query"
+        params = {"query": _fts_phrase(query)}
+        rank_expression = "bm25(pagetext_fts)"
+    else:
+        # คำค้นสั้นกว่า 3 ตัวอักษรใช้ trigram ไม่ได้ จึงสแกนด้วย LIKE แทน
+        match_clause = "pagetext_fts.text LIKE :query ESCAPE '\\'"
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params = {"query": f"%{escaped}%"}
+        rank_expression = "0"
+
+    ranked = session.connection().execute(text(f"""
+        WITH hits AS (
+            SELECT pagetext_fts.rowid AS page_text_id, {rank_expression} AS rank
+            FROM pagetext_fts WHERE {match_clause}
+        ),
+        best AS (
+            SELECT p.file_id, p.page, h.page_text_id, h.rank,
+                   ROW_NUMBER() OVER (PARTITION BY p.file_id ORDER BY h.rank, p.page) AS position
+            FROM hits h JOIN pagetext p ON p.id = h.page_text_id
+        )
+        SELECT b.file_id, f.name, f.folder_id, f.accuracy, b.page, b.page_text_id, b.rank,
+               COUNT(*) OVER () AS total
+        FROM best b JOIN file f ON f.id = b.file_id
+        WHERE b.position = 1
+        ORDER BY b.rank, b.file_id
+        LIMIT :limit OFFSET :offset
+    """), {**params, "limit": page_size, "offset": offset}).mappings().all()
+
+    snippets = {}
+    if ranked and len(query) >= MIN_TRIGRAM_QUERY:
+        # snippet เฉพาะแถวในหน้าผลลัพธ์นี้ ไม่ต้องสร้างให้ทุก hit
+        ids = [row["page_text_id"] for row in ranked]
+        placeholders = ", ".join(f":id{i}" for i in range(len(ids)))
+        rows = session.connection().execute(text(f"""
+            SELECT rowid, snippet(pagetext_fts, 0, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet
+            FROM pagetext_fts WHERE pagetext_fts MATCH :query AND rowid IN ({placeholders})
+        """), {**params, **{f"id{i}": page_text_id for i, page_text_id in enumerate(ids)}}).mappings().all()
+        snippets = {row["rowid"]: row["snippet"] for row in rows}
+
+    results = []
+    for row in ranked:
+        snippet = snippets.get(row["page_text_id"])
+        if snippet is None:
+            snippet = _like_snippet(session, row["page_text_id"], query)
+        results.append({
+            "file_id": row["file_id"],
+            "name": row["name"],
+            "folder_id": row["folder_id"],
+            "accuracy": row["accuracy"],
+            "page": row["page"],
+            "score": -row["rank"] if row["rank"] else 0.0,
+            "snippet": snippet,
+        })
+
+    return {
+        "total": ranked[0]["total"] if ranked else 0,
+        "page": page,
+        "page_size": page_size,
+        "results": results,
+    }
+
+
+def _like_snippet(session: Session, page_text_id: int, query: str, width: int = 40) -> str:
+    page_text = session.connection().execute(
+        text("SELECT text FROM pagetext WHERE id = :id"), {"id": page_text_id}
+    ).scalar() or ""
+    index = page_text.lower().find(query.lower())
+    if index < 0:
+        return page_text[:width * 2]
+    start = max(index - width, 0)
+    end = index + len(query)
+    return ("…" if start else "") + page_text[start:index] + "<mark>" + page_text[index:end] + "</mark>" \
+        + page_text[end:end + width] + ("…" if end + width < len(page_text) else "")
@@ -0,0 +1,122 @@
+import logging
+import os
+import platform
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlmodel import select
+
+from AIDOC_database import create_db_and_tables, first_folder_set, get_session_internal
+from AIDOC_search import create_search_index
+from model.AIDOC_folderModel import Folder
+
+logger = logging.getLogger(__name__)
+
+STARTUP_LOCK_PATH = "database/.startup.lock"
+# เวลาที่รอให้งานสแกนที่ค้างอยู่ทำเสร็จก่อนปิด worker (วินาที)
+DRAIN_TIMEOUT = int(os.environ.get("AIDOC_DRAIN_TIMEOUT", 120))
+
+
+@contextmanager
+def file_lock(path: str = STARTUP_LOCK_PATH):
+    """file lock ข้าม process (เช่น ให้ migration/seed ทำทีละ worker)"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a+") as lock_file:
+        if platform.system() == "Windows":
+            import msvcrt
+            while True:
+                try:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)  # LK_LOCK รอแค่ 10 วินาทีแล้ว error
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def run_startup_tasks():
+    """
+    สร้างตาราง/migration, index ค้นหา และโฟลเดอร์ชุดแรก
+    ทุกขั้นตอนเช็คก่อนทำ (idempotent) และอยู่ใต้ file lock จึงเรียกจากหลาย worker พร้อมกันได้
+    worker ที่ได้ lock ทีหลังจะเห็นว่าทำไปแล้วและข้ามไป
+    """
+    with file_lock():
+        create_db_and_tables()  # เรียกใช้งาน ฟังชัน สร้างฐานข้อมูล
+        create_search_index()   # สร้าง index สำหรับค้นหาข้อความ OCR (ต้องเรียกทุก worker เพื่อเช็คว่าใช้ได้)
+
+        session = get_session_internal()
+        try:
+            if not session.exec(select(Folder)).first():  # หากไม่มีโฟลเดอร์ให้สร้างโฟลเดอร์ชุดแรก
+                first_folder_set(session)
+        finally:
+            session.close()
+
+
+class ScanTracker:
+    """
+    นับงานสแกนที่กำลังทำอยู่ใน worker นี้ เพื่อให้ตอนปิด server รอให้งานเสร็จก่อน (graceful drain)
+    นับแบบ reference count: งานที่ส่งต่อระหว่างคิว/stage ถูก add ก่อนที่เจ้าของเดิมจะ done จึงไม่หลุดช่วงส่งต่อ
+    """
+
+    def __init__(self):
+        self._active = Counter()
+        self._condition = threading.Condition()
+        self.draining = False
+
+    @contextmanager
+    def track(self, task_id: str):
+        self.add(task_id)
+        try:
+            yield
+        finally:
+            self.done(task_id)
+
+    def add(self, task_id: str):
+        """ลงทะเบียนงาน (เช่น ตอนเข้าคิว) ต้องเรียก done() คู่กันเสมอ"""
+        with self._condition:
+            self._active[task_id] += 1
+
+    def done(self, task_id: str):
+        with self._condition:
+            self._active[task_id] -= 1
+            if self._active[task_id] <= 0:
+                del self._active[task_id]
+            self._condition.notify_all()
+
+    def active(self) -> int:
+        with self._condition:
+            return len(self._active)
+
+    def begin_drain(self):
+        self.draining = True
+
+    def wait_idle(self, timeout: float = DRAIN_TIMEOUT) -> bool:
+        """รอจนไม่มีงานค้าง คืน False ถ้าหมดเวลาก่อน"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Drain timed out with {len(self._active)} scans still running: {sorted(self._active)}")
+                    return False
+                logger.info(f"Waiting for {len(self._active)} running scans to finish")
+                self._condition.wait(remaining)
+        return True
+
+
+scan_tracker = ScanTracker()
@@ -1,133 +1,158 @@
-import pandas as pd
+import argparse
+import ast
+import csv
+import io
 import json
-import matplotlib.pyplot as plt
-
-
-def parse_accuracy(acc_text):
-    """Convert '[20, 5, 75]' into a Python list [20, 5, 75]."""
-    try:
-        return json.loads(acc_text.replace("'", '"'))
-    except (json.JSONDecodeError, TypeError):
-        return []
-
-
-def get_first_guess_index(scores):
-    """Return the index of the highest value in a list."""
-    if not scores or len(scores) < 3:
-        return None
-    sorted_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-    return sorted_indices[0]
-
-
-def get_second_guess_index(scores):
-    """Return the index of the second-highest value in a list."""
-    if not scores or len(scores) < 3:
-        return None
-    sorted_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-    return sorted_indices[1]
-
-
-def get_third_guess_index(scores):
-    """Return the index of the third-highest value in a list."""
-    if not scores or len(scores) < 3:
-        return None
-    sorted_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-    return sorted_indices[2]
-
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+from sqlmodel import Session, select
+
+from AIDOC_database import engine
+from AIDOC_statistics import GUESS_RANKS, LEGACY_FOLDERS
+from model.AIDOC_scanStatisticModel import ScanStatistic
+
+
+def score_matrix(accuracies: List[list], folders: List[list]):
+    """
+    แปลง accuracy ของทุกแถวเป็น matrix ความกว้างคงที่ (แถว = เอกสาร, คอลัมน์ = โฟลเดอร์)
+    แถวที่ใช้ลำดับโฟลเดอร์เดียวกันถูกแปลงพร้อมกันทีละกลุ่ม ช่องที่ไม่มีคะแนนเป็น -1
+    คืน (matrix, ลำดับของโฟลเดอร์ในแถวนั้น, ชื่อโฟลเดอร์ตามคอลัมน์, mask ของแถวที่อ่านคะแนนได้)
+    """
+    groups = {}
+    for row, (scores, names) in enumerate(zip(accuracies, folders)):
+        if scores and names and len(scores) == len(names):
+            groups.setdefault(tuple(names), []).append(row)
+
+    labels = []
+    for names in groups:
+        labels.extend(name for name in names if name not in labels)
+    columns = {name: column for column, name in enumerate(labels)}
+
+    shape = (len(accuracies), max(len(labels), 1))
+    matrix = np.full(shape, -1, dtype=np.int64)
+    positions = np.full(shape, shape[1], dtype=np.int64)
+    for names, rows in groups.items():
+        block = np.asarray([accuracies[row] for row in rows], dtype=np.int64)
+        cells = np.ix_(rows, [columns[name] for name in names])
+        matrix[cells] = block
+        positions[cells] = np.arange(len(names))
+    valid = (matrix >= 0).any(axis=1)
+    return matrix, positions, labels, valid
+
+
+def guess_report(accuracies: List[list], folders: List[list], keyword_counts: List[int]) -> dict:
+    """
+    first/second/third guess ของทุกเอกสารด้วย argsort ครั้งเดียวทั้ง matrix
+    ผลลัพธ์รูปแบบเดียวกับ AIDOC_statistics.guess_summary
+    """
+    matrix, positions, labels, valid = score_matrix(accuracies, folders)
+    matrix, positions = matrix[valid], positions[valid]
+    ranks = min(GUESS_RANKS, matrix.shape[1])
+    # เรียงคะแนนจากมากไปน้อย คะแนนเท่ากันให้โฟลเดอร์ที่อยู่ก่อนในแถวนั้นชนะ (เหมือน guess_summary)
+    order = np.argsort(-matrix * (matrix.shape[1] + 1) + positions, axis=1)[:, :ranks]
+    values = np.take_along_axis(matrix, order, axis=1)
+    present = values >= 0  # เอกสารที่มีโฟลเดอร์น้อยกว่า 3 จะไม่มี guess อันดับท้าย
+
+    score_totals = np.where(present, values, 0).sum(axis=0)
+    overall = int(score_totals.sum())
+    guesses = []
+    for rank in range(GUESS_RANKS):
+        if rank < ranks:
+            counts = np.bincount(order[present[:, rank], rank], minlength=len(labels))
+            score = int(score_totals[rank])
+        else:
+            counts, score = np.zeros(len(labels), dtype=np.int64), 0
+        guesses.append({
+            "rank": rank + 1,
+            "folders": {label: int(count) for label, count in zip(labels, counts) if count},
+            "score_total": score,
+            "confidence": round(score / overall * 100, 1) if overall else 0.0
+        })
+    return {
+        "documents": len(accuracies),
+        "documents_with_keywords": int(np.count_nonzero(np.asarray(keyword_counts, dtype=np.int64))),
+        "guesses": guesses
+    }
+
+
+def load_statistics(session: Session, since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """อ่านเฉพาะคอลัมน์ที่ใช้จากตาราง ScanStatistic (JSON ถูก decode ครั้งเดียวตอนอ่าน)"""
+    statement = select(ScanStatistic.accuracy, ScanStatistic.folders, ScanStatistic.keyword_count)
+    # created_at เก็บเป็น UTC เวลาที่ไม่ระบุ timezone ถือเป็นเวลาท้องถิ่น
+    if since:
+        statement = statement.where(ScanStatistic.created_at >= since.astimezone(timezone.utc))
+    if until:
+        statement = statement.where(ScanStatistic.created_at < until.astimezone(timezone.utc))
+    rows = session.exec(statement).all()
+    return [row[0] or [] for row in rows], [row[1] or [] for row in rows], [row[2] or 0 for row in rows]
+
+
+def load_legacy_csv(path: str):
+    """อ่าน statistics.csv แบบเก่า (คอลัมน์ 4 = keyword detail, 5 = accuracy)"""
+    accuracies, folders, keyword_counts = [], [], []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 5 or row[0].startswith("TOTAL"):
+                continue
+            try:
+                scores = ast.literal_eval(row[4])
+                details = ast.literal_eval(row[3]) if row[3] else {}
+            except (SyntaxError, ValueError):
+                scores, details = [], {}
+            if isinstance(details, (list, tuple)):
+                details = next((item for item in details if isinstance(item, dict)), {})
+            accuracies.append(list(scores) if isinstance(scores, (list, tuple)) else [])
+            folders.append(LEGACY_FOLDERS)
+            keyword_counts.append(len(details))
+    return accuracies, folders, keyword_counts
+
+
+def render_chart(report: dict) -> bytes:
+    """pie chart ของ first/second/third guess เป็น PNG (matplotlib backend Agg ไม่ต้องมีหน้าจอ)"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(1, GUESS_RANKS, figsize=(18, 6))
+    guess_types = ["First Guess", "Second Guess", "Third Guess"]
+    for ax, guess_type, guess in zip(axs, guess_types, report["guesses"]):
+        if guess["folders"]:
+            ax.pie(list(guess["folders"].values()), labels=list(guess["folders"]), autopct="%1.1f%%", startangle=140)
+        ax.set_title(f"{guess_type}\nOverall Confidence: {guess['confidence']:.1f}%")
 
-def has_keywords(details_text):
-    """Return 1 if the file contains at least one keyword, otherwise 0."""
-    try:
-        kw_dict = json.loads(details_text.replace("'", '"'))
-        return 1 if kw_dict else 0
-    except (json.JSONDecodeError, TypeError):
-        return 0
+    fig.suptitle("Combined Guess Distributions (by Folder & Confidence)")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=150)
+    plt.close(fig)
+    return buffer.getvalue()
 
 
 def main():
-    # 1) Read CSV without column names (ensuring correct column count)
-    df = pd.read_csv("database/statistics.csv", header=None, usecols=[0, 1, 2, 3, 4])
-    df = df[df[0] != "TOTAL"].copy()
-
-    # Parse accuracy array from column 4
-    df["AccuracyArray"] = df[4].apply(parse_accuracy)
-
-    # Compute sorted scores for each file (if exactly 3 values exist, otherwise default to zeros)
-    df["SortedScores"] = df["AccuracyArray"].apply(
-        lambda s: sorted(s, reverse=True) if (s and len(s) == 3) else [0, 0, 0])
-    df["FirstGuessValue"] = df["SortedScores"].apply(lambda s: s[0])
-    df["SecondGuessValue"] = df["SortedScores"].apply(lambda s: s[1])
-    df["ThirdGuessValue"] = df["SortedScores"].apply(lambda s: s[2])
-
-    # Also compute guess indices per file for folder mapping
-    df["FirstGuessIndex"] = df["AccuracyArray"].apply(get_first_guess_index)
-    df["SecondGuessIndex"] = df["AccuracyArray"].apply(get_second_guess_index)
-    df["ThirdGuessIndex"] = df["AccuracyArray"].apply(get_third_guess_index)
-
-    # Folder labels for mapping indices [0, 1, 2]
-    folder_labels = ["MobileApp", "HardwareIOT", "WebApp"]
-
-    # -------------------
-    # Calculate Distribution by Folder (File Count)
-    # -------------------
-    first_guess_counts = df["FirstGuessIndex"].value_counts().sort_index()
-    second_guess_counts = df["SecondGuessIndex"].value_counts().sort_index()
-    third_guess_counts = df["ThirdGuessIndex"].value_counts().sort_index()
-
-    first_guess_data = [first_guess_counts.get(i, 0) for i in range(len(folder_labels))]
-    second_guess_data = [second_guess_counts.get(i, 0) for i in range(len(folder_labels))]
-    third_guess_data = [third_guess_counts.get(i, 0) for i in range(len(folder_labels))]
-
-    # -------------------
-    # Calculate Overall Confidence Percentages using the score values
-    # -------------------
-    total_first_value = df["FirstGuessValue"].sum()
-    total_second_value = df["SecondGuessValue"].sum()
-    total_third_value = df["ThirdGuessValue"].sum()
-    overall_total = total_first_value + total_second_value + total_third_value
-
-    first_percentage = (total_first_value / overall_total * 100) if overall_total else 0
-    second_percentage = (total_second_value / overall_total * 100) if overall_total else 0
-    third_percentage = (total_third_value / overall_total * 100) if overall_total else 0
-
-    # -------------------
-    # Combined Guess Distribution Chart with Overall Percentages
-    # -------------------
-    fig, axs = plt.subplots(1, 3, figsize=(18, 6))
-    guess_types = ["First Guess", "Second Guess", "Third Guess"]
-    guess_data_list = [first_guess_data, second_guess_data, third_guess_data]
-    overall_percentages = [first_percentage, second_percentage, third_percentage]
-
-    for ax, guess_type, data, percentage in zip(axs, guess_types, guess_data_list, overall_percentages):
-        ax.pie(data, labels=folder_labels, autopct="%1.1f%%", startangle=140)
-        ax.set_title(f"{guess_type}\nOverall Confidence: {percentage:.1f}%")
-
-    plt.suptitle("Combined Guess Distributions (by Folder & Confidence)")
-    plt.savefig("guess_distribution_combined.png", dpi=150)
-    plt.close()
-
-    # -------------------
-    # Count files that contained at least one keyword
-    # -------------------
-    df["HasKeywords"] = df[3].apply(has_keywords)
-    num_files_with_keywords = df["HasKeywords"].sum()
-
-    # -------------------
-    # Save updated statistics with a 'TOTAL' row for keywords
-    # -------------------
-    summary_row = pd.DataFrame([["TOTAL_KEYWORD_FOUND", "", num_files_with_keywords, "", ""]])
-    df_updated = pd.concat([df, summary_row], ignore_index=True)
-    df_updated.to_csv("database/statistics_updated.csv", index=False, header=False, encoding="utf-8-sig")
-
-    # Print summary information to the console
-    print("=== Statistics Updated ===")
-    print(" - Combined guess distribution image saved as 'guess_distribution_combined.png'")
-    print(f" - Overall Confidence Percentages:")
-    print(f"    First Guess: {first_percentage:.1f}%")
-    print(f"    Second Guess: {second_percentage:.1f}%")
-    print(f"    Third Guess: {third_percentage:.1f}%")
-    print(" - database/statistics_updated.csv updated")
-    print(f" - {num_files_with_keywords} files contained keywords")
+    parser = argparse.ArgumentParser(description="Summarise first/second/third guess statistics")
+    parser.add_argument("--csv", default=None, help="read a legacy statistics.csv instead of the database")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--png", default="guess_distribution_combined.png", help="chart output ('' to skip)")
+    args = parser.parse_args()
+
+    if args.csv:
+        data = load_legacy_csv(args.csv)
+    else:
+        with Session(engine) as session:
+            data = load_statistics(session, args.since, args.until)
+    report = guess_report(*data)
+
+    if args.png:
+        with open(args.png, "wb") as f:
+            f.write(render_chart(report))
+
+    print("=== Statistics ===")
+    print(json.dumps(report, indent=4, ensure_ascii=False))
+    if args.png:
+        print(f" - Combined guess distribution image saved as '{args.png}'")
+    print(f" - {report['documents_with_keywords']} of {report['documents']} files contained keywords")
 
 
 if __name__ == "__main__":
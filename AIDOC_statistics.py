@@ -0,0 +1,259 @@
+import argparse
+import ast
+import atexit
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+
+from AIDOC_database import create_db_and_tables, engine
+from model.AIDOC_scanStatisticModel import ScanStatistic
+from model.AIDOC_statisticCounterModel import StatisticCounter
+
+logger = logging.getLogger(__name__)
+
+STATISTICS_BATCH_SIZE = int(os.environ.get("AIDOC_STATISTICS_BATCH_SIZE", 100))
+STATISTICS_FLUSH_INTERVAL = float(os.environ.get("AIDOC_STATISTICS_FLUSH_INTERVAL", 2.0))
+GUESS_RANKS = 3
+# โฟลเดอร์ชุดแรก ใช้กับสถิติเก่าใน statistics.csv ที่ไม่ได้บันทึกรายชื่อโฟลเดอร์ไว้
+LEGACY_FOLDERS = ["MobileApp", "HardwareIOT", "WebApp"]
+
+
+def parse_scores(accuracy) -> List[int]:
+    """รับ [80, 15, 5] หรือ '[80, 15, 5]' คืน list ของ int (อ่านไม่ได้คืน [])"""
+    if isinstance(accuracy, str):
+        try:
+            accuracy = ast.literal_eval(accuracy)
+        except (SyntaxError, ValueError):
+            return []
+    try:
+        return [int(score) for score in accuracy]
+    except (TypeError, ValueError):
+        return []
+
+
+def ranked_guesses(scores: List[int]) -> List[int]:
+    """index ของคะแนนสูงสุด 3 อันดับแรก (คะแนนเท่ากันให้ index น้อยกว่ามาก่อน)"""
+    return sorted(range(len(scores)), key=lambda i: -scores[i])[:GUESS_RANKS]
+
+
+def statistic_counters(statistic: ScanStatistic) -> Counter:
+    """ค่าที่ต้องบวกเพิ่มใน StatisticCounter สำหรับ 1 แถว"""
+    counters = Counter({"documents": 1})
+    if statistic.keyword_count:
+        counters["documents_with_keywords"] += 1
+    scores = statistic.accuracy or []
+    folders = statistic.folders or []
+    for rank, index in enumerate(ranked_guesses(scores), start=1):
+        folder = folders[index] if index < len(folders) else f"#{index}"
+        counters[f"guess{rank}.folder.{folder}"] += 1
+        counters[f"guess{rank}.score"] += scores[index]
+    return counters
+
+
+def increment_counters(session: Session, counters: Dict[str, int]):
+    """บวกค่าเข้า StatisticCounter แบบ upsert (ไม่ commit เอง ให้ผู้เรียก commit)"""
+    for name, value in counters.items():
+        statement = sqlite_insert(StatisticCounter).values(name=name, value=value)
+        statement = statement.on_conflict_do_update(
+            index_elements=[StatisticCounter.name],
+            set_={"value": StatisticCounter.value + value}
+        )
+        session.execute(statement)
+
+
+def write_statistics(statistics: List[ScanStatistic]):
+    """เขียนทั้ง batch และอัปเดตตัวนับใน transaction เดียว"""
+    counters = Counter()
+    for statistic in statistics:
+        counters.update(statistic_counters(statistic))
+    with Session(engine) as session:
+        session.add_all(statistics)
+        increment_counters(session, counters)
+        session.commit()
+
+
+class StatisticsWriter:
+    """
+    thread เดียวที่เขียนสถิติลง DB ทีละ batch
+    งานสแกนแค่ใส่แถวลง queue (ไม่ต้องรอ DB) และไม่มีหลาย thread เขียนไฟล์/ตารางพร้อมกัน
+    """
+
+    def __init__(self, batch_size: int = STATISTICS_BATCH_SIZE, flush_interval: float = STATISTICS_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, statistic: ScanStatistic):
+        self._ensure_started()
+        self._queue.put(statistic)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="statistics-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    write_statistics(batch)
+            except Exception as e:
+                logger.error(f"Could not write {len(batch)} statistics rows: {e}")
+            finally:
+                for _ in range(len(batch) + (1 if stopping else 0)):
+                    self._queue.task_done()
+
+    def flush(self):
+        """รอจนแถวที่อยู่ใน queue ถูกเขียนลง DB ครบ"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: float = 10):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+
+statistics_writer = StatisticsWriter()
+atexit.register(statistics_writer.close)
+
+
+def record_scan(file_name: str, found_keywords: dict, accuracy, label: str = None, folders: list = None):
+    """
+    บันทึกสถิติของการสแกน 1 ครั้ง found_keywords คือ {'keyword': [หน้าที่พบ]}
+    (รับ [filename, {...}] แบบที่ process_pdfs_with_keyword คืนมาได้ด้วย)
+    """
+    if isinstance(found_keywords, (list, tuple)):
+        found_keywords = next((item for item in found_keywords if isinstance(item, dict)), {})
+    found_keywords = found_keywords or {}
+    statistics_writer.record(ScanStatistic(
+        file_name=file_name,
+        label=label,
+        folders=list(folders or []),
+        accuracy=parse_scores(accuracy),
+        keyword_count=len(found_keywords),
+        keyword_pages={keyword: list(pages) for keyword, pages in found_keywords.items()}
+    ))
+
+
+def read_counters(session: Session) -> Dict[str, int]:
+    return {counter.name: counter.value for counter in session.exec(select(StatisticCounter))}
+
+
+def guess_summary(session: Session) -> dict:
+    """
+    สรุปการกระจายตัวของ first/second/third guess จากตัวนับที่อัปเดตทุกครั้งที่เขียนสถิติ
+    อ่านแค่ตาราง StatisticCounter เวลาที่ใช้จึงไม่ขึ้นกับจำนวนสถิติย้อนหลัง
+    """
+    counters = read_counters(session)
+    score_total = sum(counters.get(f"guess{rank}.score", 0) for rank in range(1, GUESS_RANKS + 1))
+    guesses = []
+    for rank in range(1, GUESS_RANKS + 1):
+        prefix = f"guess{rank}.folder."
+        score = counters.get(f"guess{rank}.score", 0)
+        guesses.append({
+            "rank": rank,
+            "folders": {name[len(prefix):]: value for name, value in counters.items() if name.startswith(prefix)},
+            "score_total": score,
+            "confidence": round(score / score_total * 100, 1) if score_total else 0.0
+        })
+    return {
+        "documents": counters.get("documents", 0),
+        "documents_with_keywords": counters.get("documents_with_keywords", 0),
+        "guesses": guesses
+    }
+
+
+def rebuild_counters(session: Session):
+    """คำนวณตัวนับใหม่ทั้งหมดจากตาราง ScanStatistic (ใช้เมื่อตัวนับเพี้ยนหรือแก้สถิติด้วยมือ)"""
+    counters = Counter()
+    for statistic in session.exec(select(ScanStatistic)):
+        counters.update(statistic_counters(statistic))
+    for counter in session.exec(select(StatisticCounter)):
+        session.delete(counter)
+    session.flush()
+    increment_counters(session, counters)
+    session.commit()
+
+
+def import_legacy_csv(path: str = "database/statistics.csv", batch_size: int = 1000) -> int:
+    """ย้ายสถิติจาก statistics.csv (แบบเก่า) เข้าตาราง คืนจำนวนแถวที่ย้าย"""
+    imported = 0
+    batch = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 5 or row[0].startswith("TOTAL"):
+                continue
+            try:
+                details = ast.literal_eval(row[3]) if row[3] else {}
+            except (SyntaxError, ValueError):
+                details = {}
+            if isinstance(details, (list, tuple)):
+                details = next((item for item in details if isinstance(item, dict)), {})
+            try:
+                created_at = datetime.fromisoformat(row[0]).astimezone(timezone.utc)  # CSV เก่าเก็บเวลาท้องถิ่น
+            except ValueError:
+                created_at = datetime.now(timezone.utc)
+            batch.append(ScanStatistic(
+                created_at=created_at,
+                file_name=row[1],
+                folders=LEGACY_FOLDERS,
+                accuracy=parse_scores(row[4]),
+                keyword_count=len(details),
+                keyword_pages=details
+            ))
+            if len(batch) >= batch_size:
+                write_statistics(batch)
+                imported += len(batch)
+                batch = []
+    if batch:
+        write_statistics(batch)
+        imported += len(batch)
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan statistics maintenance")
+    parser.add_argument("--import-csv", metavar="PATH", help="import a legacy statistics.csv")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the aggregate counters from all rows")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    if args.import_csv:
+        print(f"Imported {import_legacy_csv(args.import_csv)} rows from {args.import_csv}")
+    with Session(engine) as session:
+        if args.rebuild:
+            rebuild_counters(session)
+        print(json.dumps(guess_summary(session), indent=4, ensure_ascii=False))
@@ -0,0 +1,175 @@
+import logging
+import math
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# จำนวน token สูงสุดของข้อความเอกสารที่จะส่งให้ LLM (ไม่นับ prompt คำสั่ง)
+TOKEN_BUDGET = int(os.environ.get("AIDOC_LLM_TOKEN_BUDGET", 2048))
+SEGMENT_CHARS = 400
+
+# แยกข้อความเป็นช่วงตามชนิดตัวอักษร: ไทย / เลขไทย / อังกฤษ / เลขอารบิก (รวมทศนิยม เช่น 4.0, 2.5) / อื่นๆ
+_RUN_PATTERN = re.compile(r'[\u0E01-\u0E4F]+|[\u0E50-\u0E59]+(?:[.,][\u0E50-\u0E59]+)*|[A-Za-z]+'
+                          r'|[0-9]+(?:[.,][0-9]+)*|[^\u0E00-\u0E7FA-Za-z0-9]+')
+_THAI_PATTERN = re.compile(r'[\u0E00-\u0E7F]')
+
+# ขยะจาก OCR เช่น "7pyavw73a๓7๐ayA๓" = ช่วงสั้นๆ หลายช่วงติดกันที่สลับภาษาไปมา และส่วนใหญ่ยาวแค่ 1-2 ตัวอักษร
+# (หรือเลข/ไทย/เลข สลับกันซ้ำๆ) คำจริงสั้นๆ ข้างศัพท์อังกฤษ เช่น "ระบบIoT4.0ใช้AIในการ" ต้องไม่ถูกลบ
+GARBAGE_MIN_RUNS = 6
+GARBAGE_MAX_THAI_RUN = 3
+GARBAGE_MAX_OTHER_RUN = 5
+GARBAGE_FRAGMENT_CHARS = 2
+GARBAGE_FRAGMENT_SHARE = 0.75  # สัดส่วนช่วงตัวอักษร/ตัวเลขที่ยาวไม่เกิน GARBAGE_FRAGMENT_CHARS
+GARBAGE_MIN_ALTERNATIONS = 3   # จำนวนครั้งของ เลข-ไทย-เลข
+_DIGIT_CLASSES = {"digit", "thai_digit"}
+
+
+def _run_class(run: str) -> str:
+    ch = run[0]
+    if '๐' <= ch <= '๙':
+        return "thai_digit"
+    if 'ก' <= ch <= '๏':
+        return "thai"
+    if ch.isascii() and ch.isalpha():
+        return "latin"
+    if ch.isascii() and ch.isdigit():
+        return "digit"
+    return "other"
+
+
+def _is_short(run: str, run_class: str) -> bool:
+    limit = GARBAGE_MAX_THAI_RUN if run_class == "thai" else GARBAGE_MAX_OTHER_RUN
+    return len(run) <= limit
+
+
+def _is_garbage_streak(streak: list) -> bool:
+    if len(streak) < GARBAGE_MIN_RUNS:
+        return False
+    alternations = sum(
+        1 for first, middle, last in zip(streak, streak[1:], streak[2:])
+        if first[1] in _DIGIT_CLASSES and middle[1] == "thai" and len(middle[0]) <= GARBAGE_FRAGMENT_CHARS
+        and last[1] in _DIGIT_CLASSES
+    )
+    if alternations >= GARBAGE_MIN_ALTERNATIONS:
+        return True
+    classes = {run_class for _, run_class in streak}
+    if not ("latin" in classes and classes & {"thai", "thai_digit"}):
+        return False
+    words = [run for run, run_class in streak if run_class != "other"]
+    fragments = sum(1 for run in words if len(run) <= GARBAGE_FRAGMENT_CHARS)
+    return bool(words) and fragments / len(words) >= GARBAGE_FRAGMENT_SHARE
+
+
+def strip_ocr_garbage(text: str) -> str:
+    """Drop runs of short, script-switching fragments that tesseract produces from stamps and noise."""
+    kept = []
+    streak = []
+    removed = 0
+
+    def flush():
+        nonlocal removed
+        if _is_garbage_streak(streak):
+            removed += sum(len(run) for run, _ in streak)
+        else:
+            kept.extend(run for run, _ in streak)
+        streak.clear()
+
+    for match in _RUN_PATTERN.finditer(text):
+        run = match.group()
+        run_class = _run_class(run)
+        if _is_short(run, run_class) and not run.isspace():
+            streak.append((run, run_class))
+        else:
+            flush()
+            kept.append(run)
+    flush()
+
+    if removed:
+        logger.debug(f"Removed {removed} characters of OCR garbage")
+    return "".join(kept)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    ประมาณจำนวน token แบบไม่ต้องเรียก API: ภาษาไทย ~2 ตัวอักษรต่อ token, ภาษาอื่น ~4 ตัวอักษรต่อ token
+    """
+    thai_chars = len(_THAI_PATTERN.findall(text))
+    other_chars = len(text) - thai_chars
+    return math.ceil(thai_chars / 2 + other_chars / 4)
+
+
+def _split_segments(text: str) -> list:
+    """แต่ละบรรทัดคือ 1 หน้า (clean_text ลบช่องว่างทั้งหมดแล้ว) แบ่งเป็นช่วงละ SEGMENT_CHARS ตัวอักษร"""
+    segments = []
+    for page_index, page_text in enumerate(text.split("\n")):
+        for offset in range(0, len(page_text), SEGMENT_CHARS):
+            segments.append({
+                "page": page_index,
+                "position": offset // SEGMENT_CHARS,
+                "text": page_text[offset:offset + SEGMENT_CHARS],
+                "score": 1.0 / (page_index + 1),
+            })
+    return segments
+
+
+def _score_segments(segments: list, keywords: list):
+    lowered_keywords = [kw.lower() for kw in keywords]
+    for index, segment in enumerate(segments):
+        if segment["page"] == 0 and segment["position"] == 0:
+            segment["score"] += 3  # หน้าแรก = ชื่อเรื่อง
+
+        if any(kw in segment["text"].lower() for kw in lowered_keywords):
+            segment["score"] += 5
+            # ส่วนที่ตามหลัง keyword คือเนื้อหาบทคัดย่อ
+            for distance, bonus in enumerate([4, 3, 2], start=1):
+                following = index + distance
+                if following < len(segments) and segments[following]["page"] == segment["page"]:
+                    segments[following]["score"] += bonus
+            # keyword อาจถูกตัดอยู่ท้ายช่วงก่อนหน้า
+            if index > 0 and segments[index - 1]["page"] == segment["page"]:
+                segments[index - 1]["score"] += 1
+
+
+def budget_text(text: str, keywords: list, token_budget: int = None) -> str:
+    """
+    Keep the highest scoring segments that fit into the token budget.
+    ข้อความที่อยู่ในงบอยู่แล้วคืนตามเดิม ขยะจาก OCR ถูกลบเฉพาะตอนที่ต้องตัดให้พองบเท่านั้น
+    """
+    token_budget = token_budget or TOKEN_BUDGET
+    original_tokens = estimate_tokens(text)
+    if original_tokens <= token_budget:
+        return text
+
+    cleaned = "\n".join(strip_ocr_garbage(page) for page in text.split("\n"))
+    if estimate_tokens(cleaned) <= token_budget:
+        logger.debug(f"Text budget: {original_tokens} -> {estimate_tokens(cleaned)} tokens (no trimming needed)")
+        return cleaned
+
+    segments = _split_segments(cleaned)
+    _score_segments(segments, keywords)
+
+    remaining = token_budget
+    selected = set()
+    for index in sorted(range(len(segments)), key=lambda i: (-segments[i]["score"], i)):
+        cost = estimate_tokens(segments[index]["text"])
+        if cost <= remaining:
+            selected.add(index)
+            remaining -= cost
+        elif remaining > 50:
+            # ตัดช่วงสุดท้ายให้พอดีงบที่เหลือ
+            ratio = remaining / cost
+            segments[index]["text"] = segments[index]["text"][:int(len(segments[index]["text"]) * ratio)]
+            selected.add(index)
+            remaining = 0
+        if remaining <= 0:
+            break
+
+    pages = {}
+    for index in sorted(selected):
+        pages.setdefault(segments[index]["page"], []).append(segments[index]["text"])
+    result = "\n".join("".join(parts) for _, parts in sorted(pages.items()))
+
+    logger.debug(f"Text budget: {original_tokens} -> {estimate_tokens(result)} tokens "
+                 f"({len(selected)}/{len(segments)} segments kept, budget {token_budget})")
+    return result
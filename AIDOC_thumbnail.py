@@ -0,0 +1,62 @@
+import functools
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = "database/thumbnails"
+THUMBNAIL_SIZE = (256, 362)  # ประมาณสัดส่วน A4
+THUMBNAIL_MEDIA_TYPES = {".webp": "image/webp", ".jpg": "image/jpeg"}
+
+
+@functools.lru_cache(maxsize=None)
+def thumbnail_format() -> tuple:
+    """(format, extension) — Pillow บางเครื่องไม่ได้ build มาพร้อม libwebp ก็ใช้ JPEG แทน (เช็คตอนใช้ครั้งแรก)"""
+    from PIL import features
+    return ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+
+
+def temp_thumbnail_path(task_id: str) -> str:
+    return f"database/temp/{task_id}/thumbnail{thumbnail_format()[1]}"
+
+
+def create_thumbnail(page_image_path: str, task_id: str):
+    """ย่อหน้าแรกที่ render ไว้แล้วสำหรับ OCR ให้เป็น thumbnail เก็บไว้ใน temp ของ task ก่อน"""
+    from PIL import Image
+
+    try:
+        with Image.open(page_image_path) as im:
+            thumbnail = im.convert("L" if im.mode in ("1", "L") else "RGB")
+            thumbnail.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+            thumbnail.save(temp_thumbnail_path(task_id), thumbnail_format()[0], quality=70)
+    except Exception as e:
+        logger.error(f"Could not create thumbnail for task {task_id}: {e}")
+
+
+def thumbnail_path(content_hash: str, extension: str = None) -> str:
+    """Content-addressed location: database/thumbnails/ab/abcdef....webp"""
+    extension = extension or thumbnail_format()[1]
+    return os.path.join(THUMBNAIL_DIR, content_hash[:2], f"{content_hash}{extension}")
+
+
+def find_thumbnail(content_hash: str) -> Optional[str]:
+    for extension in THUMBNAIL_MEDIA_TYPES:
+        path = thumbnail_path(content_hash, extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def store_thumbnail(task_id: str, content_hash: str) -> Optional[str]:
+    """ย้าย thumbnail จาก temp เข้า cache (ถ้า PDF เนื้อหาเดียวกันเคยมี thumbnail แล้วก็ใช้ของเดิม)"""
+    source = temp_thumbnail_path(task_id)
+    if not os.path.exists(source):
+        return find_thumbnail(content_hash)
+    existing = find_thumbnail(content_hash)
+    if existing:
+        return existing
+    target = thumbnail_path(content_hash)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(source, target)
+    return target
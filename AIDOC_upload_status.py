@@ -1,4 +1,209 @@
 # AIDOC_upload_status.py
-from typing import Dict, Any
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 
-upload_status: Dict[str, Dict[str, Any]] = {}
+logger = logging.getLogger(__name__)
+
+# "memory" = ใช้ได้กับ process เดียว, "sqlite" = ทุก uvicorn worker เห็นสถานะเดียวกัน
+STATUS_BACKEND = os.environ.get("AIDOC_STATUS_BACKEND", "memory").lower()
+STATUS_DB_PATH = os.environ.get("AIDOC_STATUS_DB", "database/task_status.db")
+# ลบงานที่ Completed/Failed แล้วหลังจากนี้ (วินาที)
+STATUS_TTL = int(os.environ.get("AIDOC_STATUS_TTL", 3600))
+# งานที่ค้าง Processing นานเกินนี้ถือว่าตายไปแล้ว (เช่น server ดับกลางคัน)
+STALE_STATUS_TTL = int(os.environ.get("AIDOC_STALE_STATUS_TTL", 24 * 3600))
+STATUS_MAX_ENTRIES = int(os.environ.get("AIDOC_STATUS_MAX_ENTRIES", 10000))
+SWEEP_INTERVAL = 30
+
+TERMINAL_STATUSES = ("Completed", "Failed")
+
+
+def _is_terminal(status: Dict[str, Any]) -> bool:
+    return status.get("status") in TERMINAL_STATUSES
+
+
+class MemoryStatusBackend:
+    """
+    OrderedDict เรียงตามเวลาที่แก้ล่าสุด ลบงานที่หมดอายุ และเมื่อเกินจำนวนที่กำหนดตัดงานที่จบแล้วที่เก่าที่สุดทิ้ง
+    งานที่ยัง Processing ไม่ถูกตัด (ไม่งั้น /uploadStream จะตอบ Unknown Task ID ระหว่างสแกน) หมดอายุตาม stale_ttl เท่านั้น
+    """
+
+    def __init__(self, ttl: int, stale_ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # task_id -> (updated_at, status)
+        self._finished = OrderedDict()  # task_id ของงานที่จบแล้ว เรียงตามเวลาที่แก้ล่าสุด (ลำดับการตัดทิ้ง)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(task_id)
+            return dict(entry[1]) if entry else None
+
+    def set(self, task_id: str, status: Dict[str, Any]):
+        with self._lock:
+            self._store(task_id, dict(status))
+
+    def update(self, task_id: str, changes: Dict[str, Any]):
+        with self._lock:
+            entry = self._entries.get(task_id)
+            status = dict(entry[1]) if entry else {}
+            status.update(changes)
+            self._store(task_id, status)
+
+    def _store(self, task_id: str, status: Dict[str, Any]):
+        self._entries[task_id] = (time.time(), status)
+        self._entries.move_to_end(task_id)
+        if _is_terminal(status):
+            self._finished[task_id] = None
+            self._finished.move_to_end(task_id)
+        else:
+            self._finished.pop(task_id, None)
+        self._evict()
+
+    def items(self):
+        with self._lock:
+            return [(task_id, dict(status)) for task_id, (_, status) in self._entries.items()]
+
+    def _evict(self):
+        now = time.time()
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            self._last_sweep = now
+            expired = [task_id for task_id, (updated_at, status) in self._entries.items()
+                       if now - updated_at > (self.ttl if _is_terminal(status) else self.stale_ttl)]
+            for task_id in expired:
+                del self._entries[task_id]
+                self._finished.pop(task_id, None)
+
+        while len(self._entries) > self.max_entries and self._finished:
+            victim, _ = self._finished.popitem(last=False)
+            del self._entries[victim]
+
+
+class SQLiteStatusBackend:
+    """เก็บสถานะในไฟล์ SQLite แยกจากฐานข้อมูลหลัก (WAL) เพื่อให้ทุก worker อ่าน/เขียนร่วมกันได้"""
+
+    def __init__(self, path: str, ttl: int, stale_ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._last_sweep = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS task_status (
+                task_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                terminal INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_task_status_updated ON task_status (terminal, updated_at)")
+        connection.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA busy_timeout=30000")
+            self._local.connection = connection
+        return connection
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT data FROM task_status WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, connection: sqlite3.Connection, task_id: str, status: Dict[str, Any]):
+        connection.execute(
+            "INSERT OR REPLACE INTO task_status (task_id, data, terminal, updated_at) VALUES (?, ?, ?, ?)",
+            (task_id, json.dumps(status, ensure_ascii=False), int(_is_terminal(status)), time.time())
+        )
+
+    def set(self, task_id: str, status: Dict[str, Any]):
+        connection = self._connection()
+        self._write(connection, task_id, status)
+        self._evict(connection)
+
+    def update(self, task_id: str, changes: Dict[str, Any]):
+        connection = self._connection()
+        # BEGIN IMMEDIATE กันไม่ให้ worker อื่นเขียนทับระหว่างอ่าน-แก้-เขียน
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT data FROM task_status WHERE task_id = ?", (task_id,)).fetchone()
+            status = json.loads(row[0]) if row else {}
+            status.update(changes)
+            self._write(connection, task_id, status)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        self._evict(connection)
+
+    def items(self):
+        rows = self._connection().execute("SELECT task_id, data FROM task_status ORDER BY updated_at").fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    def _evict(self, connection: sqlite3.Connection):
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        connection.execute("DELETE FROM task_status WHERE terminal = 1 AND updated_at < ?", (now - self.ttl,))
+        connection.execute("DELETE FROM task_status WHERE terminal = 0 AND updated_at < ?", (now - self.stale_ttl,))
+        connection.execute("""
+            DELETE FROM task_status WHERE task_id IN (
+                SELECT task_id FROM task_status WHERE terminal = 1 ORDER BY updated_at
+                LIMIT max((SELECT count(*) FROM task_status) - ?, 0)
+            )
+        """, (self.max_entries,))
+
+
+class TaskStatusStore:
+    """
+    ที่เก็บสถานะงานสแกน ใช้แทน dict เดิม:
+        upload_status[task_id] = {...}          ตั้งสถานะใหม่
+        upload_status.update(task_id, {...})    แก้บางฟิลด์
+        upload_status.get(task_id)              อ่าน (ได้สำเนา แก้แล้วไม่มีผล)
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __setitem__(self, task_id: str, status: Dict[str, Any]):
+        self.backend.set(task_id, status)
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.backend.get(task_id) is not None
+
+    def get(self, task_id: str, default=None) -> Optional[Dict[str, Any]]:
+        status = self.backend.get(task_id)
+        return status if status is not None else default
+
+    def update(self, task_id: str, changes: Dict[str, Any]):
+        self.backend.update(task_id, changes)
+
+    def items(self):
+        return self.backend.items()
+
+
+def create_status_store(backend: str = STATUS_BACKEND) -> TaskStatusStore:
+    if backend == "sqlite":
+        return TaskStatusStore(SQLiteStatusBackend(STATUS_DB_PATH, STATUS_TTL, STALE_STATUS_TTL, STATUS_MAX_ENTRIES))
+    if backend != "memory":
+        logger.warning(f"Unknown status backend '{backend}', using memory")
+    return TaskStatusStore(MemoryStatusBackend(STATUS_TTL, STALE_STATUS_TTL, STATUS_MAX_ENTRIES))
+
+
+upload_status: TaskStatusStore = create_status_store()
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# โมดูลที่ API process ไม่ควรโหลดตอนเริ่ม (ให้โหลดตอนสแกน/เรียก AI ครั้งแรกแทน)
+HEAVY_MODULES = [
+    "pytesseract", "tesserocr", "pdf2image", "PIL.Image", "google.generativeai",
+    "pandas", "matplotlib", "seaborn", "sklearn",
+]
+
+
+def measure_import(module: str, cwd: str):
+    """
+    import โมดูลใน interpreter ใหม่ด้วย `python -X importtime`
+    คืน (เวลารวม µs, {package ที่ module import โดยตรง: เวลาสะสม µs}, โมดูลหนักที่ถูกโหลด)
+    """
+    probe = (f"import sys, json, {module}; "
+             f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", probe],
+                               cwd=cwd, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    packages = {}
+    total = 0
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package (ย่อหน้า 2 ช่องต่อระดับ)
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0 and name == module:
+            total = int(cumulative)
+        elif depth == 1:  # import โดยตรงของ module เวลาสะสมรวมลูกทั้งหมดแล้ว
+            top_level = name.split(".")[0]
+            packages[top_level] = packages.get(top_level, 0) + int(cumulative)
+    loaded_heavy = json.loads(completed.stdout.strip().splitlines()[-1])
+    return total, packages, loaded_heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the API with python -X importtime")
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters to average over")
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest packages to list")
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="exit with an error when the median import time is above this")
+    parser.add_argument("--output", default=None, help="save results as JSON")
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    totals = []
+    packages = {}
+    loaded_heavy = []
+    for _ in range(args.runs):
+        total, packages, loaded_heavy = measure_import(args.module, cwd)
+        totals.append(total)
+
+    median_ms = statistics.median(totals) / 1000
+    print(f"\n=== import {args.module} ({args.runs} runs) ===")
+    print(f"median {median_ms:.1f} ms, min {min(totals) / 1000:.1f} ms, max {max(totals) / 1000:.1f} ms")
+    print(f"\n{'package':<30} {'ms':>8}")
+    for name, cumulative in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<30} {cumulative / 1000:>8.1f}")
+    if loaded_heavy:
+        print(f"\nHeavy modules loaded at import: {', '.join(loaded_heavy)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "module": args.module,
+                "median_ms": round(median_ms, 1),
+                "runs_ms": [round(total / 1000, 1) for total in totals],
+                "packages_ms": {name: round(value / 1000, 1) for name, value in packages.items()},
+                "heavy_modules": loaded_heavy
+            }, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+    if args.budget_ms is not None and median_ms > args.budget_ms:
+        print(f"Import time {median_ms:.1f} ms is over the {args.budget_ms} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
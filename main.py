@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import json
 import logging
@@ -6,17 +7,35 @@ import pathlib
 import urllib
 import uuid
 from contextlib import asynccontextmanager
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
 import aiofiles
 import uvicorn
-from fastapi import FastAPI, Depends, UploadFile, BackgroundTasks, HTTPException
-from fastapi.responses import StreamingResponse, FileResponse
-from sqlmodel import Session, select
+from fastapi import FastAPI, Depends, UploadFile, BackgroundTasks, HTTPException, Request, Query
+from fastapi.responses import Response, StreamingResponse
+from sqlmodel import Session, SQLModel, select
 from starlette.middleware.cors import CORSMiddleware
 
-from AIDOC_database import create_db_and_tables, get_session, first_folder_set, update_accuracy
-from AIDOC_files_reciver import launch_scan
+from AIDOC_blob_store import mark_dirty, release, resolve_file_path
+from AIDOC_bulk_files import bulk_delete, bulk_move, roll_forward
+from AIDOC_database import get_session, update_accuracy, delete_page_texts, bump_cache_version
+from AIDOC_file_delivery import file_response
+from AIDOC_files_reciver import requeue_scan, scan_pipeline, submit_scan
+from AIDOC_folder_export import folder_zip_response
+from AIDOC_knn import remove_document
+from AIDOC_near_duplicate import delete_document_index
+from AIDOC_ocr_backend import shutdown as shutdown_ocr_backend
+from AIDOC_ocr_cache import ocr_cache
+from AIDOC_reclassify import reclassify_all
+from AIDOC_recovery import reconciler, worker_lease
+from AIDOC_response_cache import cached_response
+from AIDOC_scheduler import scan_scheduler
+from AIDOC_search import normalize_query, search_index_available, search_pages
+from AIDOC_serving import DRAIN_TIMEOUT, run_startup_tasks, scan_tracker
+from AIDOC_statisReader import guess_report, load_statistics, render_chart
+from AIDOC_statistics import guess_summary, statistics_writer
+from AIDOC_thumbnail import THUMBNAIL_MEDIA_TYPES, find_thumbnail
 from AIDOC_upload_status import upload_status
 from model.AIDOC_fileModel import File
 from model.AIDOC_folderModel import Folder
@@ -34,21 +53,17 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager #แก้ไขฟังชั่นให้ง่ายต่อการจัดการ resource
 async def lifespan(app: FastAPI): #เป็นฟังชั่นที่จะทำงานเมื่อเริ่มต้นทำงาน
-    create_db_and_tables()        #เรียกใช้งาน ฟังชัน สร้างฐานข้อมูล
-
-    session_gen = get_session()
-    session = next(session_gen)  #สร้าง Session สำหรับคำสั่งถัดไป
-
-    try:
-        folders = session.exec(select(Folder)).all() #หาโฟลเดอร์ทั้งหมด
-        if not folders:                              #หากไม่มีโฟลเดอร์ให้ทำขั้นตอนต่อไป
-            first_folder_set(session)                #สร้างโฟลเดอร์ชุดแรก
-    finally:
-        try:
-            next(session_gen)
-        except StopIteration:
-            pass
+    # สร้างฐานข้อมูล/index/โฟลเดอร์ชุดแรก ใต้ file lock เพื่อให้หลาย worker เริ่มพร้อมกันได้
+    await asyncio.to_thread(run_startup_tasks)
+    worker_lease.acquire()     #งานใน temp ของ worker นี้จะไม่ถูกมองว่าค้าง
+    reconciler.start(requeue_scan, roll_forward) #ส่งงานที่ค้างจาก process ที่ตายเข้าคิวใหม่ ทำ journal ที่ค้างต่อ และเก็บกวาด temp/storage เป็นระยะ
     yield                      #หยุดการทำงานฟังชั่นนี้
+    reconciler.stop()
+    scan_tracker.begin_drain() #ไม่รับงานสแกนใหม่ แล้วรองานที่ค้างอยู่ให้เสร็จ
+    await asyncio.to_thread(scan_tracker.wait_idle, DRAIN_TIMEOUT)
+    shutdown_ocr_backend()     #คืน memory ของ OCR worker ที่โหลด model ค้างไว้
+    statistics_writer.close()  #เขียนสถิติที่ยังค้างใน queue ให้หมดก่อนปิด
+    worker_lease.release()     #งานที่ยังค้างใน temp (drain ไม่ทัน) จะถูก worker อื่นส่งเข้าคิวใหม่
 
 
 app = FastAPI(lifespan=lifespan)
@@ -62,15 +77,28 @@ app.add_middleware(
 )
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the AIDOC API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)))
+    args = parser.parse_args()
+
+    # migration และ seed ทำครั้งเดียวใน process หลักก่อนแยก worker (worker จะเห็นว่าทำแล้วและข้ามไป)
+    run_startup_tasks()
+    if args.workers > 1:
+        # สถานะงานต้องแชร์ข้าม worker เพราะ /uploadStream อาจไปตก worker อื่นที่ไม่ได้รันงานนั้น
+        os.environ.setdefault("AIDOC_STATUS_BACKEND", "sqlite")
+
     uvicorn.run(
         "main:app",
-        host="0.0.0.0",
-        port=int(os.environ.get("PORT", 5000))
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=DRAIN_TIMEOUT
     )
 
 
-@app.get("/getFolders")
-def get_folders(session: Session = Depends(get_session)):
+def get_folders(session: Session):
     update_accuracy(session)
     statement = select(Folder)
     folders = session.exec(statement).all()
@@ -78,20 +106,38 @@ def get_folders(session: Session = Depends(get_session)):
     return folder_list
 
 
+@app.get("/getFolders", name="get_folders")
+def get_folders_cached(request: Request, session: Session = Depends(get_session)):
+    # dashboard เรียกบ่อยมาก จึงคำนวณใหม่เฉพาะตอนที่ข้อมูลเปลี่ยน (version ใน DB) และตอบ 304 ได้
+    return cached_response(request, session, "folders", "folders", lambda: get_folders(session))
+
+
 @app.get("/getFiles")
-def get_files(folder_id:str, session: Session = Depends(get_session)):
-    statement = select(File).where(File.folder_id == folder_id)
-    files = session.exec(statement)
-    file_list = list(files)
-    return file_list
+def get_files(folder_id:str, request: Request, session: Session = Depends(get_session)):
+    def build():
+        statement = select(File).where(File.folder_id == folder_id)
+        files = session.exec(statement)
+        file_list = list(files)
+        return file_list
+
+    return cached_response(request, session, "files", f"files-{folder_id}", build)
 
 @app.post("/sendPDF")
 async def send_pdf(
-    background_tasks: BackgroundTasks,
+    request: Request,
     pdfs: List[UploadFile] = File(),
+    priority: Optional[str] = Query(default=None, pattern="^(interactive|bulk)$"),
     session: Session = Depends(get_session)
 ):
+    """
+    รับ PDF แล้วเข้าคิวสแกน อัปโหลดเดี่ยวเป็นงาน interactive ส่วนอัปโหลดหลายไฟล์เป็น bulk (กำหนดเองได้ด้วย priority)
+    งานแบ่งคิวตามผู้อัปโหลด (header X-Uploader หรือ IP) ดูสถานะคิวได้ที่ /scanQueue
+    """
+    if scan_tracker.draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "30"})
     pathlib.Path("database/temp").mkdir(parents=True, exist_ok=True)
+    uploader = request.headers.get("X-Uploader") or (request.client.host if request.client else "anonymous")
+    priority = priority or scan_scheduler.classify_priority(uploader, len(pdfs))
     task_ids = []
     for pdf in pdfs:
         file_name = pdf.filename
@@ -104,42 +150,123 @@ async def send_pdf(
             async with aiofiles.open(f'{path}/{task_id}/{file_name}', 'wb') as temp_file:
                 pdf_content = await pdf.read()
                 await temp_file.write(pdf_content)
-            # Set initial status to "Processing"
-            upload_status[task_id] = {
-                "status": "Processing",
-                "file_name": file_name,
-                "files_remaining": len(pdfs),  # or something you update for each file
-            }
-            background_tasks.add_task(
-                launch_scan,
+            # Set initial status to "Processing" and queue the scan
+            submit_scan(
                 pdf_content,
                 file_name,
                 task_id,
                 folder_list,
-                session
+                uploader=uploader,
+                priority=priority,
+                files_remaining=len(pdfs)  # or something you update for each file
             )
         except Exception as e:
             logger.error(f"Error reading PDF file: {e}")
-            upload_status[task_id] = "Failed"
+            upload_status[task_id] = {"status": "Failed", "file_name": file_name, "error": str(e)}
             raise HTTPException(status_code=400, detail="Failed to read PDF file")
     # Return the list of task IDs so the front end can track them individually.
     return {"status": "success", "task_ids": task_ids, "message": "PDF received and processing in background"}
 
 
+@app.get("/scanQueue")
+def scan_queue():
+    """
+    ความยาวคิวสแกนแยกตาม priority/ผู้อัปโหลด, เวลารอคิว และจำนวนงานในแต่ละ stage ของ worker นี้
+    (stages = ตัวจำกัด OCR/LLM, pipeline = คิวระหว่าง stage LLM และ DB, ocr_cache = ผล OCR รายหน้าที่ใช้ซ้ำ)
+    """
+    return {**scan_scheduler.metrics(), "pipeline": scan_pipeline.metrics(), "ocr_cache": ocr_cache.metrics()}
+
+
+@app.post("/reclassify")
+def reclassify(background_tasks: BackgroundTasks):
+    """
+    จัดหมวดเอกสารทั้งหมดใหม่หลังเปลี่ยนรายชื่อโฟลเดอร์ โดยใช้ข้อความ OCR ที่เก็บไว้
+    ติดตามความคืบหน้าได้ที่ /uploadStream/{task_id}
+    """
+    job_id = str(uuid.uuid4())
+    upload_status[job_id] = {"status": "Processing", "file_name": "", "current_step": "Queued", "progress": 0}
+    background_tasks.add_task(reclassify_all, job_id)
+    return {"status": "success", "task_id": job_id, "message": "Reclassification started in background"}
+
+
 @app.get("/getPDF")
-def get_pdf(folder_name: str, file_name: str, session: Session = Depends(get_session)):
-    file_path = os.path.join("database/storage", folder_name, file_name)
-    if not os.path.exists(file_path):
+def get_pdf(
+    request: Request,
+    folder_name: Optional[str] = None,
+    file_name: Optional[str] = None,
+    file_id: Optional[int] = None,
+    session: Session = Depends(get_session)
+):
+    # file_id ชี้ไฟล์ได้แน่นอน ส่วน folder_name + file_name ใช้ไฟล์ล่าสุดที่ชื่อตรงกัน (รองรับ client เดิม)
+    if file_id is not None:
+        file_obj = session.get(File, file_id)
+        folder_obj = session.get(Folder, file_obj.folder_id) if file_obj else None
+    elif folder_name and file_name:
+        statement = (select(File, Folder).join(Folder, File.folder_id == Folder.id)
+                     .where(Folder.name == folder_name, File.name == file_name)
+                     .order_by(File.id.desc()))
+        row = session.exec(statement).first()
+        file_obj, folder_obj = row if row else (None, None)
+    else:
+        raise HTTPException(status_code=400, detail="file_id or folder_name and file_name are required")
+
+    file_path = None
+    if file_obj and folder_obj:
+        file_path = resolve_file_path(file_obj, folder_obj.name)
+    elif folder_name and file_name:
+        file_path = os.path.join("database/storage", folder_name, file_name)
+    if not file_path or not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
     # Use extended filename encoding (UTF-8) to handle non-ASCII characters (e.g., Thai)
-    disposition = f"inline; filename*=UTF-8''{urllib.parse.quote(file_name)}"
+    download_name = file_obj.name if file_obj else file_name
+    disposition = f"inline; filename*=UTF-8''{urllib.parse.quote(download_name)}"
 
-    return FileResponse(
+    # Supports Range (pdf.js progressive loading), ETag/If-None-Match and Cache-Control
+    return file_response(
+        request,
         file_path,
         media_type="application/pdf",
-        headers={"Content-Disposition": disposition}
+        headers={"Content-Disposition": disposition},
+        etag=f'"{file_obj.content_hash}"' if file_obj and file_obj.content_hash else None
+    )
+
+@app.get("/exportFolder/{folder_id}")
+def export_folder(
+    folder_id: int,
+    request: Request,
+    manifest: Optional[str] = Query(default=None, pattern="^(csv|json)$"),
+    session: Session = Depends(get_session)
+):
+    """
+    ดาวน์โหลดทั้งโฟลเดอร์เป็น ZIP (stored ไม่บีบอัดซ้ำ) ที่สร้างระหว่างส่ง ดาวน์โหลดต่อด้วย Range/If-Range ได้
+    manifest=csv|json เพิ่มไฟล์รายชื่อพร้อมคะแนนความแม่นยำไว้ท้าย ZIP
+    """
+    folder_obj = session.get(Folder, folder_id)
+    if not folder_obj:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    files = session.exec(select(File).where(File.folder_id == folder_id).order_by(File.id)).all()
+    return folder_zip_response(request, folder_obj, files, manifest)
+
+@app.get("/getThumbnail/{file_id}")
+def get_thumbnail(file_id: int, request: Request, session: Session = Depends(get_session)):
+    file_obj = session.get(File, file_id)
+    if not file_obj or not file_obj.content_hash:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    thumbnail = find_thumbnail(file_obj.content_hash)
+    if not thumbnail:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    # thumbnail ถูกเก็บตาม hash ของเนื้อหา PDF เนื้อหาไม่มีวันเปลี่ยน จึง cache ได้นาน
+    return file_response(
+        request,
+        thumbnail,
+        media_type=THUMBNAIL_MEDIA_TYPES[os.path.splitext(thumbnail)[1]],
+        etag=f'"thumb-{file_obj.content_hash}"',
+        cache_control="public, max-age=31536000, immutable"
     )
+
 @app.get("/uploadStream/{task_id}")
 async def upload_stream(task_id: str):
     """
@@ -197,6 +324,20 @@ def delete_file(file_id: str, session: Session = Depends(get_session)):
     if not folder_obj:
         raise HTTPException(status_code=404, detail="Folder not found")
 
+    content_hash = file_obj.content_hash
+    deleted_id = file_obj.id  # หลัง commit อ่าน attribute ของแถวที่ลบไม่ได้แล้ว
+    if content_hash:
+        # object อาจถูกใช้ร่วมกับไฟล์อื่นที่เนื้อหาเหมือนกัน ลบแถวก่อนแล้วค่อยลบ object เมื่อไม่มีใครอ้างถึง
+        delete_page_texts(file_obj.id, session)
+        delete_document_index(file_obj.id, session)
+        session.delete(file_obj)
+        bump_cache_version(session, "folders", "files")
+        mark_dirty(content_hash)  # ถ้าตายก่อน release ตัว reconciler จะลบ object ที่ไม่มีใครอ้างถึงให้
+        session.commit()
+        remove_document(deleted_id)
+        release(content_hash, session)
+        return {"success": True, "message": "File deleted successfully"}
+
     file_path = os.path.join("database/storage", folder_obj.name, file_obj.name)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
@@ -207,7 +348,90 @@ def delete_file(file_id: str, session: Session = Depends(get_session)):
         logger.error(f"Error deleting file: {e}")
         raise HTTPException(status_code=500, detail="Error deleting file")
 
+    delete_page_texts(file_obj.id, session)
+    delete_document_index(file_obj.id, session)
     session.delete(file_obj)
+    bump_cache_version(session, "folders", "files")
     session.commit()
+    remove_document(deleted_id)
+
+    return {"success": True, "message": "File deleted successfully"}
+
+
+class BulkDeleteRequest(SQLModel):
+    file_ids: List[int]
+
+
+class BulkMoveRequest(BulkDeleteRequest):
+    folder_id: int
+
+
+@app.post("/files/bulkDelete")
+def bulk_delete_files(body: BulkDeleteRequest, background_tasks: BackgroundTasks):
+    """
+    ลบไฟล์หลายไฟล์ใน transaction เดียว (ไฟล์บนดิสก์ลบตาม journal หลัง commit)
+    ติดตามความคืบหน้าได้ที่ /uploadStream/{task_id} id ที่ไม่พบจะอยู่ใน "missing" ของสถานะสุดท้าย
+    """
+    if not body.file_ids:
+        raise HTTPException(status_code=400, detail="file_ids is required")
+    job_id = str(uuid.uuid4())
+    upload_status[job_id] = {"status": "Processing", "file_name": "", "current_step": "Queued", "progress": 0}
+    background_tasks.add_task(bulk_delete, job_id, body.file_ids)
+    return {"status": "success", "task_id": job_id, "message": f"Deleting {len(body.file_ids)} files in background"}
+
+
+@app.post("/files/bulkMove")
+def bulk_move_files(body: BulkMoveRequest, background_tasks: BackgroundTasks, session: Session = Depends(get_session)):
+    """ย้ายไฟล์หลายไฟล์ไปโฟลเดอร์ folder_id ใน transaction เดียว ติดตามความคืบหน้าได้ที่ /uploadStream/{task_id}"""
+    if not body.file_ids:
+        raise HTTPException(status_code=400, detail="file_ids is required")
+    if not session.get(Folder, body.folder_id):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    job_id = str(uuid.uuid4())
+    upload_status[job_id] = {"status": "Processing", "file_name": "", "current_step": "Queued", "progress": 0}
+    background_tasks.add_task(bulk_move, job_id, body.file_ids, body.folder_id)
+    return {"status": "success", "task_id": job_id, "message": f"Moving {len(body.file_ids)} files in background"}
 
-    return {"success": True, "message": "File deleted successfully"}
\ No newline at end of file
+
+@app.get("/search")
+def search(
+    q: str,
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=20, ge=1, le=100),
+    session: Session = Depends(get_session)
+):
+    """
+    ค้นหาเอกสารจากข้อความ OCR ที่เก็บไว้ (ไม่ต้อง OCR ใหม่)
+    ผลลัพธ์เรียงตามความเกี่ยวข้อง แบ่งหน้า และมี snippet ที่ไฮไลต์คำค้นด้วย <mark>
+    """
+    if not search_index_available():
+        raise HTTPException(status_code=503, detail="Search index is not available")
+    if not normalize_query(q):
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    return search_pages(session, q, page, page_size)
+
+
+@app.get("/stats")
+def stats(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    format: str = Query(default="json", pattern="^(json|png)$"),
+    session: Session = Depends(get_session)
+):
+    """
+    สถิติ first/second/third guess ของการสแกน
+    ไม่ระบุช่วงเวลา = อ่านจากตัวนับสะสม (เร็วคงที่), ระบุ since/until = คำนวณจากแถวในช่วงนั้น
+    format=png ได้ pie chart แทน JSON
+    """
+    if since or until:
+        report = guess_report(*load_statistics(session, since, until))
+    else:
+        report = guess_summary(session)
+
+    if format == "png":
+        try:
+            chart = render_chart(report)
+        except ImportError:
+            raise HTTPException(status_code=503, detail="Chart rendering is not available")
+        return Response(content=chart, media_type="image/png", headers={"Cache-Control": "no-cache"})
+    return report
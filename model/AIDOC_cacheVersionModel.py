@@ -0,0 +1,6 @@
+from sqlmodel import SQLModel, Field
+
+
+class CacheVersion(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
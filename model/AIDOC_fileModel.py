@@ -12,3 +12,5 @@ class File(SQLModel, table=True):
     size: Optional[int] = Field(default=0)
     tag: Optional[List[str]] = Field(default_factory=list, sa_column=Column(JSON))
     accuracy: Optional[str] = Field(default=0)
+    content_hash: Optional[str] = Field(default=None, index=True)  # sha256 ของไฟล์ PDF
+    duplicate_of: Optional[int] = Field(default=None, foreign_key="file.id")  # ไฟล์เดิมที่เนื้อหาเกือบเหมือนกัน
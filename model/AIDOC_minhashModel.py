@@ -0,0 +1,15 @@
+from typing import Optional
+
+from sqlalchemy import BigInteger, Column
+from sqlmodel import SQLModel, Field
+
+
+class DocumentSignature(SQLModel, table=True):
+    file_id: int = Field(primary_key=True, foreign_key="file.id")
+    signature: bytes = Field(default=b"")  # MinHash uint32 x NUM_PERM
+
+
+class LSHBucket(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    bucket: int = Field(sa_column=Column(BigInteger, index=True, nullable=False))  # hash ของ (band, ค่าใน band)
+    file_id: int = Field(foreign_key="file.id", index=True)
@@ -0,0 +1,10 @@
+from typing import Optional
+
+from sqlmodel import SQLModel, Field
+
+
+class PageText(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    file_id: int = Field(foreign_key="file.id", index=True)
+    page: int = Field(default=1)
+    text: str = Field(default="")
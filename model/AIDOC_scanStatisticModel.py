@@ -0,0 +1,16 @@
+from datetime import datetime, timezone
+from typing import Optional, List, Dict
+
+from sqlalchemy import Column, JSON
+from sqlmodel import SQLModel, Field
+
+
+class ScanStatistic(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+    file_name: str = Field(default="")
+    label: Optional[str] = Field(default=None)
+    folders: Optional[List[str]] = Field(default_factory=list, sa_column=Column(JSON))  # ลำดับโฟลเดอร์ตอนสแกน
+    accuracy: Optional[List[int]] = Field(default_factory=list, sa_column=Column(JSON))  # คะแนนตามลำดับ folders
+    keyword_count: int = Field(default=0)
+    keyword_pages: Optional[Dict[str, List[int]]] = Field(default_factory=dict, sa_column=Column(JSON))
@@ -0,0 +1,6 @@
+from sqlmodel import SQLModel, Field
+
+
+class StatisticCounter(SQLModel, table=True):
+    name: str = Field(primary_key=True)
+    value: int = Field(default=0)
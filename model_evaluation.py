@@ -5,9 +5,6 @@ import glob
 import pathlib
 import shutil
 import uuid
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import confusion_matrix, accuracy_score
 from sqlmodel import Session
 
 from AIDOC_files_reciver import return_result_with_text
@@ -59,6 +56,10 @@ async def evaluate_model(session: Session, tuned_model=None):
     return y_true, y_pred
 
 async def main():
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from sklearn.metrics import confusion_matrix, accuracy_score
+
     tuned_model = load_tuned_model()
     if tuned_model:
         print(f"Loaded tuned model: {tuned_model}")
@@ -0,0 +1,95 @@
+import argparse
+import glob
+import json
+import os
+import pathlib
+import shutil
+import time
+import uuid
+
+from AIDOC_files_reciver import KEYWORDS, ocr_image, pdf2image_converter
+from AIDOC_ocr_profiles import OCR_PROFILES
+
+
+def collect_sample_pdfs(base_folder="TestSet", limit=None):
+    """Return PDFs under TestSet/<label>/*.pdf (same layout as model_evaluation)."""
+    pdf_paths = sorted(glob.glob(os.path.join(base_folder, "**", "*.pdf"), recursive=True))
+    return pdf_paths[:limit] if limit else pdf_paths
+
+
+def run_profile(profile, pdf_paths, page_range):
+    """OCR every sample with one profile; returns totals plus which PDFs contained a keyword."""
+    total_chars = 0
+    total_pages = 0
+    total_seconds = 0.0
+    keyword_hits = set()
+
+    for pdf_path in pdf_paths:
+        task_id = f"benchmark-{uuid.uuid4()}"
+        pathlib.Path(f"database/temp/{task_id}").mkdir(parents=True, exist_ok=True)
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+        try:
+            start = time.perf_counter()
+            images = pdf2image_converter(pdf_bytes, task_id, page_range=page_range, profile=profile)
+            text = "".join(ocr_image(image.filename, profile=profile, use_cache=False) for image in images)
+            total_seconds += time.perf_counter() - start
+            total_pages += len(images)
+            total_chars += len(text)
+            if any(kw.lower() in text.lower() for kw in KEYWORDS):
+                keyword_hits.add(pdf_path)
+        finally:
+            shutil.rmtree(f"database/temp/{task_id}", ignore_errors=True)
+
+    return {
+        "profile": profile.name,
+        "pages": total_pages,
+        "seconds": round(total_seconds, 2),
+        "chars": total_chars,
+        "chars_per_sec": round(total_chars / total_seconds, 1) if total_seconds else 0.0,
+        "pages_per_sec": round(total_pages / total_seconds, 2) if total_seconds else 0.0,
+        "keyword_hits": keyword_hits,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR profiles by speed and keyword recall")
+    parser.add_argument("--samples", default="TestSet", help="folder containing sample PDFs")
+    parser.add_argument("--limit", type=int, default=None, help="only use the first N PDFs")
+    parser.add_argument("--first-page", type=int, default=1)
+    parser.add_argument("--last-page", type=int, default=7)
+    parser.add_argument("--profiles", default=",".join(OCR_PROFILES), help="comma separated profile names")
+    parser.add_argument("--output", default=None, help="optional JSON file for the results")
+    args = parser.parse_args()
+
+    pdf_paths = collect_sample_pdfs(args.samples, args.limit)
+    if not pdf_paths:
+        print(f"No PDF found in {args.samples}")
+        return
+
+    profile_names = [name.strip() for name in args.profiles.split(",") if name.strip()]
+    results = [run_profile(OCR_PROFILES[name], pdf_paths, (args.first_page, args.last_page))
+               for name in profile_names]
+
+    # recall เทียบกับ profile "accurate" (ถ้ารันด้วย) ไม่งั้นเทียบกับจำนวนไฟล์ทั้งหมด
+    reference = next((r for r in results if r["profile"] == "accurate"), None)
+    reference_hits = reference["keyword_hits"] if reference else set(pdf_paths)
+    reference_speed = reference["pages_per_sec"] if reference else None
+
+    print(f"\n=== OCR profile comparison ({len(pdf_paths)} PDFs, pages {args.first_page}-{args.last_page}) ===")
+    print(f"{'profile':<10} {'pages':>6} {'sec':>8} {'chars/sec':>10} {'pages/sec':>10} {'recall':>8} {'speedup':>8}")
+    for result in results:
+        hits = result.pop("keyword_hits")
+        result["keyword_recall"] = round(len(hits & reference_hits) / len(reference_hits), 3) if reference_hits else 0.0
+        result["speedup"] = round(result["pages_per_sec"] / reference_speed, 2) if reference_speed else None
+        print(f"{result['profile']:<10} {result['pages']:>6} {result['seconds']:>8} {result['chars_per_sec']:>10} "
+              f"{result['pages_per_sec']:>10} {result['keyword_recall']:>8} {str(result['speedup']):>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# โมดูลของ backend ใช้ path แบบ relative (database.db, database/...) จึงย้ายไปทำงานในโฟลเดอร์ชั่วคราว
+# ก่อน import อะไรที่อาจเปิดฐานข้อมูล
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="aidoc-tests-"))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from AIDOC_serving import run_startup_tasks
+    run_startup_tasks()
+
+
+@pytest.fixture
+def session():
+    from AIDOC_database import get_session_internal
+    session = get_session_internal()
+    yield session
+    session.close()
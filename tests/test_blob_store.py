@@ -0,0 +1,42 @@
+import os
+import time
+import uuid
+
+from AIDOC_blob_store import object_path, put_file, release
+
+
+def write_pdf(path: str) -> str:
+    with open(path, "wb") as f:
+        f.write(f"%PDF-1.4 {uuid.uuid4()}".encode("utf-8"))
+    return path
+
+
+def test_dedup_refreshes_object_mtime_so_pending_upload_keeps_it(session, tmp_path):
+    source = write_pdf(str(tmp_path / "first.pdf"))
+    content_hash = put_file(source, move=False)
+    target = object_path(content_hash)
+    old = time.time() - 7200  # object เก่า ไม่มีแถวใน File อ้างถึง (reconciler จะลบได้)
+    os.utime(target, (old, old))
+    duplicate = str(tmp_path / "second.pdf")
+    os.link(source, duplicate)
+    assert put_file(duplicate, content_hash) == content_hash  # งานอัปโหลดที่ยังไม่ commit dedup เข้ามา
+    assert time.time() - os.path.getmtime(target) < 60
+    assert release(content_hash, session, grace=3600) is False
+    assert os.path.exists(target)
+
+    os.utime(target, (old, old))
+    assert release(content_hash, session, grace=3600) is True
+    assert not os.path.exists(target)
+
+
+def test_files_from_outside_the_app_are_copied_not_linked(tmp_path):
+    source = write_pdf(str(tmp_path / "archive.pdf"))
+    old = time.time() - 86400
+    os.utime(source, (old, old))
+
+    target = object_path(put_file(source, move=False))
+    assert not os.path.samefile(source, target)
+    assert os.path.getmtime(source) == old  # mtime ของไฟล์ใน archive ไม่เปลี่ยน
+
+    legacy = write_pdf(str(tmp_path / "legacy.pdf"))
+    assert os.path.samefile(legacy, object_path(put_file(legacy, move=False, link=True)))
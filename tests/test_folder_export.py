@@ -0,0 +1,169 @@
+import asyncio
+import io
+import struct
+import uuid
+import zipfile
+import zlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Request
+
+import AIDOC_folder_export
+from AIDOC_blob_store import put_file
+from AIDOC_folder_export import ZIP64_COUNT_LIMIT, ZIP64_LIMIT, FolderArchive, ZipEntry, _end_records, \
+    folder_zip_response
+
+
+def collect(archive: FolderArchive, start: int = 0, end: int = None) -> bytes:
+    async def read():
+        return b"".join([chunk async for chunk in archive.stream(start, end)])
+    return asyncio.run(read())
+
+
+@pytest.fixture
+def folder_files(tmp_path):
+    folder = SimpleNamespace(id=1, name=f"export-{uuid.uuid4().hex[:8]}")
+    files, contents = [], {}
+    for number, name in enumerate(["รายงาน.pdf", "scan.pdf", "scan.pdf"], start=1):
+        data = f"%PDF-1.4 {uuid.uuid4()}\n".encode("utf-8") * (number * 500)
+        source = tmp_path / f"{number}.pdf"
+        source.write_bytes(data)
+        files.append(SimpleNamespace(id=number, name=name, accuracy=0.9, content_hash=put_file(str(source)),
+                                     duplicate_of=None))
+        contents[number] = data
+    return folder, files, contents
+
+
+@pytest.fixture(autouse=True)
+def empty_crc_cache():
+    AIDOC_folder_export._crc_cache.clear()
+    yield
+    AIDOC_folder_export._crc_cache.clear()
+
+
+def test_streamed_zip_uses_data_descriptors_and_reads_back(folder_files):
+    folder, files, contents = folder_files
+    archive = FolderArchive(folder, files, manifest_format="csv")
+    data = collect(archive)
+
+    assert len(data) == archive.size
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None  # CRC ใน descriptor ตรงกับเนื้อไฟล์
+        assert zf.namelist() == ["รายงาน.pdf", "scan.pdf", "scan (2).pdf", "manifest.csv"]
+        for info in zf.infolist():
+            assert info.flag_bits & 0x08
+            assert info.compress_type == zipfile.ZIP_STORED
+        assert zf.read("scan (2).pdf") == contents[3]
+        assert "scan (2).pdf" in zf.read("manifest.csv").decode("utf-8-sig")
+
+    for entry in archive.entries:
+        descriptor_at = entry.offset + len(entry.local_header()) + entry.size
+        assert data[descriptor_at:descriptor_at + 4] == struct.pack("<I", 0x08074B50)
+
+
+def test_range_resume_matches_full_download(folder_files):
+    folder, files, _ = folder_files
+    full = collect(FolderArchive(folder, files))
+
+    # ดาวน์โหลดต่อด้วย request ใหม่ กลางไฟล์ที่สอง: CRC ของไฟล์ที่เริ่มอ่านกลางทางต้องคำนวณแยก
+    AIDOC_folder_export._crc_cache.clear()
+    archive = FolderArchive(folder, files)
+    second = archive.entries[1]
+    resume_at = second.offset + len(second.local_header()) + second.size // 2
+    assert collect(archive, resume_at) == full[resume_at:]
+
+    for split in (1, resume_at, len(full) - 2):
+        head = collect(FolderArchive(folder, files), 0, split - 1)
+        assert head + collect(FolderArchive(folder, files), split) == full
+
+
+def test_missing_files_are_skipped(folder_files):
+    folder, files, contents = folder_files
+    ghost = SimpleNamespace(id=99, name="ghost.pdf", accuracy=0.5, content_hash=None, duplicate_of=None)
+    archive = FolderArchive(folder, files + [ghost])
+    assert archive.missing == [99]
+    with zipfile.ZipFile(io.BytesIO(collect(archive))) as zf:
+        assert len(zf.namelist()) == 3
+
+
+def test_zip64_entry_headers():
+    entry = ZipEntry(b"big.pdf", ZIP64_LIMIT + 10, 0, 0, offset=ZIP64_LIMIT + 5, crc=0x1234)
+
+    header = entry.local_header()
+    version, flags = struct.unpack_from("<HH", header, 4)
+    compressed, uncompressed, name_length, extra_length = struct.unpack_from("<IIHH", header, 18)
+    assert (version, flags) == (45, 0x0808)
+    assert compressed == uncompressed == 0xFFFFFFFF
+    assert struct.unpack_from("<HH", header, 30 + name_length) == (0x0001, 16)
+
+    signature, crc, compressed, uncompressed = struct.unpack("<IIQQ", entry.descriptor())
+    assert (signature, crc) == (0x08074B50, 0x1234)
+    assert compressed == uncompressed == ZIP64_LIMIT + 10
+
+    central = entry.central_header()
+    compressed, uncompressed, name_length, extra_length = struct.unpack_from("<IIHH", central, 20)
+    offset = struct.unpack_from("<I", central, 42)[0]
+    assert compressed == uncompressed == offset == 0xFFFFFFFF
+    extra = central[46 + name_length:46 + name_length + extra_length]
+    assert struct.unpack("<HHQQQ", extra) == (0x0001, 24, ZIP64_LIMIT + 10, ZIP64_LIMIT + 10, ZIP64_LIMIT + 5)
+
+
+def test_small_entry_has_no_zip64_extra():
+    entry = ZipEntry(b"small.pdf", 100, 0, 0, offset=10, crc=1)
+    assert struct.unpack_from("<H", entry.local_header(), 4)[0] == 20
+    assert len(entry.descriptor()) == 16
+    assert struct.unpack_from("<H", entry.central_header(), 30)[0] == 0
+
+
+def test_zip64_end_records_for_many_entries():
+    records = _end_records(ZIP64_COUNT_LIMIT + 1, 1000, 200)
+    assert struct.unpack_from("<I", records, 0)[0] == 0x06064B50
+    count, total, directory_size, directory_offset = struct.unpack_from("<QQQQ", records, 24)
+    assert (count, total, directory_size, directory_offset) == (ZIP64_COUNT_LIMIT + 1, ZIP64_COUNT_LIMIT + 1,
+                                                                200, 1000)
+    assert struct.unpack_from("<IIQI", records, 56) == (0x07064B50, 0, 1200, 1)
+    end = records[76:]
+    assert struct.unpack_from("<IHHHH", end) == (0x06054B50, 0, 0, ZIP64_COUNT_LIMIT, ZIP64_COUNT_LIMIT)
+
+    assert len(_end_records(3, 1000, 200)) == 22
+
+
+def response_body(response) -> bytes:
+    async def read():
+        return b"".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(read())
+
+
+def make_request(**headers) -> Request:
+    return Request({"type": "http", "method": "GET",
+                    "headers": [(key.replace("_", "-").encode(), value.encode()) for key, value in headers.items()]})
+
+
+def test_response_honours_range_and_if_range(folder_files):
+    folder, files, _ = folder_files
+    full = response_body(folder_zip_response(make_request(), folder, files))
+    etag = FolderArchive(folder, files).etag
+
+    response = folder_zip_response(make_request(range="bytes=100-", if_range=etag), folder, files)
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-{len(full) - 1}/{len(full)}"
+    assert response_body(response) == full[100:]
+
+    stale = folder_zip_response(make_request(range="bytes=100-", if_range='"zip-stale"'), folder, files)
+    assert stale.status_code == 200
+    assert response_body(stale) == full
+
+    assert folder_zip_response(make_request(range=f"bytes={len(full)}-"), folder, files).status_code == 416
+    assert folder_zip_response(make_request(if_none_match=etag), folder, files).status_code == 304
+
+
+def test_crc_is_computed_once_per_file(folder_files, monkeypatch):
+    folder, files, _ = folder_files
+    collect(FolderArchive(folder, files))
+    reads = []
+    monkeypatch.setattr(AIDOC_folder_export, "file_crc32", lambda path: reads.append(path) or zlib.crc32(b""))
+    archive = FolderArchive(folder, files)
+    assert all(entry.crc is not None for entry in archive.entries)
+    collect(archive, archive.size - 10)
+    assert reads == []
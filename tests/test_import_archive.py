@@ -0,0 +1,47 @@
+import os
+import pathlib
+import uuid
+
+from sqlmodel import select
+
+from AIDOC_blob_store import hash_file
+from AIDOC_database import add_files
+from AIDOC_import_archive import settle_interrupted
+from AIDOC_recovery import ReconcileReport, TEMP_DIR, reconcile_temp, write_job_manifest
+from model.AIDOC_folderModel import Folder
+
+
+def interrupted_job(tmp_path, name: str) -> tuple:
+    """PDF ใน archive ที่ import-archive ส่งเข้าคิวแล้วตายก่อนเขียนผล (manifest ค้าง เจ้าของตายแล้ว)"""
+    path = str(tmp_path / name)
+    with open(path, "wb") as f:
+        f.write(f"%PDF-1.4 {uuid.uuid4()}".encode("utf-8"))
+    task_id = str(uuid.uuid4())
+    pathlib.Path(TEMP_DIR, task_id).mkdir(parents=True)
+    write_job_manifest(task_id, name, uploader="import-archive", source_path=path, recoverable=False)
+    return path, task_id
+
+
+def test_reconciler_leaves_import_jobs_to_resume(tmp_path):
+    _, task_id = interrupted_job(tmp_path, "thesis.pdf")
+    requeued = []
+    report = ReconcileReport()
+    reconcile_temp(report, requeue=lambda manifest: requeued.append(manifest) or True)
+    assert requeued == [] and task_id not in report.requeued + report.purged_temp
+    assert os.path.isdir(os.path.join(TEMP_DIR, task_id))
+
+
+def test_resume_does_not_resubmit_a_scan_that_was_already_stored(session, tmp_path):
+    path, task_id = interrupted_job(tmp_path, "stored.pdf")
+    folder = session.exec(select(Folder).order_by(Folder.id)).first()
+    file_obj, = add_files([(folder.name, "stored.pdf", "[100]", hash_file(path), None)], session)
+    session.commit()
+
+    assert settle_interrupted(path, {"task_id": task_id}) == {"status": "completed", "file_id": file_obj.id}
+    assert not os.path.exists(os.path.join(TEMP_DIR, task_id))
+
+
+def test_resume_resubmits_a_scan_that_never_reached_the_database(tmp_path):
+    path, task_id = interrupted_job(tmp_path, "pending.pdf")
+    assert settle_interrupted(path, {"task_id": task_id}) is None
+    assert not os.path.exists(os.path.join(TEMP_DIR, task_id))
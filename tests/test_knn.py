@@ -0,0 +1,49 @@
+import os
+
+from AIDOC_knn import VectorIndex, embed
+
+TEXTS = [f"บทคัดย่อ งานวิจัยหมายเลข {number} research topic {number * 37}" for number in range(10)]
+
+
+def keys(neighbors: list) -> dict:
+    return {neighbor.key: neighbor.label for neighbor in neighbors}
+
+
+def test_index_is_compacted_when_dead_rows_pile_up(tmp_path):
+    directory = str(tmp_path / "knn")
+    index = VectorIndex(directory, compact_ratio=0.25, compact_min_rows=4)
+    reader = VectorIndex(directory)  # worker อื่นที่เปิด index ไว้ก่อน compaction
+    for number, text in enumerate(TEXTS):
+        index.add(f"file:{number}", "Agriculture", embed(text))
+    assert len(reader) == 10
+
+    index.remove("file:0", "file:1", "file:2")
+    assert os.path.exists(os.path.join(directory, "rows.jsonl"))  # 3 แถว ยังไม่ถึงขั้นต่ำ
+
+    index.relabel("Fisheries", "file:3")  # แถวเก่าของ file:3 เป็นแถวที่ 4 ที่ไม่ใช้แล้ว
+    assert sorted(os.listdir(directory)) == [".lock", "rows.1.jsonl", "vectors.1.f16"]
+    assert os.path.getsize(os.path.join(directory, "vectors.1.f16")) == 7 * 2048 * 2
+
+    expected = {f"file:{number}": "Fisheries" if number == 3 else "Agriculture" for number in range(3, 10)}
+    for opened in (index, reader, VectorIndex(directory)):
+        assert len(opened) == 7
+        assert keys(opened.search(embed(TEXTS[3]), 10)) == expected
+        assert keys(opened.search(embed(TEXTS[3]), 1, labels=["Fisheries"])) == {"file:3": "Fisheries"}
+
+    # worker ที่ยังอ่านรุ่นเก่าอยู่ต้องเขียนต่อท้ายรุ่นใหม่
+    reader.add("file:10", "Fisheries", embed("เอกสารใหม่หลัง compaction"))
+    assert "file:10" in index
+    assert len(VectorIndex(directory)) == 8
+
+
+def test_compact_keeps_examples_and_drops_stale_rows(tmp_path):
+    index = VectorIndex(str(tmp_path), compact_min_rows=1000)
+    index.add("example:a", "Agriculture", embed(TEXTS[0]), text=TEXTS[0], output="Agriculture, [100]")
+    index.add("file:1", "Agriculture", embed(TEXTS[1]))
+    index.remove("file:1")
+    assert index.compact() == 1
+    assert index.compact() == 0
+
+    neighbors = index.search(embed(TEXTS[0]), 5, examples_only=True)
+    assert [(neighbor.key, neighbor.output) for neighbor in neighbors] == [("example:a", "Agriculture, [100]")]
+    assert "file:1" not in index
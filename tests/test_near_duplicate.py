@@ -0,0 +1,75 @@
+import random
+
+from sqlmodel import select
+
+from AIDOC_database import add_files
+from AIDOC_near_duplicate import MIN_TEXT_LENGTH, NEAR_DUPLICATE_THRESHOLD, add_document_index, \
+    delete_document_index, find_near_duplicate, minhash_signature, signature_text, similarity
+from model.AIDOC_folderModel import Folder
+
+WORDS = ["งานวิจัย", "การพัฒนา", "ระบบ", "ติดตาม", "คุณภาพน้ำ", "บ่อเลี้ยง", "กุ้งขาว", "เซนเซอร์", "ข้อมูล",
+         "วิเคราะห์", "research", "sensor", "water", "quality", "shrimp", "model", "accuracy", "network"]
+
+
+def document(seed: int, words: int = 300) -> list:
+    generator = random.Random(seed)
+    return [generator.choice(WORDS) + str(generator.randint(0, 99)) for _ in range(words)]
+
+
+def revised(words: list, every: int = 40) -> list:
+    """ฉบับแก้: เปลี่ยนคำทุก ๆ `every` คำ (เช่นแก้คำผิด / เลขหน้า)"""
+    return [f"แก้ไข{index}" if index % every == 0 else word for index, word in enumerate(words)]
+
+
+def pages(words: list) -> dict:
+    third = len(words) // 3
+    return {1: " ".join(words[:third]), 2: " ".join(words[third:2 * third]), 3: " ".join(words[2 * third:])}
+
+
+def add_file(session, page_texts: dict = None, duplicate_of: int = None) -> int:
+    folder = session.exec(select(Folder).order_by(Folder.id)).first()
+    file_obj = add_files([(folder.name, "paper.pdf", "[100]", None, duplicate_of)], session)[0]
+    if page_texts is not None:
+        assert add_document_index(file_obj.id, page_texts, session)
+    session.commit()
+    return file_obj.id
+
+
+def test_revision_is_above_threshold_and_unrelated_is_below():
+    original = document(1)
+    signature = minhash_signature(signature_text(pages(original)))
+    assert similarity(signature, minhash_signature(signature_text(pages(revised(original))))) \
+        >= NEAR_DUPLICATE_THRESHOLD
+    assert similarity(signature, minhash_signature(signature_text(pages(revised(original, every=4))))) \
+        < NEAR_DUPLICATE_THRESHOLD
+    assert similarity(signature, minhash_signature(signature_text(pages(document(2))))) < 0.3
+
+
+def test_short_text_has_no_signature(session):
+    short = {1: "ก" * (MIN_TEXT_LENGTH - 1)}
+    assert minhash_signature(signature_text(short)) is None
+    assert find_near_duplicate(short, session) is None
+    assert add_document_index(1, short, session) is False
+
+
+def test_find_near_duplicate_points_to_the_original(session):
+    original = document(3)
+    original_id = add_file(session, pages(original))
+
+    match = find_near_duplicate(pages(revised(original)), session)
+    assert match is not None and match.file_id == original_id
+    assert match.similarity >= NEAR_DUPLICATE_THRESHOLD
+    assert find_near_duplicate(pages(document(4)), session) is None
+
+
+def test_match_on_a_revision_points_to_its_original(session):
+    original = document(5)
+    original_id = add_file(session)  # ต้นฉบับไม่มี signature (ข้อความสั้น / OCR ไม่ออก)
+    revision_id = add_file(session, pages(revised(original)), duplicate_of=original_id)
+
+    # ฉบับแก้ครั้งที่สองต้องชี้ต้นฉบับ ไม่ให้เป็นสายยาว ๆ
+    assert find_near_duplicate(pages(revised(original, every=50)), session).file_id == original_id
+
+    delete_document_index(original_id, session)
+    session.commit()
+    assert find_near_duplicate(pages(revised(original, every=50)), session).file_id == revision_id
@@ -0,0 +1,82 @@
+import types
+
+import AIDOC_ocr_backend
+
+
+class FlakyPool:
+    def __init__(self, results: list):
+        self.results = results
+
+    def image_to_string(self, image) -> str:
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def use_pool(monkeypatch, pool):
+    monkeypatch.setattr(AIDOC_ocr_backend, "_pool", pool)
+    monkeypatch.setattr(AIDOC_ocr_backend, "_pool_failed", False)
+    monkeypatch.setattr(AIDOC_ocr_backend, "_consecutive_failures", 0)
+    fallback = types.SimpleNamespace(image_to_string=lambda image, lang, config: "pytesseract")
+    monkeypatch.setattr(AIDOC_ocr_backend, "_pytesseract", lambda: fallback)
+
+
+def test_single_worker_failure_falls_back_for_that_page_only(monkeypatch):
+    use_pool(monkeypatch, FlakyPool([RuntimeError("bad page"), "tesserocr"]))
+    assert AIDOC_ocr_backend.image_to_string(None) == "pytesseract"
+    assert AIDOC_ocr_backend.image_to_string(None) == "tesserocr"
+    assert AIDOC_ocr_backend._pool_failed is False
+
+
+def test_pool_disabled_after_repeated_failures(monkeypatch):
+    failures = AIDOC_ocr_backend.POOL_MAX_FAILURES
+    use_pool(monkeypatch, FlakyPool([RuntimeError("broken")] * failures + ["tesserocr"]))
+    assert [AIDOC_ocr_backend.image_to_string(None) for _ in range(failures + 1)] == ["pytesseract"] * (failures + 1)
+    assert AIDOC_ocr_backend._pool_failed is True
+
+
+def test_pool_disabled_when_worker_cannot_start(monkeypatch):
+    use_pool(monkeypatch, FlakyPool([AIDOC_ocr_backend.WorkerInitError("no tha.traineddata"), "tesserocr"]))
+    assert AIDOC_ocr_backend.image_to_string(None) == "pytesseract"
+    assert AIDOC_ocr_backend._pool_failed is True
+
+
+class FakeApi:
+    def __init__(self, fail: bool):
+        self.fail = fail
+
+    def SetImage(self, image):
+        if self.fail:
+            raise RuntimeError("worker crashed")
+
+    def GetUTF8Text(self):
+        return "tesserocr"
+
+    def Clear(self):
+        pass
+
+    def End(self):
+        pass
+
+
+def test_waiter_gets_a_replacement_when_the_busy_worker_fails():
+    import threading
+
+    pool = AIDOC_ocr_backend.TesseractWorkerPool(1)
+    apis = [FakeApi(fail=True), FakeApi(fail=False)]
+    pool._new_worker = lambda: apis.pop(0)
+    failing = pool._acquire()  # worker เดียวของ pool ถูกยืมอยู่
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(pool.image_to_string(None)))
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()  # pool เต็ม ต้องรอ
+
+    try:
+        failing.SetImage(None)
+    except RuntimeError:
+        pool._discard(failing)
+    waiter.join(2)
+    assert not waiter.is_alive() and results == ["tesserocr"]
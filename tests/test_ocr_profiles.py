@@ -0,0 +1,25 @@
+from PIL import Image, ImageDraw
+
+from AIDOC_ocr_profiles import OCR_PROFILES, get_ocr_profile, preprocess_image
+
+
+def scanned_page() -> Image.Image:
+    page = Image.new("RGB", (1200, 1600), (250, 248, 240))
+    ImageDraw.Draw(page).text((300, 400), "Abstract", fill=(20, 20, 20))
+    return page
+
+
+def test_default_profile_reproduces_previous_preprocessing():
+    profile = get_ocr_profile()
+    assert profile == OCR_PROFILES["legacy"]
+    assert (profile.dpi, profile.grayscale) == (200, False)  # ค่าเริ่มต้นของ convert_from_bytes
+    page = scanned_page()
+    assert preprocess_image(page, profile).tobytes() == page.convert("L").tobytes()
+
+
+def test_balanced_profile_is_opt_in():
+    page = scanned_page()
+    processed = preprocess_image(page, get_ocr_profile("balanced"))
+    assert processed.size != page.size  # crop ขอบ
+    histogram = processed.histogram()
+    assert sum(histogram[1:255]) == 0  # threshold แล้ว เหลือแค่ขาวกับดำ
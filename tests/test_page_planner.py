@@ -0,0 +1,37 @@
+from AIDOC_page_planner import FALLBACK_PAGE_RANGE, MAX_OCR_PAGES, build_plan, contiguous_ranges
+
+
+def test_unknown_page_count_uses_the_old_fixed_window():
+    plan = build_plan(None, [])
+    assert plan.initial == [1, 2, 3]
+    assert plan.extensions == [list(range(4, FALLBACK_PAGE_RANGE[1] + 1))]
+
+
+def test_short_documents_are_read_in_full():
+    plan = build_plan(2, [("Abstract", 2)])
+    assert plan.initial == [1, 2] and plan.extensions == []
+
+
+def test_outline_abstract_page_is_read_first():
+    plan = build_plan(30, [("บทคัดย่อ", 5), ("บทที่ 1 บทนำ", 9)])
+    assert plan.outline_pages == [5]
+    assert plan.initial == [1, 5, 6]
+    assert all(page not in plan.initial for extension in plan.extensions for page in extension)
+    assert max(page for extension in plan.extensions for page in extension) == FALLBACK_PAGE_RANGE[1]
+
+
+def test_long_theses_extend_further_in_chunks_of_four():
+    plan = build_plan(120, [])
+    assert plan.initial == [1, 2, 3]
+    assert plan.extensions[0] == [4, 5, 6, 7]
+    assert all(len(extension) <= 4 for extension in plan.extensions)
+    assert max(page for extension in plan.extensions for page in extension) == MAX_OCR_PAGES
+
+
+def test_outline_entries_outside_the_document_are_ignored():
+    plan = build_plan(10, [("Abstract", 0), ("Summary", 99)])
+    assert plan.outline_pages == [] and plan.initial == [1, 2, 3]
+
+
+def test_contiguous_ranges_merge_runs_for_one_render_call():
+    assert contiguous_ranges([7, 1, 2, 3, 6, 2]) == [(1, 3), (6, 7)]
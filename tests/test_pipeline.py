@@ -0,0 +1,66 @@
+import threading
+import time
+import types
+
+from AIDOC_pipeline import ScanPipeline
+
+
+def make_work(task_id: str, priority: str = "bulk"):
+    return types.SimpleNamespace(task_id=task_id, priority=priority)
+
+
+class Recorder:
+    def __init__(self, bad: set = ()):
+        self.bad = set(bad)
+        self.batches = []
+        self.failed = []
+        self.lock = threading.Lock()
+
+    async def classify(self, work):
+        pass
+
+    def store(self, works: list):
+        if self.bad & {work.task_id for work in works}:
+            raise RuntimeError("constraint failed")
+        with self.lock:
+            self.batches.append([work.task_id for work in works])
+
+    def fail(self, work, error):
+        with self.lock:
+            self.failed.append(work.task_id)
+
+
+def test_db_stage_groups_queued_works_up_to_the_batch_size():
+    recorder = Recorder()
+    pipeline = ScanPipeline(recorder.classify, recorder.store, recorder.fail, db_batch_size=3, db_flush_delay=5)
+    for number in range(5):
+        pipeline._db_queue.put((time.monotonic(), make_work(f"t{number}")))
+
+    # LLM stage ว่าง ไม่ต้องรอจนหมดเวลา: ได้ batch เต็มแล้วได้ส่วนที่เหลือทันที
+    started = time.monotonic()
+    first = [work.task_id for _, work in pipeline._next_batch()]
+    second = [work.task_id for _, work in pipeline._next_batch()]
+    assert first == ["t0", "t1", "t2"] and second == ["t3", "t4"]
+    assert time.monotonic() - started < 1
+
+
+def test_failed_batch_is_retried_one_work_at_a_time():
+    recorder = Recorder(bad={"t1"})
+    pipeline = ScanPipeline(recorder.classify, recorder.store, recorder.fail)
+    pipeline._store([make_work("t0"), make_work("t1"), make_work("t2")])
+
+    assert recorder.batches == [["t0"], ["t2"]]
+    assert recorder.failed == ["t1"]
+
+
+def test_submitted_works_reach_the_db_stage_in_batches():
+    recorder = Recorder()
+    pipeline = ScanPipeline(recorder.classify, recorder.store, recorder.fail, db_batch_size=10, db_flush_delay=0.5)
+    for number in range(6):
+        pipeline.submit(make_work(f"t{number}"))
+
+    deadline = time.monotonic() + 5
+    while sum(len(batch) for batch in recorder.batches) < 6 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(task_id for batch in recorder.batches for task_id in batch) == [f"t{n}" for n in range(6)]
+    assert recorder.failed == []
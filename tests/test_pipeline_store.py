@@ -0,0 +1,46 @@
+import os
+import uuid
+
+from sqlmodel import func, select
+
+import AIDOC_files_reciver
+from AIDOC_files_reciver import ExtractedDocument, ScanWork, classify_scan, fail_scan, store_scans
+from AIDOC_pipeline import ScanPipeline
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+from model.AIDOC_pageTextModel import PageText
+
+
+def make_work(folder_name: str) -> ScanWork:
+    task_id = str(uuid.uuid4())
+    filename = f"scan-{task_id[:8]}.pdf"
+    source_path = os.path.abspath(f"database/temp/{task_id}-{filename}")
+    os.makedirs(os.path.dirname(source_path), exist_ok=True)
+    with open(source_path, "wb") as f:
+        f.write(f"%PDF-1.4 {task_id}".encode("utf-8"))
+    text = f"เอกสารทดสอบ {task_id}"
+    document = ExtractedDocument(text, [filename, {}], {1: text})
+    return ScanWork(task_id, filename, [folder_name], None, document, "bulk",
+                    label=folder_name, accuracy=[100], source_path=source_path)
+
+
+def test_status_error_after_commit_does_not_store_batch_twice(session, monkeypatch):
+    folder_name = session.exec(select(Folder).order_by(Folder.id)).first().name
+    works = [make_work(folder_name), make_work(folder_name)]
+
+    update = AIDOC_files_reciver.upload_status.update
+
+    def failing_update(task_id, values):
+        if values.get("status") == "Completed":
+            raise OSError("status store unavailable")
+        update(task_id, values)
+
+    monkeypatch.setattr(AIDOC_files_reciver.upload_status, "update", failing_update)
+    ScanPipeline(classify_scan, store_scans, fail_scan)._store(works)
+
+    names = [work.filename for work in works]
+    files = session.exec(select(File).where(File.name.in_(names))).all()
+    assert sorted(file_obj.name for file_obj in files) == sorted(names)
+    page_rows = session.exec(select(func.count()).select_from(PageText)
+                             .where(PageText.file_id.in_([file_obj.id for file_obj in files]))).one()
+    assert page_rows == len(works)
@@ -0,0 +1,52 @@
+import uuid
+
+from sqlmodel import select
+
+import AIDOC_files_reciver
+from AIDOC_database import add_files, add_page_texts
+from AIDOC_knn import embed, index_labeled_document, knn_index
+from AIDOC_reclassify import reclassify_all
+from AIDOC_upload_status import upload_status
+from model.AIDOC_fileModel import File
+from model.AIDOC_folderModel import Folder
+
+
+def add_indexed_documents(session, folder: Folder, texts: list) -> list:
+    """เพิ่มไฟล์ที่มีข้อความ OCR และอยู่ใน k-NN index แล้ว (เหมือนไฟล์ที่สแกนเสร็จ)"""
+    files = add_files([(folder.name, f"doc-{number}.pdf", "[100]", None, None) for number in range(len(texts))],
+                      session)
+    for file_obj, text in zip(files, texts):
+        add_page_texts(file_obj.id, {1: text}, session)
+    session.commit()
+    for file_obj, text in zip(files, texts):
+        index_labeled_document(file_obj.id, folder.name, AIDOC_files_reciver.text_from_pages({1: text}))
+    return [file_obj.id for file_obj in files]
+
+
+def test_reclassify_moves_indexed_documents_into_new_folder(session, monkeypatch):
+    old_folder = session.exec(select(Folder).order_by(Folder.id)).first()
+    # เอกสารคล้ายกันหลายไฟล์: k-NN มีเพื่อนบ้านพอจะ "มั่นใจ" ว่าอยู่โฟลเดอร์เดิม
+    file_ids = add_indexed_documents(session, old_folder, [
+        f"บทคัดย่อ งานวิจัยเรื่องการเพาะเลี้ยงกุ้งขาวในบ่อดิน abstract shrimp farming pond {number}"
+        for number in range(4)
+    ])
+
+    new_folder = Folder(name=f"Aquaculture-{uuid.uuid4().hex[:6]}")
+    session.add(new_folder)
+    session.commit()
+    new_folder_name, new_folder_id = new_folder.name, new_folder.id
+
+    def fake_llm(text, folder_list, examples=None):
+        return f"{new_folder_name}, {[100 if name == new_folder_name else 0 for name in folder_list]}"
+
+    monkeypatch.setattr(AIDOC_files_reciver, "generate_response", fake_llm)
+    job_id = str(uuid.uuid4())
+    reclassify_all(job_id)
+
+    assert upload_status.get(job_id)["status"] == "Completed"
+    session.expire_all()
+    assert [session.get(File, file_id).folder_id for file_id in file_ids] == [new_folder_id] * len(file_ids)
+    # label ใน k-NN index ต้องตามโฟลเดอร์ใหม่ ไม่งั้นยังโหวตให้โฟลเดอร์เดิมในการจัดหมวดครั้งต่อไป
+    neighbors = knn_index.search(embed("งานวิจัยเรื่องการเพาะเลี้ยงกุ้งขาว shrimp farming pond"), len(file_ids))
+    assert {neighbor.key: neighbor.label for neighbor in neighbors} == \
+        {f"file:{file_id}": new_folder_name for file_id in file_ids}
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+from AIDOC_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, ScanScheduler, StageLimiter
+
+
+def test_async_and_thread_callers_share_one_stage_limit():
+    stage = StageLimiter("llm", 2)
+    peak = 0
+    lock = threading.Lock()
+
+    def enter():
+        nonlocal peak
+        with lock:
+            peak = max(peak, stage.metrics()["active"])
+
+    def thread_call():
+        with stage.slot(PRIORITY_BULK):
+            enter()
+            time.sleep(0.05)
+
+    async def async_call():
+        async with stage.async_slot(PRIORITY_BULK):
+            enter()
+            await asyncio.sleep(0.05)
+
+    async def run():
+        threads = [threading.Thread(target=thread_call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        await asyncio.gather(*(async_call() for _ in range(3)))
+        for thread in threads:
+            await asyncio.to_thread(thread.join)
+
+    asyncio.run(run())
+    assert peak == 2
+    assert stage.metrics()["active"] == 0
+    assert stage.metrics()["wait"][PRIORITY_BULK]["count"] == 6
+
+
+def test_async_interactive_waiter_enters_before_bulk():
+    stage = StageLimiter("llm", 1)
+    order = []
+
+    async def call(priority: str, name: str, delay: float):
+        await asyncio.sleep(delay)
+        async with stage.async_slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.02)
+
+    async def run():
+        await asyncio.gather(call(PRIORITY_BULK, "bulk-1", 0), call(PRIORITY_BULK, "bulk-2", 0.005),
+                             call(PRIORITY_INTERACTIVE, "interactive", 0.01))
+
+    asyncio.run(run())
+    assert order == ["bulk-1", "interactive", "bulk-2"]
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_uploaders_take_turns_within_a_priority():
+    scheduler = ScanScheduler(workers=1, interactive_reserved=0)
+    gate = threading.Event()
+    order = []
+    scheduler.submit("gate", gate.wait, uploader="gate")  # worker เดียวถูกกันไว้ระหว่างเข้าคิว
+    for name in ["a1", "a2", "a3", "a4"]:
+        scheduler.submit(name, order.append, name, uploader="alice")
+    for name in ["b1", "b2"]:
+        scheduler.submit(name, order.append, name, uploader="bob")
+    gate.set()
+
+    assert wait_until(lambda: len(order) == 6)
+    assert order == ["a1", "b1", "a2", "b2", "a3", "a4"]
+
+
+def test_bulk_jobs_leave_a_worker_for_interactive_uploads():
+    scheduler = ScanScheduler(workers=2, interactive_reserved=1)
+    release = threading.Event()
+    started = []
+
+    def job(name):
+        started.append(name)
+        if name.startswith("bulk"):
+            release.wait()
+
+    for number in range(3):
+        scheduler.submit(f"bulk-{number}", job, f"bulk-{number}", uploader="archive", priority=PRIORITY_BULK)
+    assert wait_until(lambda: started == ["bulk-0"])
+    time.sleep(0.05)
+    assert started == ["bulk-0"]  # worker ที่สองถูกกันไว้ให้งาน interactive
+
+    scheduler.submit("single", job, "single", uploader="someone", priority=PRIORITY_INTERACTIVE)
+    assert wait_until(lambda: "single" in started)
+    assert started[:2] == ["bulk-0", "single"]
+
+    release.set()
+    assert wait_until(lambda: len(started) == 4)
+    assert wait_until(lambda: scheduler.metrics()["running"] == {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 0})
+
+
+def test_configure_grows_the_worker_pool_and_bulk_limit():
+    scheduler = ScanScheduler(workers=1, interactive_reserved=1)
+    release = threading.Event()
+    started = []
+
+    def job(name):
+        started.append(name)
+        release.wait()
+
+    scheduler.submit("first", job, "first", uploader="archive")
+    assert wait_until(lambda: started == ["first"])
+    scheduler.configure(3, interactive_reserved=0)
+    for name in ["second", "third"]:
+        scheduler.submit(name, job, name, uploader="archive")
+    assert wait_until(lambda: len(started) == 3)
+    release.set()
@@ -0,0 +1,34 @@
+from AIDOC_text_budget import budget_text, estimate_tokens, strip_ocr_garbage
+
+# ข้อความหลัง clean_text (ไม่มีช่องว่าง) จากบทคัดย่อจริง
+THAI_IOT_ABSTRACT = ("บทคัดย่องานวิจัยนี้มีวัตถุประสงค์เพื่อพัฒนาระบบIoT4.0ใช้AIในการตรวจวัดค่าPM2.5และCO2"
+                     "ในอาคารเรียนโดยใช้ESP32ส่งข้อมูลผ่านMQTTไปยังเซิร์ฟเวอร์ทุก5นาที")
+ENGLISH_ABSTRACT = ("Abstract:Thisresearchpresentsalow-costIoTmonitoringsystembasedonESP32andLoRaWAN"
+                    "formeasuringPM2.5,temperatureandhumidityin3classroomsover12weeks.")
+STAMP_GARBAGE = "7pyavw73a๓7๐ayA๓"
+
+
+def test_real_abstracts_are_not_treated_as_garbage():
+    assert strip_ocr_garbage("ระบบIoT4.0ใช้AIในการ") == "ระบบIoT4.0ใช้AIในการ"
+    assert strip_ocr_garbage("พัฒนาระบบIoT4.0ใช้AIในPM2.5") == "พัฒนาระบบIoT4.0ใช้AIในPM2.5"
+    assert strip_ocr_garbage(THAI_IOT_ABSTRACT) == THAI_IOT_ABSTRACT
+    assert strip_ocr_garbage(ENGLISH_ABSTRACT) == ENGLISH_ABSTRACT
+
+
+def test_stamp_noise_is_removed_between_real_words():
+    assert strip_ocr_garbage(f"บทคัดย่อ{STAMP_GARBAGE}งานวิจัย") == "บทคัดย่องานวิจัย"
+    assert strip_ocr_garbage("หน้า1ก2ข3ค4ง5") == "หน้า"
+
+
+def test_text_under_budget_is_returned_unchanged():
+    text = f"{THAI_IOT_ABSTRACT}{STAMP_GARBAGE}\n{ENGLISH_ABSTRACT}"
+    assert budget_text(text, ["บทคัดย่อ", "abstract"], token_budget=estimate_tokens(text)) == text
+
+
+def test_over_budget_text_keeps_abstract_and_drops_garbage():
+    filler = "สารบัญ" * 400
+    text = f"ชื่อเรื่องระบบตรวจวัดคุณภาพอากาศ\n{filler}\n{THAI_IOT_ABSTRACT}{STAMP_GARBAGE}"
+    result = budget_text(text, ["บทคัดย่อ"], token_budget=300)
+    assert estimate_tokens(result) <= 300
+    assert "พัฒนาระบบIoT4.0ใช้AIในการตรวจวัดค่าPM2.5" in result
+    assert STAMP_GARBAGE not in result
@@ -0,0 +1,61 @@
+import types
+
+import pytest
+
+import AIDOC_upload_status
+from AIDOC_upload_status import MemoryStatusBackend, SQLiteStatusBackend, TaskStatusStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(AIDOC_upload_status, "time", types.SimpleNamespace(time=lambda: clock.now))
+    monkeypatch.setattr(AIDOC_upload_status, "SWEEP_INTERVAL", 0)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(ttl=60, stale_ttl=600, max_entries=100):
+        if request.param == "sqlite":
+            return TaskStatusStore(SQLiteStatusBackend(str(tmp_path / "status.db"), ttl, stale_ttl, max_entries))
+        return TaskStatusStore(MemoryStatusBackend(ttl, stale_ttl, max_entries))
+    return make
+
+
+def test_finished_tasks_expire_after_ttl_and_stuck_ones_after_stale_ttl(make_store, clock):
+    store = make_store(ttl=60, stale_ttl=600)
+    store["done"] = {"status": "Completed"}
+    store["running"] = {"status": "Processing"}
+
+    clock.now += 61
+    store["other"] = {"status": "Processing"}  # เขียนแล้วจึง sweep
+    assert "done" not in store and "running" in store
+
+    clock.now += 600
+    store["other"] = {"status": "Processing"}
+    assert "running" not in store and "other" in store
+
+
+def test_eviction_over_capacity_never_drops_running_tasks(make_store, clock):
+    store = make_store(max_entries=3)
+    store["old-running"] = {"status": "Processing"}
+    for number in range(3):
+        clock.now += 1
+        store[f"done-{number}"] = {"status": "Completed"}
+    clock.now += 1
+    store.update("old-running", {"progress": 50})
+    for number in range(3):
+        clock.now += 1
+        store[f"new-running-{number}"] = {"status": "Processing"}
+
+    assert store.get("old-running") == {"status": "Processing", "progress": 50}
+    assert all(f"new-running-{number}" in store for number in range(3))
+    assert not any(f"done-{number}" in store for number in range(3))
+
+
+def test_update_keeps_fields_set_at_submit(make_store, clock):
+    store = make_store()
+    store["task"] = {"status": "Processing", "priority": "bulk", "files_remaining": 4, "recovered": True}
+    store.update("task", {"status": "Processing", "current_step": "Starting scan", "progress": 0})
+    assert store.get("task")["files_remaining"] == 4 and store.get("task")["recovered"] is True